@@ -1,37 +1,162 @@
 from django.contrib import admin
-from django.contrib.admin.sites import AlreadyRegistered
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
 # Register your models here.
+from backend.api.models.archive import (
+    ArchivedFieldTripRegistration, ArchivedTransaction, ArchivedTransactionLineItem
+)
 from backend.api.models.field_trip import FieldTrip, FieldTripRegistration
+from backend.api.models.parent import Parent
 from backend.api.models.student import Student
 from backend.api.models.school import School
 from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
 
-try:
-    admin.site.register(FieldTrip)
-except AlreadyRegistered:
-    pass
-try:
-    admin.site.register(FieldTripRegistration)
-except AlreadyRegistered:
-    pass
-
-try:
-    admin.site.register(Student)
-except AlreadyRegistered:
-    pass
-
-try:
-    admin.site.register(Student)
-except AlreadyRegistered:
-    pass
-
-try:
-    admin.site.register(School)
-except AlreadyRegistered:
-    pass
-
-try:
-    admin.site.register(Transaction)
-except AlreadyRegistered:
-    pass
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate instead of COUNT(*) for unfiltered changelists of large tables
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self._estimated_count()
+        if estimate is not None and estimate > self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, "query") or queryset.query.where:
+            return None
+
+        table = queryset.model._meta.db_table
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql":
+            sql, params = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]
+        elif connection.vendor == "sqlite":
+            # Filled in by ANALYZE; the first number of each stat is the table's row count
+            sql, params = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]
+        else:
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        except DatabaseError:
+            return None
+        return int(str(row[0]).split()[0]) if row else None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables with hundreds of thousands of rows.
+
+    `indexed_search_fields` are searched by prefix with index range scans (`>= term AND < term + U+FFFF`),
+    trying the term as typed and capitalized, instead of the case-insensitive LIKE scans of `search_fields`.
+    """
+    indexed_search_fields = ()
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_search_fields(self, request):
+        return self.indexed_search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        query = Q()
+        for term in {search_term, search_term.capitalize()}:
+            for field in self.indexed_search_fields:
+                query |= Q(**{field + "__gte": term, field + "__lt": term + "\uffff"})
+        return queryset.filter(query), False
+
+
+@admin.register(School)
+class SchoolAdmin(admin.ModelAdmin):
+    list_display = ('name', 'id')
+    search_fields = ('name',)
+    ordering = ('name',)
+
+
+@admin.register(FieldTrip)
+class FieldTripAdmin(admin.ModelAdmin):
+    list_display = ('location', 'date', 'cost')
+    search_fields = ('location',)
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+
+
+@admin.register(Parent)
+class ParentAdmin(LargeTableAdmin):
+    list_display = ('last_name', 'first_name', 'email')
+    indexed_search_fields = ('last_name', 'email')
+    search_help_text = "Start of the last name or email"
+
+
+@admin.register(Student)
+class StudentAdmin(LargeTableAdmin):
+    list_display = ('last_name', 'first_name', 'school', 'parent')
+    list_select_related = ('school', 'parent')
+    list_filter = ('school',)
+    raw_id_fields = ('parent',)
+    indexed_search_fields = ('last_name',)
+    search_help_text = "Start of the last name"
+
+
+@admin.register(FieldTripRegistration)
+class FieldTripRegistrationAdmin(LargeTableAdmin):
+    list_display = ('id', 'student', 'field_trip')
+    list_select_related = ('student', 'field_trip')
+    list_filter = ('field_trip',)
+    raw_id_fields = ('student', 'field_trip')
+    indexed_search_fields = ('student__last_name',)
+    search_help_text = "Start of the student's last name"
+
+
+class TransactionLineItemInline(admin.TabularInline):
+    model = TransactionLineItem
+    raw_id_fields = ('student', 'field_trip')
+    extra = 0
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'date', 'amount', 'student', 'activity', 'refunded_at')
+    list_select_related = ('student', 'activity')
+    list_filter = ('activity',)
+    raw_id_fields = ('student', 'activity')
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+    indexed_search_fields = ('id', 'student__last_name')
+    search_help_text = "Start of the transaction id or the student's last name"
+    inlines = [TransactionLineItemInline]
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'date', 'amount', 'student_id', 'activity_id', 'refunded_at', 'archived_at')
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+    indexed_search_fields = ('id',)
+    search_help_text = "Start of the transaction id"
+
+
+@admin.register(ArchivedTransactionLineItem)
+class ArchivedTransactionLineItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'transaction_id', 'student_id', 'field_trip_id', 'amount', 'refunded_at', 'archived_at')
+    ordering = ('-id',)
+    indexed_search_fields = ('transaction_id',)
+    search_help_text = "Start of the transaction id"
+
+
+@admin.register(ArchivedFieldTripRegistration)
+class ArchivedFieldTripRegistrationAdmin(LargeTableAdmin):
+    list_display = ('id', 'student_id', 'field_trip_id', 'archived_at')
@@ -0,0 +1,277 @@
+"""
+Revenue and participation reports over a columnar copy of the transactions.
+
+`extract_transactions()` copies the transactions written since its last run from every shard into a
+ColumnarTable under `settings.ANALYTICS_DIR`, one row per payment and one per refund (a cart checkout
+counts as one payment per line item):
+
+    day           int32  local date, as days since 1970-01-01
+    school        int32  index into manifest["schools"]
+    field_trip    int32  index into manifest["field_trips"]
+    student       int64  shard index << 40 | student id
+    amount_cents  int64  negative for refunds
+    sign          int8   1 for a payment, -1 for a refund
+
+Each run reads only what is past its watermarks (one per shard, for payments and for refunds, of
+transactions and of line items), in pages ordered by time and id, and leaves the last
+`ANALYTICS_SETTLE` seconds for the next run so transactions still committing are not skipped. Once
+a table has more than `ANALYTICS_MAX_PARTS` parts they are compacted into one.
+
+The reports only read the files: the columns are memory-mapped and grouped with `bincount`/`unique`,
+which takes milliseconds over millions of rows.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+import numpy
+
+from backend.api.columnar import ColumnarTable
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.school import School
+from backend.api.models.student import Student
+from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
+from backend.api.routers import fan_out, shard_aliases
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TRANSACTION_SCHEMA = {
+    "day": "int32",
+    "school": "int32",
+    "field_trip": "int32",
+    "student": "int64",
+    "amount_cents": "int64",
+    "sign": "int8",
+}
+
+EPOCH = date(1970, 1, 1)
+SHARD_BITS = 40
+# Wide enough for shard << SHARD_BITS | student id, so (field trip, student) fits one int64
+FIELD_TRIP_SHIFT = 44
+
+
+@dataclass(frozen=True)
+class ExtractSummary:
+    payments: int
+    refunds: int
+    rows: int
+
+
+def transactions_table(directory=None):
+    return ColumnarTable(Path(directory or settings.ANALYTICS_DIR) / "transactions", TRANSACTION_SCHEMA)
+
+
+def _day(value):
+    return (timezone.localtime(value).date() - EPOCH).days
+
+
+@contextmanager
+def _extract_lock(directory):
+    """
+    Keep concurrent runs from extracting the same transactions twice
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(directory / ".extract.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _Codes:
+    """
+    Stable integer codes for the ids in one of the manifest's dictionaries
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.codes = {entry[0]: index for index, entry in enumerate(entries)}
+
+    def __call__(self, key, name=""):
+        key = str(key)
+        if key not in self.codes:
+            self.codes[key] = len(self.entries)
+            self.entries.append([key, name])
+        return self.codes[key]
+
+    def rename(self, key, name):
+        self.entries[self(key, name)][1] = name
+
+
+def _pages(queryset, timestamp_field, watermark, until, batch_size):
+    """
+    Pages of `(id, timestamp, ...)` rows after the `[timestamp, id]` watermark, in that order
+    """
+    queryset = queryset.filter(**{timestamp_field + "__lte": until}).order_by(timestamp_field, "id")
+    after = (datetime.fromisoformat(watermark[0]), watermark[1]) if watermark else None
+    while True:
+        page = queryset
+        if after is not None:
+            page = queryset.filter(Q(**{timestamp_field + "__gt": after[0]})
+                                   | Q(**{timestamp_field: after[0], "id__gt": after[1]}))
+        page = list(page[:batch_size])
+        if not page:
+            return
+        yield page
+        after = (page[-1][1], page[-1][0])
+
+
+def extract_transactions(directory=None):
+    """
+    Append the transactions and refunds written since the last run to the analytics table
+    """
+    table = transactions_table(directory)
+    with _extract_lock(table.directory):
+        manifest = table.manifest()
+        for key in ("schools", "field_trips", "shards"):
+            manifest.setdefault(key, [])
+        watermarks = manifest.setdefault("watermarks", {})
+
+        schools, field_trips = _Codes(manifest["schools"]), _Codes(manifest["field_trips"])
+        for school_id, name in School.objects.values_list("id", "name"):
+            schools.rename(school_id, name)
+        for field_trip_id, location in FieldTrip.objects.values_list("id", "location"):
+            field_trips.rename(field_trip_id, location)
+
+        students = defaultdict(int)
+        for counts in fan_out(lambda alias: list(
+                Student.objects.using(alias).values_list("school_id").annotate(students=Count("id")).order_by())):
+            for school_id, count in counts:
+                students[schools(school_id)] += count
+        manifest["students"] = {str(code): count for code, count in students.items()}
+
+        until = timezone.now() - timedelta(seconds=settings.ANALYTICS_SETTLE)
+        columns = {column: [] for column in TRANSACTION_SCHEMA}
+        extracted = {"payments": 0, "refunds": 0}
+        for alias in shard_aliases():
+            if alias not in manifest["shards"]:
+                manifest["shards"].append(alias)
+            shard = manifest["shards"].index(alias) << SHARD_BITS
+            shard_watermarks = watermarks.setdefault(alias, {})
+            transactions = Transaction.objects.using(alias).filter(activity__isnull=False)
+            line_items = TransactionLineItem.objects.using(alias)
+
+            for kind, counter, timestamp_field, sign, rows in [
+                ("payments", "payments", "date", 1, transactions.values_list(
+                    "id", "date", "amount", "student_id", "student__school_id", "activity_id")),
+                ("refunds", "refunds", "refunded_at", -1, transactions.filter(refunded_at__isnull=False).values_list(
+                    "id", "refunded_at", "amount", "student_id", "student__school_id", "activity_id")),
+                ("line_item_payments", "payments", "transaction__date", 1, line_items.values_list(
+                    "id", "transaction__date", "amount", "student_id", "student__school_id", "field_trip_id")),
+                ("line_item_refunds", "refunds", "refunded_at", -1, line_items.filter(refunded_at__isnull=False)
+                 .values_list("id", "refunded_at", "amount", "student_id", "student__school_id", "field_trip_id")),
+            ]:
+                for page in _pages(rows, timestamp_field, shard_watermarks.get(kind), until,
+                                   settings.ANALYTICS_BATCH_SIZE):
+                    for _, timestamp, amount, student_id, school_id, field_trip_id in page:
+                        columns["day"].append(_day(timestamp))
+                        columns["school"].append(schools(school_id))
+                        columns["field_trip"].append(field_trips(field_trip_id))
+                        columns["student"].append(shard | student_id)
+                        columns["amount_cents"].append(sign * int(amount * 100))
+                        columns["sign"].append(sign)
+                    extracted[counter] += len(page)
+                    shard_watermarks[kind] = [page[-1][1].isoformat(), page[-1][0]]
+
+        if columns["day"]:
+            table.write_part(manifest, columns)
+        if len(manifest["parts"]) > settings.ANALYTICS_MAX_PARTS:
+            table.compact(manifest)
+        table.write_manifest(manifest)
+        table.remove_unlisted_parts(manifest)
+
+    return ExtractSummary(payments=extracted["payments"], refunds=extracted["refunds"], rows=manifest["rows"])
+
+
+def _cents(value):
+    value = int(value)
+    return "{}{}.{:02d}".format("-" if value < 0 else "", abs(value) // 100, abs(value) % 100)
+
+
+def _date_range_mask(day, start, end):
+    """
+    Which rows fall between the `start` and `end` dates (inclusive); None when unbounded
+    """
+    if start is None and end is None:
+        return None
+    low = (start - EPOCH).days if start else -2 ** 31
+    high = (end - EPOCH).days if end else 2 ** 31 - 1
+    return (day >= low) & (day <= high)
+
+
+def _select(column, mask):
+    return column if mask is None else column[mask]
+
+
+def revenue_by_school_day(directory=None, start=None, end=None):
+    """
+    Net revenue (payments less refunds) per school per day, by date then school name
+    """
+    table = transactions_table(directory)
+    manifest = table.manifest()
+    columns = table.read(manifest)
+    mask = _date_range_mask(columns["day"], start, end)
+    day, school, amount = (_select(columns[name], mask) for name in ("day", "school", "amount_cents"))
+
+    if not len(day):
+        return []
+    first = int(day.min())
+    span = int(day.max()) - first + 1
+    key = school.astype(numpy.int64) * span + (day - first)
+    groups = numpy.flatnonzero(numpy.bincount(key))
+    sums = numpy.rint(numpy.bincount(key, weights=amount)[groups]).astype(numpy.int64)
+    totals = zip((groups % span + first).tolist(), (groups // span).tolist(), sums.tolist())
+
+    # Dates and schools repeat across groups; format each once
+    dates = {}
+    schools = manifest.get("schools", [])
+    rows = []
+    for day_value, school_value, total in totals:
+        if day_value not in dates:
+            dates[day_value] = (EPOCH + timedelta(days=day_value)).isoformat()
+        school_id, name = schools[school_value]
+        rows.append({"date": dates[day_value], "school_id": school_id, "school": name, "revenue": _cents(total)})
+    rows.sort(key=lambda row: (row["date"], row["school"], row["school_id"]))
+    return rows
+
+
+def participation_by_trip(directory=None):
+    """
+    Per field trip, the students with a payment that hasn't been refunded, as a share of all students
+    """
+    table = transactions_table(directory)
+    manifest = table.manifest()
+    columns = table.read(manifest)
+    field_trip_count = len(manifest.get("field_trips", []))
+
+    key = (columns["field_trip"].astype(numpy.int64) << FIELD_TRIP_SHIFT) | columns["student"]
+    unique, inverse = numpy.unique(key, return_inverse=True)
+    net = numpy.bincount(inverse, weights=columns["sign"])
+    paying = numpy.bincount(unique[net > 0] >> FIELD_TRIP_SHIFT, minlength=field_trip_count).tolist()
+
+    students = sum(manifest.get("students", {}).values())
+    rows = [
+        {
+            "field_trip_id": field_trip_id,
+            "field_trip": location,
+            "paying_students": paying[index],
+            "students": students,
+            "participation": round(paying[index] / students, 4) if students else 0.0,
+        }
+        for index, (field_trip_id, location) in enumerate(manifest.get("field_trips", []))
+    ]
+    return sorted(rows, key=lambda row: (-row["participation"], row["field_trip"]))
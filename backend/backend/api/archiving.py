@@ -0,0 +1,101 @@
+"""
+Moving old payments out of the hot tables.
+
+`archive_payments()` moves the transactions and registrations of field trips that took place before
+a cut-off into ArchivedTransaction and ArchivedFieldTripRegistration, so Transaction and
+FieldTripRegistration (and every index on them) only hold recent and upcoming trips. A transaction
+is archived only once both its payment and its trip are older than the cut-off; for a cart, once its
+latest line item's trip is. A cart's line items move to ArchivedTransactionLineItem with it.
+
+Rows move `batch_size` at a time, each batch copied and deleted in one database transaction, so an
+interrupted run leaves every row in exactly one table and is resumed by running it again. Copies
+keep the original ids and ignore conflicts, so a batch retried after a partial copy is harmless.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from backend.api.models.archive import (
+    ArchivedFieldTripRegistration, ArchivedTransaction, ArchivedTransactionLineItem
+)
+from backend.api.models.field_trip import FieldTripRegistration
+from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
+
+TRANSACTION_FIELDS = ["id", "date", "amount", "student_id", "activity_id", "refund_id", "refunded_at"]
+LINE_ITEM_FIELDS = ["id", "transaction_id", "student_id", "field_trip_id", "amount", "refund_id", "refunded_at"]
+REGISTRATION_FIELDS = ["id", "field_trip_id", "student_id"]
+
+
+@dataclass
+class ArchiveSummary:
+    transactions: int = 0
+    line_items: int = 0
+    registrations: int = 0
+
+
+def archive_cutoff(retention_days=None):
+    days = settings.PAYMENT_ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+    return timezone.now() - timedelta(days=days)
+
+
+def _archivable_transactions(cutoff, using):
+    line_items = TransactionLineItem.objects.using(using).filter(transaction=OuterRef("pk"))
+    # A cart has no activity of its own; it is as old as the latest trip among its line items
+    cart = Q(activity__isnull=True) & Exists(line_items) & ~Exists(line_items.filter(field_trip__date__gte=cutoff))
+    return Transaction.objects.using(using).filter(Q(activity__date__lt=cutoff) | cart, date__lt=cutoff)
+
+
+def _archivable(cutoff, using):
+    return [
+        (_archivable_transactions(cutoff, using), ArchivedTransaction, TRANSACTION_FIELDS, "transactions"),
+        (FieldTripRegistration.objects.using(using).filter(field_trip__date__lt=cutoff),
+         ArchivedFieldTripRegistration, REGISTRATION_FIELDS, "registrations"),
+    ]
+
+
+def count_archivable(cutoff, using):
+    """
+    What `archive_payments()` would move, without moving it
+    """
+    counts = {name: queryset.count() for queryset, _, _, name in _archivable(cutoff, using)}
+    counts["line_items"] = TransactionLineItem.objects.using(using).filter(
+        transaction__in=_archivable_transactions(cutoff, using)).count()
+    return ArchiveSummary(**counts)
+
+
+def _move(model, archive_model, rows, using):
+    archive_model.objects.using(using).bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+    model.objects.using(using).filter(pk__in=[row["id"] for row in rows]).delete()
+
+
+def archive_payments(cutoff, using, batch_size=None, progress=None):
+    """
+    Move the rows of trips before `cutoff` on the `using` database; `progress(summary)` is called per batch
+    """
+    batch_size = batch_size or settings.PAYMENT_ARCHIVE_BATCH_SIZE
+    summary = ArchiveSummary()
+    for queryset, archive_model, fields, name in _archivable(cutoff, using):
+        queryset = queryset.order_by("pk")
+        while True:
+            with transaction.atomic(using=using):
+                # Locks the batch on databases that support it, so a concurrent run can't copy it too
+                rows = list(queryset.select_for_update(of=("self",)).values(*fields)[:batch_size])
+                if not rows:
+                    break
+                line_items = []
+                if archive_model is ArchivedTransaction:
+                    # Line items protect their transaction, so they move first, in the same batch
+                    line_items = list(TransactionLineItem.objects.using(using).filter(
+                        transaction_id__in=[row["id"] for row in rows]).values(*LINE_ITEM_FIELDS))
+                    _move(TransactionLineItem, ArchivedTransactionLineItem, line_items, using)
+                _move(queryset.model, archive_model, rows, using)
+            setattr(summary, name, getattr(summary, name) + len(rows))
+            summary.line_items += len(line_items)
+            if progress is not None:
+                progress(summary)
+    return summary
@@ -0,0 +1,275 @@
+"""
+Audit log of every payment gateway call.
+
+`audited_payment()` and `audited_refund()` wrap the gateway calls and record the masked card, amount,
+latency, result and transaction id. Recording only puts the record on a bounded in-memory queue; a
+background thread drains it in batches to append-only NDJSON files, one JSON object per line:
+
+    settings.AUDIT_LOG_DIR/gateway-<pid>.ndjson
+
+Each process writes its own file, rotated to `.1`, `.2`, ... once it reaches `AUDIT_LOG_MAX_BYTES`,
+keeping `AUDIT_LOG_BACKUPS` rotations. When the queue is full (the disk can't keep up) records are
+dropped rather than slowing down payments; drops are counted and written to the log as an
+`audit_dropped` record once the writer catches up.
+
+Whether or not auditing is on, `gateway_monitor` counts the calls in flight and the outcomes of
+recent calls in memory, for the readiness check (see backend/api/health.py).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PAYMENT = "payment"
+REFUND = "refund"
+DROPPED = "audit_dropped"
+
+_STOP = object()
+
+
+def mask_card_number(card_number):
+    digits = "".join(str(card_number or "").split())
+    return "*" * max(len(digits) - 4, 0) + digits[-4:]
+
+
+class AuditLog:
+    def __init__(self, directory, max_bytes, backups, queue_size, batch_size):
+        self.path = self.path_for(directory)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self._unreported_drops = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def path_for(directory):
+        return Path(directory) / "gateway-{}.ndjson".format(os.getpid())
+
+    def record(self, event, **fields):
+        """
+        Queue a record without blocking; it is dropped if the queue is full
+        """
+        record = {"time": datetime.now(dt_timezone.utc).isoformat(), "event": event, **fields}
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(1)
+
+    def flush(self):
+        """
+        Wait until every queued record has been written
+        """
+        self.queue.join()
+
+    def close(self, timeout=5):
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _drop(self, count):
+        with self._lock:
+            self.dropped += count
+            self._unreported_drops += count
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not _STOP]
+            try:
+                self._write(records)
+            except Exception:
+                logger.exception("Could not write %d gateway audit records to %s", len(records), self.path)
+                self._drop(len(records))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(records) < len(batch):
+                return
+
+    def _write(self, records):
+        with self._lock:
+            dropped, self._unreported_drops = self._unreported_drops, 0
+        if dropped:
+            records = [{"time": datetime.now(dt_timezone.utc).isoformat(), "event": DROPPED, "dropped": dropped},
+                       *records]
+        if not records:
+            return
+
+        data = "".join(json.dumps(record, default=str, separators=(",", ":")) + "\n" for record in records)
+        data = data.encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists() and self.path.stat().st_size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as file:
+            file.write(data)
+        self.written += len(records)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = Path("{}.{}".format(self.path, index))
+            if source.exists():
+                os.replace(source, "{}.{}".format(self.path, index + 1))
+        if self.backups:
+            os.replace(self.path, "{}.1".format(self.path))
+        else:
+            self.path.unlink()
+
+
+class GatewayMonitor:
+    """
+    Gateway calls in flight, and the outcomes of recent calls, in this process
+    """
+
+    def __init__(self, max_outcomes=10000):
+        self.in_flight = {}
+        # (monotonic time, succeeded) per finished call, oldest first
+        self.outcomes = deque(maxlen=max_outcomes)
+        self._lock = threading.Lock()
+
+    def track(self, event, call):
+        """
+        `call()`, counted as in flight until it returns; a response with `success` False counts as an error
+        """
+        with self._lock:
+            self.in_flight[event] = self.in_flight.get(event, 0) + 1
+        succeeded = False
+        try:
+            response = call()
+            succeeded = bool(response.success)
+            return response
+        finally:
+            with self._lock:
+                self.in_flight[event] -= 1
+                self.outcomes.append((time.monotonic(), succeeded))
+
+    def calls_in_flight(self, event):
+        with self._lock:
+            return self.in_flight.get(event, 0)
+
+    def recent_outcomes(self, window):
+        """
+        `(calls, errors)` over the last `window` seconds
+        """
+        since = time.monotonic() - window
+        with self._lock:
+            while self.outcomes and self.outcomes[0][0] < since:
+                self.outcomes.popleft()
+            calls = len(self.outcomes)
+            errors = sum(1 for _, succeeded in self.outcomes if not succeeded)
+        return calls, errors
+
+
+gateway_monitor = GatewayMonitor()
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def gateway_audit_log():
+    """
+    This process's audit log, or None when `settings.AUDIT_LOG_DIR` is unset. A forked worker gets its own.
+    """
+    global _audit_log
+    if not settings.AUDIT_LOG_DIR:
+        return None
+    with _audit_log_lock:
+        if _audit_log is None or _audit_log.path != AuditLog.path_for(settings.AUDIT_LOG_DIR):
+            if _audit_log is not None:
+                _audit_log.close()
+            _audit_log = AuditLog(
+                settings.AUDIT_LOG_DIR,
+                max_bytes=settings.AUDIT_LOG_MAX_BYTES,
+                backups=settings.AUDIT_LOG_BACKUPS,
+                queue_size=settings.AUDIT_LOG_QUEUE_SIZE,
+                batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+            )
+            atexit.register(_audit_log.close)
+        return _audit_log
+
+
+def close_gateway_audit_log():
+    """
+    Write out and close this process's audit log; the next gateway call opens it again
+    """
+    global _audit_log
+    with _audit_log_lock:
+        if _audit_log is not None:
+            _audit_log.close()
+            _audit_log = None
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _audited(event, call, **fields):
+    def monitored_call():
+        return gateway_monitor.track(event, call)
+
+    audit_log = gateway_audit_log()
+    if audit_log is None:
+        return monitored_call()
+
+    started = time.perf_counter()
+    try:
+        response = monitored_call()
+    except Exception as error:
+        audit_log.record(event, **fields, latency_ms=_elapsed_ms(started), result="error", error=repr(error))
+        raise
+
+    outcome = {"result": "success" if response.success else "failure", "error": response.error_message}
+    for name in ("transaction_id", "refund_id"):
+        if hasattr(response, name):
+            outcome[name] = getattr(response, name)
+    audit_log.record(event, **{**fields, **outcome}, latency_ms=_elapsed_ms(started))
+    return response
+
+
+def audited_payment(processor, payment_data):
+    """
+    `processor.process_payment(payment_data)`, audited. The CVV and expiry date are never recorded.
+    """
+    return _audited(
+        PAYMENT, lambda: processor.process_payment(payment_data),
+        card=mask_card_number(payment_data.get("card_number")),
+        amount=payment_data.get("amount"),
+        school_id=payment_data.get("school_id"),
+        activity_id=payment_data.get("activity_id"),
+    )
+
+
+def audited_refund(processor, transaction_id, amount):
+    """
+    `processor.refund(transaction_id, amount)`, audited
+    """
+    return _audited(
+        REFUND, lambda: processor.refund(transaction_id, amount),
+        amount=amount,
+        transaction_id=transaction_id,
+    )
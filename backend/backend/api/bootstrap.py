@@ -0,0 +1,126 @@
+"""
+Everything the SPA needs for its first render, in one response: GET /api/bootstrap.
+
+    {"version": "...", "schools": [{id, name}, ...], "field_trips": [{id, location, cost, date}, ...],
+     "config": {...}}
+
+GET /api/fieldtrip repeats the whole school list inside every trip; here it is listed once and the
+client attaches it to each trip. As in GET /api/fieldtrip, only upcoming trips are listed.
+
+The body is rendered once, compressed once with gzip (and Brotli when the `brotli` package is
+installed) and kept in process until a school or field trip changes or `BOOTSTRAP_TTL` runs out,
+so a request only picks the encoding the client accepts.
+"""
+import gzip
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict
+
+from django.conf import settings
+
+from backend.api.cache import LRUCache
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.school import School
+from backend.api.projections import ValuesProjection
+from backend.api.renderers import FastJSONRenderer
+from backend.api.serializers import FieldTripSummarySerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+
+_CACHE_KEY = "bootstrap"
+
+_cache = LRUCache(maxsize=1, ttl=getattr(settings, "BOOTSTRAP_TTL", 300))
+
+
+@dataclass(frozen=True)
+class Bootstrap:
+    version: str
+    body: bytes
+    # Content-Encoding -> the body compressed with it
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding=None):
+        # Each encoding is a different representation, so it gets its own validator
+        return '"{}{}"'.format(self.version, "-" + encoding if encoding else "")
+
+    def negotiate(self, accept_encoding):
+        """
+        The `(encoding, body)` to send for an Accept-Encoding header; encoding is None for the plain body
+        """
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in (BROTLI, GZIP):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding, self.encoded[encoding]
+        return None, self.body
+
+
+def accepted_encodings(header):
+    """
+    The content codings an Accept-Encoding header allows. A coding refused with q=0 is left out,
+    and `*` stands for every coding the header doesn't name.
+    """
+    accepted, refused = set(), set()
+    for item in (header or "").split(","):
+        coding, *parameters = item.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            (accepted if quality > 0 else refused).add(coding)
+    if "*" in accepted:
+        accepted |= {GZIP, BROTLI} - refused
+    return accepted - refused
+
+
+def client_config():
+    """
+    Settings the SPA adapts to, so it doesn't have to discover them with extra requests
+    """
+    return {"waiting_room": settings.WAITING_ROOM_ENABLED, "payment_events": settings.PAYMENT_EVENTS_STREAMING}
+
+
+def _compress(body):
+    encoded = {GZIP: gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded[BROTLI] = brotli.compress(body, quality=11)
+    return encoded
+
+
+def build_bootstrap():
+    """
+    Render and compress the bootstrap body, versioned by its content hash
+    """
+    schools = [
+        {"id": str(school_id), "name": name}
+        for school_id, name in School.objects.order_by("name", "id").values_list("id", "name")
+    ]
+    field_trips = list(ValuesProjection(FieldTripSummarySerializer).rows(FieldTrip.objects.upcoming()))
+    content = {"schools": schools, "field_trips": field_trips, "config": client_config()}
+
+    version = hashlib.sha256(FastJSONRenderer().render(content)).hexdigest()[:16]
+    body = FastJSONRenderer().render({"version": version, **content})
+    return Bootstrap(version=version, body=body, encoded=_compress(body))
+
+
+def get_bootstrap():
+    bootstrap = _cache.get(_CACHE_KEY)
+    if bootstrap is None:
+        bootstrap = build_bootstrap()
+        _cache.set(_CACHE_KEY, bootstrap)
+    return bootstrap
+
+
+def invalidate_bootstrap(**kwargs):
+    _cache.delete(_CACHE_KEY)
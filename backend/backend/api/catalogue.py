@@ -0,0 +1,128 @@
+"""
+Incremental catalogue sync: the schools and field trips changed or deleted since a cursor.
+
+Saves bump `updated_at` on School and FieldTrip, and deletes leave a CatalogueTombstone. The feed
+merges the three in `(timestamp, id)` order, so a page can end between two rows changed in the
+same microsecond and the next page still picks up where it stopped. The cursor returned with each
+page is that position; passing it back as `since` returns what changed after it.
+
+Rows changed in the last `settings.CATALOGUE_CHANGES_SETTLE` seconds are held back, so a write
+whose transaction commits after a later one can't slip in behind a cursor already handed out.
+Tombstones are kept for `settings.CATALOGUE_TOMBSTONE_RETENTION` seconds; an older cursor could
+miss deletions and is rejected, and the client has to start over without `since`.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta, timezone as dt_timezone
+from typing import List
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.api.exceptions import CursorExpired
+from backend.api.models.catalogue_tombstone import CatalogueTombstone
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.school import School
+
+CURSOR_SEPARATOR = "~"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Cursor:
+    timestamp: object
+    id: object = None
+
+    def __str__(self):
+        timestamp = self.timestamp.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return timestamp if self.id is None else "{}{}{}".format(timestamp, CURSOR_SEPARATOR, self.id)
+
+    @classmethod
+    def parse(cls, value):
+        """
+        A cursor returned by the feed, or an ISO 8601 datetime for everything changed after it
+        """
+        timestamp, _, object_id = value.partition(CURSOR_SEPARATOR)
+        try:
+            parsed = parse_datetime(timestamp)
+            object_id = uuid.UUID(object_id) if object_id else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise InvalidCursor("Must be a cursor from a previous page or an ISO 8601 datetime.")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return cls(parsed, object_id)
+
+    def after(self, timestamp_field, id_field):
+        if self.id is None:
+            return Q(**{timestamp_field + "__gt": self.timestamp})
+        return (Q(**{timestamp_field + "__gt": self.timestamp})
+                | Q(**{timestamp_field: self.timestamp, id_field + "__gt": self.id}))
+
+
+@dataclass
+class CatalogueChanges:
+    field_trips: List[FieldTrip]
+    schools: List[School]
+    deleted: List[CatalogueTombstone]
+    cursor: Cursor
+    has_more: bool
+
+
+# (model, timestamp field, id field)
+SOURCES = [
+    (FieldTrip, "updated_at", "id"),
+    (School, "updated_at", "id"),
+    (CatalogueTombstone, "deleted_at", "object_id"),
+]
+
+
+def catalogue_changes(since=None, limit=500):
+    """
+    Up to `limit` changes after the `since` cursor (everything when None), oldest first
+    """
+    now = timezone.now()
+    if since is not None and since.timestamp < now - timedelta(seconds=settings.CATALOGUE_TOMBSTONE_RETENTION):
+        raise CursorExpired()
+    until = now - timedelta(seconds=settings.CATALOGUE_CHANGES_SETTLE)
+
+    # Each source's first `limit` rows include every one of its rows in the merged first `limit`
+    changed = []
+    for model, timestamp_field, id_field in SOURCES:
+        queryset = model.objects.filter(**{timestamp_field + "__lte": until})
+        if since is not None:
+            queryset = queryset.filter(since.after(timestamp_field, id_field))
+        for row in queryset.order_by(timestamp_field, id_field)[:limit + 1]:
+            changed.append(((getattr(row, timestamp_field), getattr(row, id_field)), model, row))
+    changed.sort(key=lambda change: change[0])
+
+    page = changed[:limit]
+    if page:
+        cursor = Cursor(*page[-1][0])
+    elif since is None or since.timestamp < until:
+        # Nothing changed up to `until`; moving the cursor there keeps an idle client's cursor from expiring
+        cursor = Cursor(until)
+    else:
+        cursor = since
+    return CatalogueChanges(
+        field_trips=[row for _, model, row in page if model is FieldTrip],
+        schools=[row for _, model, row in page if model is School],
+        deleted=[row for _, model, row in page if model is CatalogueTombstone],
+        cursor=cursor,
+        has_more=len(changed) > limit,
+    )
+
+
+def record_tombstone(kind, object_id, using):
+    """
+    Record a deletion for the feed, dropping tombstones past their retention
+    """
+    CatalogueTombstone.objects.using(using).create(kind=kind, object_id=object_id)
+    expired = timezone.now() - timedelta(seconds=settings.CATALOGUE_TOMBSTONE_RETENTION)
+    CatalogueTombstone.objects.using(using).filter(deleted_at__lt=expired).delete()
@@ -0,0 +1,108 @@
+"""
+Append-only columnar tables on disk.
+
+A table is a directory of parts plus a `manifest.json`. Each part is one `.npy` file per column,
+written with `numpy.save` and memory-mapped by `numpy.load`. A part is written under a temporary name
+and renamed into place before the manifest that lists it, so readers see either the old table or the
+new one.
+
+    <table>/manifest.json
+    <table>/part-000001/<column>.npy
+    <table>/part-000002/<column>.npy
+"""
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy
+
+
+def write_npy(path, dtype, values):
+    numpy.save(path, numpy.asarray(values, dtype=dtype))
+
+
+def read_npy(path):
+    """
+    A column as a read-only NumPy memory map
+    """
+    return numpy.load(path, mmap_mode="r")
+
+
+def concatenate(columns, dtype):
+    return numpy.concatenate(columns) if columns else numpy.empty(0, dtype=dtype)
+
+
+class ColumnarTable:
+    """
+    `schema` maps column names to NumPy dtypes
+    """
+
+    def __init__(self, directory, schema):
+        self.directory = Path(directory)
+        self.schema = schema
+
+    @property
+    def manifest_path(self):
+        return self.directory / "manifest.json"
+
+    def manifest(self):
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except FileNotFoundError:
+            return {"parts": [], "rows": 0}
+
+    def write_manifest(self, manifest):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".manifest.")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(temporary, self.manifest_path)
+
+    def write_part(self, manifest, columns):
+        """
+        Write `columns` (name -> values) as a new part and add it to `manifest`; the caller writes the manifest
+        """
+        rows = {len(values) for values in columns.values()}
+        if len(rows) != 1 or set(columns) != set(self.schema):
+            raise ValueError("A part needs every column of the schema, all the same length")
+
+        # Part names are never reused, so a reader holding an older manifest never opens a different part
+        number = manifest.get("next_part", 1)
+        manifest["next_part"] = number + 1
+        name = "part-{:06d}".format(number)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = Path(tempfile.mkdtemp(dir=self.directory, prefix=".{}.".format(name)))
+        for column, dtype in self.schema.items():
+            write_npy(temporary / "{}.npy".format(column), dtype, columns[column])
+        os.replace(temporary, self.directory / name)
+
+        row_count = rows.pop()
+        manifest["parts"].append({"name": name, "rows": row_count})
+        manifest["rows"] += row_count
+
+    def read(self, manifest=None):
+        """
+        Every column of the table, concatenated across parts
+        """
+        parts = (manifest or self.manifest())["parts"]
+        return {
+            column: concatenate([read_npy(self.directory / part["name"] / "{}.npy".format(column)) for part in parts],
+                                dtype)
+            for column, dtype in self.schema.items()
+        }
+
+    def compact(self, manifest):
+        """
+        Rewrite all parts as one; the caller writes the manifest, then calls `remove_unlisted_parts()`
+        """
+        columns = self.read(manifest)
+        manifest["parts"], manifest["rows"] = [], 0
+        self.write_part(manifest, columns)
+
+    def remove_unlisted_parts(self, manifest):
+        listed = {part["name"] for part in manifest["parts"]}
+        for path in self.directory.glob("part-*"):
+            if path.name not in listed:
+                shutil.rmtree(path, ignore_errors=True)
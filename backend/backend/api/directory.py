@@ -0,0 +1,48 @@
+import hashlib
+import json
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from backend.api.cache import LRUCache
+from backend.api.models.school import School
+
+_CACHE_KEY = "schools"
+
+_cache = LRUCache(maxsize=1, ttl=getattr(settings, "SCHOOL_DIRECTORY_TTL", 300))
+
+
+@dataclass(frozen=True)
+class SchoolDirectory:
+    version: str
+    body: bytes
+
+    @property
+    def etag(self):
+        return '"{}"'.format(self.version)
+
+
+def build_school_directory():
+    """
+    Render the school list once into a compact JSON body versioned by its content hash
+    """
+    schools = [
+        {"id": str(school_id), "name": name}
+        for school_id, name in School.objects.order_by("name", "id").values_list("id", "name")
+    ]
+    content = json.dumps(schools, ensure_ascii=False, separators=(",", ":"))
+    version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    body = '{{"version":"{}","schools":{}}}'.format(version, content).encode("utf-8")
+    return SchoolDirectory(version=version, body=body)
+
+
+def get_school_directory():
+    directory = _cache.get(_CACHE_KEY)
+    if directory is None:
+        directory = build_school_directory()
+        _cache.set(_CACHE_KEY, directory)
+    return directory
+
+
+def invalidate_school_directory(**kwargs):
+    _cache.delete(_CACHE_KEY)
@@ -0,0 +1,237 @@
+"""
+Payment state transitions pushed to browsers over Server-Sent Events.
+
+The payment view publishes `received`, `processing` and then `succeeded` or `failed` for the
+`payment_reference` the client chose. Clients stream them from `GET /api/payment/<reference>/events`.
+
+Publishing goes through the broker named by `settings.PAYMENT_EVENTS_BACKEND`:
+
+- `LocalPaymentEvents` delivers to subscribers in the same process. This is enough for a single
+  worker process (runserver, or one ASGI worker).
+- `RedisPaymentEvents` publishes on a Redis channel that every process listens to, so the stream
+  can be served by a different worker than the one taking the payment.
+
+The last event per reference is retained for `settings.PAYMENT_EVENTS_TTL` seconds, so a client
+that connects late, or reconnects, is sent the current state straight away.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from backend.api.cache import LRUCache
+
+RECEIVED = "received"
+PROCESSING = "processing"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+TERMINAL_STATES = {SUCCEEDED, FAILED}
+
+# Sent first on every stream: how long EventSource waits before reconnecting, in milliseconds
+RETRY_FRAME = b"retry: 3000\n\n"
+# SSE comment line; keeps proxies and load balancers from closing an idle stream
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
+@dataclass(frozen=True)
+class PaymentEvent:
+    reference: str
+    state: str
+    data: dict = field(default_factory=dict)
+
+    def to_json(self):
+        return json.dumps({"reference": self.reference, "state": self.state, **self.data})
+
+    @classmethod
+    def from_json(cls, raw):
+        data = json.loads(raw)
+        return cls(reference=data.pop("reference"), state=data.pop("state"), data=data)
+
+    def encode(self):
+        return "data: {}\n\n".format(self.to_json()).encode("utf-8")
+
+
+class LocalPaymentEvents:
+    """
+    In-process pub/sub. Subscribers are callables invoked with each event on the publishing thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._last_events = LRUCache(maxsize=settings.PAYMENT_EVENTS_RETAINED, ttl=settings.PAYMENT_EVENTS_TTL)
+
+    def publish(self, reference, state, **data):
+        self.deliver(PaymentEvent(reference=reference, state=state, data=data))
+
+    def deliver(self, event):
+        self._last_events.set(event.reference, event)
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.reference, ()))
+        for callback in subscribers:
+            callback(event)
+
+    def last_event(self, reference):
+        return self._last_events.get(reference)
+
+    def subscribe(self, reference, callback):
+        with self._lock:
+            self._subscribers[reference].add(callback)
+
+    def unsubscribe(self, reference, callback):
+        with self._lock:
+            subscribers = self._subscribers.get(reference)
+            if subscribers is not None:
+                subscribers.discard(callback)
+                if not subscribers:
+                    del self._subscribers[reference]
+
+
+class RedisPaymentEvents(LocalPaymentEvents):
+    """
+    Publish through Redis (`settings.PAYMENT_EVENTS_REDIS_URL`) so every process receives every event.
+
+    Each process runs one listener thread for the shared channel and hands events to its local
+    subscribers; the last event per reference is kept in Redis with the same TTL.
+    """
+    channel = "payment_events"
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisPaymentEvents requires the redis package")
+        self._redis = redis.Redis.from_url(settings.PAYMENT_EVENTS_REDIS_URL)
+        self._listener = None
+
+    def _key(self, reference):
+        return "{}:{}".format(self.channel, reference)
+
+    def publish(self, reference, state, **data):
+        event = PaymentEvent(reference=reference, state=state, data=data)
+        self._redis.set(self._key(reference), event.to_json(), ex=settings.PAYMENT_EVENTS_TTL)
+        self._redis.publish(self.channel, event.to_json())
+
+    def last_event(self, reference):
+        raw = self._redis.get(self._key(reference))
+        return PaymentEvent.from_json(raw) if raw else None
+
+    def subscribe(self, reference, callback):
+        with self._lock:
+            if self._listener is None:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._on_message})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        super().subscribe(reference, callback)
+
+    def _on_message(self, message):
+        self.deliver(PaymentEvent.from_json(message["data"]))
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def payment_events():
+    """
+    The process-wide broker configured by `settings.PAYMENT_EVENTS_BACKEND`
+    """
+    path = settings.PAYMENT_EVENTS_BACKEND
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def publish_payment_event(reference, state, **data):
+    """
+    Publish a state transition; payments submitted without a reference have no listeners
+    """
+    if reference:
+        payment_events().publish(reference, state, **data)
+
+
+def event_stream(reference, broker=None):
+    """
+    SSE frames for one reference, for WSGI workers; holds the worker thread until the stream ends
+    """
+    broker = broker or payment_events()
+    received = queue.SimpleQueue()
+    callback = received.put
+    # Subscribe before reading the retained state, so nothing published in between is missed
+    broker.subscribe(reference, callback)
+    try:
+        yield RETRY_FRAME
+        deadline = time.monotonic() + settings.PAYMENT_EVENTS_STREAM_TIMEOUT
+        current = broker.last_event(reference)
+        if current is not None:
+            yield current.encode()
+            if current.state in TERMINAL_STATES:
+                return
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = received.get(timeout=min(settings.PAYMENT_EVENTS_HEARTBEAT, remaining))
+            except queue.Empty:
+                yield KEEPALIVE_FRAME
+                continue
+            if event == current:
+                continue
+            current = event
+            yield event.encode()
+            if event.state in TERMINAL_STATES:
+                return
+    finally:
+        broker.unsubscribe(reference, callback)
+
+
+async def async_event_stream(reference, broker=None):
+    """
+    SSE frames for one reference, for ASGI workers; a waiting client costs a queue, not a thread
+    """
+    broker = broker or payment_events()
+    loop = asyncio.get_running_loop()
+    received = asyncio.Queue()
+
+    def callback(event):
+        loop.call_soon_threadsafe(received.put_nowait, event)
+
+    broker.subscribe(reference, callback)
+    try:
+        yield RETRY_FRAME
+        deadline = loop.time() + settings.PAYMENT_EVENTS_STREAM_TIMEOUT
+        current = broker.last_event(reference)
+        if current is not None:
+            yield current.encode()
+            if current.state in TERMINAL_STATES:
+                return
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(received.get(), min(settings.PAYMENT_EVENTS_HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                yield KEEPALIVE_FRAME
+                continue
+            if event == current:
+                continue
+            current = event
+            yield event.encode()
+            if event.state in TERMINAL_STATES:
+                return
+    finally:
+        broker.unsubscribe(reference, callback)
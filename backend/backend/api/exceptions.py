@@ -0,0 +1,65 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+
+
+class AlreadyPaid(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This student has already paid for this field trip."
+    default_code = "already_paid"
+
+    def __init__(self, transaction):
+        super().__init__()
+        self.transaction = transaction
+
+
+class PaymentInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A payment for this registration is already in progress."
+    default_code = "payment_in_progress"
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "This cursor is older than the deletions kept; sync again without `since`."
+    default_code = "cursor_expired"
+
+
+class WaitingRoomRequired(Throttled):
+    default_detail = "Payments are busy. Take a ticket from the waiting room and retry once admitted."
+    default_code = "waiting_room_required"
+
+    def __init__(self):
+        super().__init__(wait=1)
+
+
+class TicketAlreadyUsed(WaitingRoomRequired):
+    default_detail = "This waiting room ticket has already been used. Take a new ticket to pay again."
+    default_code = "waiting_room_ticket_used"
+
+
+class NotYetAdmitted(Throttled):
+    default_code = "waiting_room_not_admitted"
+
+    def __init__(self, ticket):
+        super().__init__(
+            wait=ticket.wait,
+            detail="Your waiting room ticket is number {} in line.".format(ticket.position),
+        )
+        self.ticket = ticket
+
+
+class ReceiptUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The receipt can't be produced right now. Please try again shortly."
+    default_code = "receipt_unavailable"
+
+
+class ItemsAlreadyPaid(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Some of these registrations have already been paid for."
+    default_code = "items_already_paid"
+
+    def __init__(self, transaction_ids):
+        super().__init__()
+        # Index of each paid item in the checkout -> id of the transaction that paid it
+        self.transaction_ids = transaction_ids
@@ -0,0 +1,75 @@
+"""
+Liveness and readiness of an API worker, for load balancer health checks.
+
+GET /api/health/live answers as long as the process serves requests. GET /api/health/ready answers
+503 when the worker should get no new traffic:
+
+- payments: gateway payment calls in flight in this process have reached `HEALTH_PAYMENT_CAPACITY`
+- gateway: more than `HEALTH_GATEWAY_MAX_ERROR_RATE` of the gateway calls in the last
+  `HEALTH_GATEWAY_WINDOW` seconds failed or raised (once there were `HEALTH_GATEWAY_MIN_CALLS`)
+- database: `SELECT 1` fails on the primary or a shard
+- draining: `HEALTH_DRAIN_FILE` exists, to take the worker out of rotation before a deploy
+
+Every check reads in-process counters or runs `SELECT 1`, so the load balancer can poll every second.
+The counters are per process: each worker reports its own saturation. The body also reports the
+audit log and reference data cache figures, which never fail the check.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from backend.api.audit import PAYMENT, gateway_audit_log, gateway_monitor
+from backend.api.reference import reference_cache_stats
+from backend.api.routers import shard_aliases
+
+
+def _database_check():
+    failed = []
+    started = time.perf_counter()
+    for alias in shard_aliases():
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        except DatabaseError:
+            failed.append(alias)
+    check = {"ok": not failed, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if failed:
+        check["failed"] = failed
+    return check
+
+
+def _payments_check():
+    in_flight = gateway_monitor.calls_in_flight(PAYMENT)
+    return {"ok": in_flight < settings.HEALTH_PAYMENT_CAPACITY, "in_flight": in_flight,
+            "capacity": settings.HEALTH_PAYMENT_CAPACITY}
+
+
+def _gateway_check():
+    calls, errors = gateway_monitor.recent_outcomes(settings.HEALTH_GATEWAY_WINDOW)
+    error_rate = errors / calls if calls else 0.0
+    ok = calls < settings.HEALTH_GATEWAY_MIN_CALLS or error_rate <= settings.HEALTH_GATEWAY_MAX_ERROR_RATE
+    return {"ok": ok, "calls": calls, "errors": errors, "error_rate": round(error_rate, 3)}
+
+
+def readiness():
+    """
+    `(ready, checks)`; `checks` maps each check to its figures and whether it passed
+    """
+    checks = {
+        "database": _database_check(),
+        "payments": _payments_check(),
+        "gateway": _gateway_check(),
+    }
+    if settings.HEALTH_DRAIN_FILE:
+        checks["draining"] = {"ok": not os.path.exists(settings.HEALTH_DRAIN_FILE)}
+    ready = all(check["ok"] for check in checks.values())
+
+    # Reported for monitoring; a lagging audit log or a cold cache doesn't take the worker out of rotation
+    audit_log = gateway_audit_log()
+    if audit_log is not None:
+        checks["audit_log"] = audit_log.stats()
+    checks["reference_cache"] = reference_cache_stats()
+    return ready, checks
@@ -0,0 +1,37 @@
+"""
+Canonical match keys for parents and students.
+
+Names and emails are compared after Unicode NFKC normalization, case folding and whitespace
+collapsing, so "Homer@X.com " and "homer@x.com", or "Bart" and "bart", are the same person. The
+key is a SHA-256 of the normalized fields, which keeps the indexed column narrow.
+"""
+import hashlib
+import unicodedata
+
+
+def normalize_identity(value):
+    value = unicodedata.normalize("NFKC", value or "").casefold()
+    # Case folding can produce sequences NFKC composes differently (e.g. from ligatures)
+    return " ".join(unicodedata.normalize("NFKC", value).split())
+
+
+def _match_key(*parts):
+    return hashlib.sha256("\x1f".join(normalize_identity(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def parent_match_key(first_name, last_name, email):
+    return _match_key(first_name, last_name, email)
+
+
+def parent_email_key(email):
+    """
+    Finds every parent row with an email, whatever the names given with it
+    """
+    return _match_key(email)
+
+
+def student_match_key(first_name, last_name):
+    """
+    Matches within one parent and school; the key itself doesn't include them
+    """
+    return _match_key(first_name, last_name)
@@ -0,0 +1,24 @@
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+@contextmanager
+def cache_lock(key, timeout=30):
+    """
+    Non-blocking lock held in `settings.LOCK_CACHE`; yields whether it was acquired.
+
+    `cache.add` is atomic, so only one holder exists per key across every worker sharing the
+    cache. The lock expires after `timeout` seconds in case its holder dies.
+    """
+    cache = caches[settings.LOCK_CACHE]
+    key = "lock_{}".format(key)
+    token = uuid.uuid4().hex
+    acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
@@ -0,0 +1,32 @@
+import csv
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api.analytics import participation_by_trip, revenue_by_school_day
+
+class Command(BaseCommand):
+    help = "Print a report from the analytics table written by extract_analytics"
+
+    def add_arguments(self, parser):
+        parser.add_argument("report", choices=["participation", "revenue"])
+        parser.add_argument("--directory", help="Defaults to settings.ANALYTICS_DIR")
+        parser.add_argument("--start", type=date.fromisoformat, help="First day of the revenue report (YYYY-MM-DD)")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last day of the revenue report (YYYY-MM-DD)")
+        parser.add_argument("--format", choices=["csv", "json"], default="csv")
+
+    def handle(self, *args, **options):
+        if options["report"] == "revenue":
+            rows = revenue_by_school_day(options["directory"], start=options["start"], end=options["end"])
+        elif options["start"] or options["end"]:
+            raise CommandError("--start and --end only apply to the revenue report")
+        else:
+            rows = participation_by_trip(options["directory"])
+
+        if options["format"] == "json":
+            self.stdout.write(json.dumps(rows, indent=2))
+        elif rows:
+            writer = csv.DictWriter(self.stdout, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api.archiving import archive_cutoff, archive_payments, count_archivable
+from backend.api.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Move transactions and registrations of field trips older than the retention window into the "
+            "archive tables, in batches; rerunning the command resumes an interrupted run")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int,
+                            help="Keep this many days of payments; defaults to settings.PAYMENT_ARCHIVE_RETENTION_DAYS")
+        parser.add_argument("--batch-size", type=int, help="Rows moved per database transaction")
+        parser.add_argument("--database", action="append", dest="databases",
+                            help="Database to archive; defaults to every shard")
+        parser.add_argument("--dry-run", action="store_true", help="Count the rows to archive without moving them")
+
+    def handle(self, *args, **options):
+        if options["retention_days"] is not None and options["retention_days"] < 0:
+            raise CommandError("--retention-days can't be negative")
+        cutoff = archive_cutoff(options["retention_days"])
+
+        transactions = line_items = registrations = 0
+        for alias in options["databases"] or shard_aliases():
+            if options["dry_run"]:
+                summary = count_archivable(cutoff, using=alias)
+            else:
+                summary = archive_payments(cutoff, using=alias, batch_size=options["batch_size"],
+                                           progress=self.report_progress)
+            transactions += summary.transactions
+            line_items += summary.line_items
+            registrations += summary.registrations
+
+        self.stdout.write(self.style.SUCCESS(
+            "{} {} transactions, {} cart line items and {} registrations from before {}".format(
+                "Found" if options["dry_run"] else "Archived", transactions, line_items, registrations,
+                cutoff.date(),
+            )
+        ))
+
+    def report_progress(self, summary):
+        self.stdout.write("{} transactions, {} cart line items, {} registrations archived".format(
+            summary.transactions, summary.line_items, summary.registrations))
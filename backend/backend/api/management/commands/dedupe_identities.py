@@ -0,0 +1,120 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from backend.api.identity import parent_email_key, parent_match_key, student_match_key
+from backend.api.models.field_trip import FieldTripRegistration
+from backend.api.models.parent import Parent
+from backend.api.models.student import Student
+from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
+
+
+def _after(fields, last):
+    """
+    Keyset filter for rows sorting after `last` on `fields`
+    """
+    condition = Q()
+    for index in reversed(range(len(fields))):
+        equal = {field: last[field] for field in fields[:index]}
+        condition = Q(**equal, **{"{}__gt".format(fields[index]): last[fields[index]]}) | condition
+    return condition
+
+
+class Command(BaseCommand):
+    help = ("Merge parents and students that are the same person under their normalized match keys, "
+            "keeping the oldest row and moving registrations and transactions onto it")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report duplicates without merging them")
+
+    def handle(self, *args, **options):
+        self.using = options["database"]
+        self.batch_size = options["batch_size"]
+        self.dry_run = options["dry_run"]
+
+        filled = self.fill_match_keys()
+        parents = self.merge(
+            Parent.objects.using(self.using), ["match_key"], self.merge_parents,
+        )
+        students = self.merge(
+            Student.objects.using(self.using), ["parent_id", "school_id", "match_key"], self.merge_students,
+        )
+
+        self.stdout.write(self.style.SUCCESS("{} {} duplicate parents and {} duplicate students ({} keys filled)".format(
+            "Found" if self.dry_run else "Merged", parents, students, filled,
+        )))
+
+    def fill_match_keys(self):
+        """
+        Rows written with bulk_create or raw SQL skip save(), and with it their match keys
+        """
+        filled = 0
+        for model, keys, fields in [
+            (Parent, {
+                "match_key": lambda parent: parent_match_key(parent.first_name, parent.last_name, parent.email),
+                "email_key": lambda parent: parent_email_key(parent.email),
+            }, ["first_name", "last_name", "email"]),
+            (Student, {
+                "match_key": lambda student: student_match_key(student.first_name, student.last_name),
+            }, ["first_name", "last_name"]),
+        ]:
+            missing = Q()
+            for name in keys:
+                missing |= Q(**{name: ""})
+            queryset = model.objects.using(self.using).filter(missing).only("pk", *fields).order_by("pk")
+            last_pk = None
+            while True:
+                batch = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:self.batch_size])
+                if not batch:
+                    break
+                for row in batch:
+                    for name, key in keys.items():
+                        setattr(row, name, key(row))
+                if not self.dry_run:
+                    model.objects.using(self.using).bulk_update(batch, list(keys))
+                filled += len(batch)
+                last_pk = batch[-1].pk
+        return filled
+
+    def merge(self, queryset, fields, merge_block):
+        """
+        Page through the blocks of `fields` holding more than one row and merge each into its oldest row
+        """
+        groups = (queryset.exclude(match_key="").values(*fields)
+                  .annotate(rows=Count("pk"), keep=Min("pk")).filter(rows__gt=1).order_by(*fields))
+        merged = 0
+        last = None
+        while True:
+            page = list((groups if last is None else groups.filter(_after(fields, last)))[:self.batch_size])
+            if not page:
+                break
+            for group in page:
+                duplicates = list(queryset.filter(**{field: group[field] for field in fields})
+                                  .exclude(pk=group["keep"]).values_list("pk", flat=True))
+                if not self.dry_run:
+                    with transaction.atomic(using=self.using):
+                        merge_block(group["keep"], duplicates)
+                merged += len(duplicates)
+            last = page[-1]
+        return merged
+
+    def merge_parents(self, keep, duplicates):
+        Student.objects.using(self.using).filter(parent_id__in=duplicates).update(parent_id=keep)
+        Parent.objects.using(self.using).filter(pk__in=duplicates).delete()
+
+    def merge_students(self, keep, duplicates):
+        registrations = FieldTripRegistration.objects.using(self.using)
+        registered = set(registrations.filter(student_id=keep).values_list("field_trip_id", flat=True))
+        for registration in registrations.filter(student_id__in=duplicates).order_by("pk"):
+            if registration.field_trip_id in registered:
+                registration.delete(using=self.using)
+            else:
+                registered.add(registration.field_trip_id)
+                registrations.filter(pk=registration.pk).update(student_id=keep)
+
+        Transaction.objects.using(self.using).filter(student_id__in=duplicates).update(student_id=keep)
+        TransactionLineItem.objects.using(self.using).filter(student_id__in=duplicates).update(student_id=keep)
+        Student.objects.using(self.using).filter(pk__in=duplicates).delete()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from backend.api.analytics import extract_transactions
+
+
+class Command(BaseCommand):
+    help = "Append the transactions and refunds written since the last run to the columnar analytics table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", help="Defaults to settings.ANALYTICS_DIR")
+
+    def handle(self, *args, **options):
+        summary = extract_transactions(options["directory"])
+        self.stdout.write(self.style.SUCCESS("Extracted {} payments and {} refunds ({} rows in total)".format(
+            summary.payments, summary.refunds, summary.rows,
+        )))
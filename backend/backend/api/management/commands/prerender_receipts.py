@@ -0,0 +1,35 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api.models.field_trip import FieldTrip
+from backend.api.receipts import prerender_field_trip
+from backend.api.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Render the receipts of every payment for a field trip into the receipt cache, so downloads "
+            "after payments close are served from it")
+
+    def add_arguments(self, parser):
+        parser.add_argument("field_trip_id")
+        parser.add_argument("--batch-size", type=int, default=500, help="Receipts rendered per batch")
+        parser.add_argument("--database", action="append", dest="databases",
+                            help="Database holding the transactions; defaults to every shard")
+
+    def handle(self, *args, **options):
+        try:
+            field_trip = FieldTrip.objects.get(pk=options["field_trip_id"])
+        except (FieldTrip.DoesNotExist, ValueError, ValidationError):
+            raise CommandError("Field trip {} does not exist".format(options["field_trip_id"]))
+
+        rendered = cached = 0
+        for alias in options["databases"] or shard_aliases():
+            summary = prerender_field_trip(field_trip.pk, using=alias, batch_size=options["batch_size"],
+                                           progress=self.report_progress)
+            rendered += summary.rendered
+            cached += summary.cached
+        self.stdout.write(self.style.SUCCESS("Rendered {} receipts for {} ({} already cached)".format(
+            rendered, field_trip.location, cached)))
+
+    def report_progress(self, summary):
+        self.stdout.write("{} rendered, {} already cached".format(summary.rendered, summary.cached))
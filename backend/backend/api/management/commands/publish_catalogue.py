@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api.snapshots import publish_catalogue_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the field trip catalogue snapshot served in place of GET /api/fieldtrip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", help="Defaults to settings.CATALOGUE_SNAPSHOT_DIR")
+
+    def handle(self, *args, **options):
+        snapshot = publish_catalogue_snapshot(options["directory"])
+        if snapshot is None:
+            raise CommandError("Set CATALOGUE_SNAPSHOT_DIR or pass --directory")
+        self.stdout.write(self.style.SUCCESS(
+            "Published catalogue {} ({} bytes) to {}".format(snapshot.version, snapshot.size, snapshot.path)
+        ))
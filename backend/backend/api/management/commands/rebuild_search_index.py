@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from backend.api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the student and parent search index, e.g. after bulk imports that bypass model signals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        get_search_backend(options["database"]).rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,48 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.api.models.field_trip import FieldTrip
+from backend.api.refunds import refund_field_trip
+from backend.api.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Cancel a field trip and refund every payment for it. Refunded transactions are recorded as they "
+            "complete, so rerunning the command resumes an interrupted run and retries failed refunds")
+
+    def add_arguments(self, parser):
+        parser.add_argument("field_trip_id")
+        parser.add_argument("--workers", type=int, help="Concurrent gateway calls; defaults to settings.REFUND_WORKERS")
+        parser.add_argument("--database", action="append", dest="databases",
+                            help="Database holding the transactions; defaults to every shard")
+
+    def handle(self, *args, **options):
+        try:
+            field_trip = FieldTrip.objects.get(pk=options["field_trip_id"])
+        except (FieldTrip.DoesNotExist, ValueError, ValidationError):
+            raise CommandError("Field trip {} does not exist".format(options["field_trip_id"]))
+
+        # Cancelled first, so no payment is taken for the trip while its refunds run
+        if field_trip.cancelled_at is None:
+            field_trip.cancelled_at = timezone.now()
+            field_trip.save()
+
+        refunded, failed = 0, {}
+        for alias in options["databases"] or shard_aliases():
+            summary = refund_field_trip(field_trip.pk, using=alias, workers=options["workers"],
+                                        progress=self.report_progress)
+            refunded += summary.refunded
+            failed.update(summary.failed)
+
+        for transaction_id, error in failed.items():
+            self.stderr.write("{}: {}".format(transaction_id, error))
+        message = "Refunded {} payments for {}".format(refunded, field_trip.location)
+        if failed:
+            raise CommandError("{}; {} failed, run the command again to retry them".format(message, len(failed)))
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def report_progress(self, summary):
+        settled = summary.refunded + summary.pending
+        if settled % 100 == 0:
+            self.stdout.write("{} refunded, {} failed".format(summary.refunded, summary.pending))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parent',
+            name='email',
+            field=models.EmailField(db_index=True, max_length=254),
+        ),
+    ]
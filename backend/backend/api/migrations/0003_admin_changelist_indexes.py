@@ -0,0 +1,26 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_parent_email_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='parent',
+            index=models.Index(fields=['last_name', 'first_name'], name='api_parent_last_na_94ec88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['last_name', 'first_name'], name='api_student_last_na_239053_idx'),
+        ),
+    ]
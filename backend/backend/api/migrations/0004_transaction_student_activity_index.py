@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_admin_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['student', 'activity'], name='api_transac_student_877018_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# See backend.api.search for how these are queried and maintained
+
+POSTGRES_INDEXES = {
+    'api_student_name_trgm_idx': "api_student ((lower(first_name || ' ' || last_name)) gin_trgm_ops)",
+    'api_parent_name_trgm_idx': "api_parent ((lower(first_name || ' ' || last_name)) gin_trgm_ops)",
+    'api_parent_email_trgm_idx': 'api_parent (lower(email) gin_trgm_ops)',
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE api_person_search USING fts5(name, email, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO api_person_search(rowid, name, email) "
+            "SELECT id * 2, first_name || ' ' || last_name, '' FROM api_student"
+        )
+        schema_editor.execute(
+            "INSERT INTO api_person_search(rowid, name, email) "
+            "SELECT id * 2 + 1, first_name || ' ' || last_name, email FROM api_parent"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, definition in POSTGRES_INDEXES.items():
+            schema_editor.execute('CREATE INDEX {} ON {}'.format(name, definition))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE api_person_search')
+    elif vendor == 'postgresql':
+        for name in POSTGRES_INDEXES:
+            schema_editor.execute('DROP INDEX {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_transaction_student_activity_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
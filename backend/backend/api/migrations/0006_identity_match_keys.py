@@ -0,0 +1,59 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:31
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+# Frozen copy of backend.api.identity at the time of this migration
+def normalize_identity(value):
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    return ' '.join(unicodedata.normalize('NFKC', value).split())
+
+
+def match_key(*parts):
+    return hashlib.sha256('\x1f'.join(normalize_identity(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def fill_match_keys(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name, fields in (('Parent', ('first_name', 'last_name', 'email')),
+                               ('Student', ('first_name', 'last_name'))):
+        model = apps.get_model('api', model_name)
+        last_pk = 0
+        while True:
+            batch = list(model.objects.using(using).filter(pk__gt=last_pk).order_by('pk').only(*fields)[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                row.match_key = match_key(*(getattr(row, field) for field in fields))
+            model.objects.using(using).bulk_update(batch, ['match_key'])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_person_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parent',
+            name='match_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='match_key',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_match_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['parent', 'school', 'match_key'], name='api_student_parent__13b175_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_identity_match_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='refund_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='refunded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_transaction_refunds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('fieldtrip', 'Field trip'), ('school', 'School')], max_length=16)),
+                ('object_id', models.UUIDField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fieldtrip',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='school',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='fieldtrip',
+            index=models.Index(fields=['updated_at', 'id'], name='api_fieldtr_updated_3dfe63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='school',
+            index=models.Index(fields=['updated_at', 'id'], name='api_school_updated_1d9d8f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cataloguetombstone',
+            index=models.Index(fields=['deleted_at', 'object_id'], name='api_catalog_deleted_436249_idx'),
+        ),
+    ]
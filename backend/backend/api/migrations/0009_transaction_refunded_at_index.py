@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_catalogue_changes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='refunded_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
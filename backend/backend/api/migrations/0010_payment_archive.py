@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-19 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_transaction_refunded_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFieldTripRegistration',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('field_trip_id', models.UUIDField()),
+                ('student_id', models.BigIntegerField(db_index=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('student_id', models.BigIntegerField(db_index=True)),
+                ('activity_id', models.UUIDField()),
+                ('refund_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('refunded_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='fieldtrip',
+            index=models.Index(fields=['date'], name='api_fieldtr_date_f2401d_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-19 20:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_payment_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='activity',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='activities', to='api.fieldtrip'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='student',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='api.student'),
+        ),
+        migrations.CreateModel(
+            name='TransactionLineItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('refund_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('refunded_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('field_trip', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='line_items', to='api.fieldtrip')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='line_items', to='api.student')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='line_items', to='api.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['student', 'field_trip'], name='api_transac_student_cdb22b_idx')],
+            },
+        ),
+    ]
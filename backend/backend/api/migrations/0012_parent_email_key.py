@@ -0,0 +1,48 @@
+# Generated by Django 4.2.28 on 2026-10-19 21:12
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+# Frozen copy of backend.api.identity at the time of this migration
+def normalize_identity(value):
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    return ' '.join(unicodedata.normalize('NFKC', value).split())
+
+
+def email_key(email):
+    return hashlib.sha256(normalize_identity(email).encode('utf-8')).hexdigest()
+
+
+def fill_email_keys(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Parent = apps.get_model('api', 'Parent')
+    last_pk = 0
+    while True:
+        batch = list(Parent.objects.using(using).filter(pk__gt=last_pk).order_by('pk').only('email')[:BATCH_SIZE])
+        if not batch:
+            break
+        for row in batch:
+            row.email_key = email_key(row.email)
+        Parent.objects.using(using).bulk_update(batch, ['email_key'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_transaction_line_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parent',
+            name='email_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_email_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.28 on 2026-10-19 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_parent_email_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransactionLineItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('transaction_id', models.CharField(db_index=True, max_length=100)),
+                ('student_id', models.BigIntegerField(db_index=True)),
+                ('field_trip_id', models.UUIDField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('refund_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('refunded_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archivedtransaction',
+            name='activity_id',
+            field=models.UUIDField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedtransaction',
+            name='student_id',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+    ]
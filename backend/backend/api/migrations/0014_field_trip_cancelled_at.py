@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_archived_cart_transactions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fieldtrip',
+            name='cancelled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import models
+
+
+class ArchivedTransaction(models.Model):
+    """
+    A Transaction moved out of the hot table by `archive_payments`.
+
+    Students and field trips are referenced by id without foreign keys, so archived rows add no
+    constraints or indexes to the tables payments use. A cart transaction has neither; its
+    registrations are in ArchivedTransactionLineItem.
+    """
+    id = models.CharField(max_length=100, primary_key=True, null=False)
+    date = models.DateTimeField(db_index=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    student_id = models.BigIntegerField(db_index=True, null=True)
+    activity_id = models.UUIDField(null=True)
+    refund_id = models.CharField(max_length=100, null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.id
+
+
+class ArchivedTransactionLineItem(models.Model):
+    """
+    A TransactionLineItem moved out of the hot table with its cart's transaction, keeping its id
+    """
+    id = models.BigIntegerField(primary_key=True)
+    transaction_id = models.CharField(max_length=100, db_index=True)
+    student_id = models.BigIntegerField(db_index=True)
+    field_trip_id = models.UUIDField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    refund_id = models.CharField(max_length=100, null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class ArchivedFieldTripRegistration(models.Model):
+    """
+    A FieldTripRegistration moved out of the hot table by `archive_payments`, keeping its id
+    """
+    id = models.BigIntegerField(primary_key=True)
+    field_trip_id = models.UUIDField()
+    student_id = models.BigIntegerField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,23 @@
+from django.db import models
+from django.utils import timezone
+
+
+class CatalogueTombstone(models.Model):
+    """
+    Record of a deleted school or field trip, so the changes feed can report the deletion
+    """
+    FIELD_TRIP = "fieldtrip"
+    SCHOOL = "school"
+    KIND_CHOICES = [(FIELD_TRIP, "Field trip"), (SCHOOL, "School")]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'object_id']),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.kind, self.object_id)
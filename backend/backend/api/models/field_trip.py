@@ -1,15 +1,42 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 from backend.api.models.school import School
 from backend.api.models.student import Student
 
 
+class FieldTripQuerySet(models.QuerySet):
+    def upcoming(self):
+        """
+        Trips from the start of today (local time) on, so a trip stays listed on its own day; cancelled
+        trips are left out
+        """
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.filter(date__gte=today, cancelled_at__isnull=True)
+
+
 class FieldTrip(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     location = models.CharField(max_length=255)
     cost = models.FloatField()
     date = models.DateTimeField()
+    # Bumped on every save (not by queryset.update()); the changes feed pages on it
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set by refund_field_trip; a cancelled trip takes no more payments
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+
+    objects = FieldTripQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+            # upcoming() is a range scan on it; a partial index can't help, as its cut-off moves every day
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return self.location
 
 
 class FieldTripRegistration(models.Model):
@@ -1,9 +1,28 @@
 from django.db import models
 
+from backend.api.identity import parent_email_key, parent_match_key
+
+
 class Parent(models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
-    email = models.EmailField()
+    email = models.EmailField(db_index=True)
+    # parent_match_key() of the fields above, kept up to date by save()
+    match_key = models.CharField(max_length=64, db_index=True, editable=False, default="")
+    # parent_email_key() of the email, kept up to date by save(); looks parents up by email alone
+    email_key = models.CharField(max_length=64, db_index=True, editable=False, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'first_name']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.match_key = parent_match_key(self.first_name, self.last_name, self.email)
+        self.email_key = parent_email_key(self.email)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "match_key", "email_key"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return "{} {}".format(self.first_name, self.last_name)
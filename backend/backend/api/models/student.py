@@ -1,5 +1,6 @@
 from django.db import models
 
+from backend.api.identity import student_match_key
 from backend.api.models.parent import Parent
 from backend.api.models.school import School
 
@@ -9,6 +10,20 @@ class Student(models.Model):
     last_name = models.CharField(max_length=255)
     parent = models.ForeignKey(Parent, related_name='children', on_delete=models.PROTECT)
     school = models.ForeignKey(School, related_name='students', on_delete=models.CASCADE)
+    # student_match_key() of the names, kept up to date by save()
+    match_key = models.CharField(max_length=64, editable=False, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['parent', 'school', 'match_key']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.match_key = student_match_key(self.first_name, self.last_name)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "match_key"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return "{} {}".format(self.first_name, self.last_name)
@@ -6,7 +6,16 @@ from backend.api.models.student import Student
 
 class Transaction(models.Model):
     id = models.CharField(max_length=100, primary_key=True, null=False)
-    date = models.DateTimeField()
+    date = models.DateTimeField(db_index=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    student = models.ForeignKey(Student, related_name='transactions', on_delete=models.PROTECT)
-    activity = models.ForeignKey(FieldTrip, related_name='activities', on_delete=models.PROTECT)
+    # Empty for a cart checkout, whose line items name each student and field trip it paid for
+    student = models.ForeignKey(Student, related_name='transactions', on_delete=models.PROTECT, null=True, blank=True)
+    activity = models.ForeignKey(FieldTrip, related_name='activities', on_delete=models.PROTECT, null=True, blank=True)
+    # Set once the gateway has refunded the payment; refund_field_trip() skips refunded transactions
+    refund_id = models.CharField(max_length=100, null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'activity']),
+        ]
@@ -0,0 +1,26 @@
+from django.db import models
+
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.student import Student
+from backend.api.models.transaction import Transaction
+
+
+class TransactionLineItem(models.Model):
+    """
+    One registration paid by a cart checkout, whose transaction is the single gateway charge for the cart.
+
+    Like a single-registration Transaction, a line item names the registration by its student and field
+    trip. Lines are refunded one by one, as partial refunds of their transaction.
+    """
+    transaction = models.ForeignKey(Transaction, related_name='line_items', on_delete=models.PROTECT)
+    student = models.ForeignKey(Student, related_name='line_items', on_delete=models.PROTECT)
+    field_trip = models.ForeignKey(FieldTrip, related_name='line_items', on_delete=models.PROTECT)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Set once the gateway has refunded this line; refund_field_trip() skips refunded lines
+    refund_id = models.CharField(max_length=100, null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'field_trip']),
+        ]
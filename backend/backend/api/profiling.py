@@ -0,0 +1,201 @@
+"""
+Request profiling for production latency investigations.
+
+With `settings.PROFILING_ENABLED`, ProfilingMiddleware profiles:
+
+- a random `PROFILING_SAMPLE_RATE` fraction of requests
+- any request slower than `PROFILING_SLOW_MS`: every request is sampled, and the profile kept only
+  when the request turns out slow
+- requests carrying `X-Profile: <PROFILING_TOKEN>`, which get the profile's file name back in
+  `X-Profile-Id`; `X-Profile-Mode: cprofile` picks the profiler
+
+The default profiler is a statistical sampler: one background thread reads the stacks of the
+threads serving profiled requests every `PROFILING_INTERVAL` seconds, so the request itself runs at
+full speed. Its profiles are collapsed stacks (`frame;frame;frame count` lines) that flamegraph.pl,
+speedscope and inferno load as is. `cprofile` records every call, at a large slowdown, and writes
+pstats files for `python -m pstats` or snakeviz.
+
+Profiles go to `PROFILING_DIR`, which keeps the newest `PROFILING_KEEP` files. When profiling is
+disabled the middleware removes itself from the stack, so it costs nothing.
+"""
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_HEADER = "X-Profile"
+MODE_HEADER = "X-Profile-Mode"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+SAMPLER = "sampler"
+CPROFILE = "cprofile"
+
+
+def collapse_stack(frame):
+    """
+    A frame's stack, outermost first, as one collapsed-stack line without the count
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append("{}:{}".format(frame.f_globals.get("__name__", "?"), getattr(code, "co_qualname", code.co_name)))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    One daemon thread sampling the stacks of the registered threads every `interval` seconds.
+
+    The thread only runs while some thread is registered.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        """
+        The collapsed stacks sampled from the thread since `start`, with their counts
+        """
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse_stack(frame)] += 1
+
+
+def _profile_name(request, elapsed_ms, extension):
+    path = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_")[:60] or "root"
+    return "{}-{}-{}-{}ms.{}".format(
+        datetime.now().strftime("%Y%m%dT%H%M%S.%f"), request.method, path, int(elapsed_ms), extension,
+    )
+
+
+def _prune(directory, keep):
+    # Names start with the time they were written, so they sort oldest first
+    profiles = sorted(path for path in directory.iterdir() if path.suffix in (".collapsed", ".prof"))
+    for path in profiles[:-keep]:
+        path.unlink(missing_ok=True)
+
+
+def write_profile(request, elapsed_ms, extension, write):
+    """
+    Store a profile in the PROFILING_DIR ring buffer; `write(path)` writes it. Returns the file name.
+    """
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = _profile_name(request, elapsed_ms, extension)
+
+    # Written under a dot name and renamed, so tools watching the directory never load a partial profile
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".{}.".format(name))
+    os.close(descriptor)
+    try:
+        write(temporary)
+        os.replace(temporary, directory / name)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    _prune(directory, settings.PROFILING_KEEP)
+    return name
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sampler = StackSampler(settings.PROFILING_INTERVAL)
+        # Only one cProfile profiler can be active per process; other requests fall back to the sampler
+        self.cprofile_lock = threading.Lock()
+
+    def __call__(self, request):
+        requested = self._requested(request)
+        sampled = requested or random.random() < settings.PROFILING_SAMPLE_RATE
+        if not sampled and settings.PROFILING_SLOW_MS is None:
+            return self.get_response(request)
+
+        mode = settings.PROFILING_MODE
+        if requested:
+            mode = request.headers.get(MODE_HEADER, mode)
+        # Requests watched only in case they turn out slow always get the sampler
+        if sampled and mode == CPROFILE and self.cprofile_lock.acquire(blocking=False):
+            try:
+                return self._cprofile(request, requested)
+            finally:
+                self.cprofile_lock.release()
+        return self._sample(request, requested, keep=sampled)
+
+    @staticmethod
+    def _requested(request):
+        token = request.headers.get(PROFILE_HEADER)
+        return bool(token and settings.PROFILING_TOKEN and hmac.compare_digest(token, settings.PROFILING_TOKEN))
+
+    @staticmethod
+    def _slow(elapsed_ms):
+        return settings.PROFILING_SLOW_MS is not None and elapsed_ms >= settings.PROFILING_SLOW_MS
+
+    def _sample(self, request, requested, keep):
+        thread_id = threading.get_ident()
+        started = time.perf_counter()
+        self.sampler.start(thread_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = self.sampler.stop(thread_id)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if keep or self._slow(elapsed_ms):
+            def write(path):
+                with open(path, "w") as file:
+                    file.writelines("{} {}\n".format(stack, count) for stack, count in samples.most_common())
+
+            name = write_profile(request, elapsed_ms, "collapsed", write)
+            if requested:
+                response[PROFILE_ID_HEADER] = name
+        return response
+
+    def _cprofile(self, request, requested):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        name = write_profile(request, elapsed_ms, "prof", profiler.dump_stats)
+        if requested:
+            response[PROFILE_ID_HEADER] = name
+        return response
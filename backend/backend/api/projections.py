@@ -0,0 +1,87 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+from backend.api.serializers import FieldTripSerializer
+
+
+def _iso_datetime(field):
+    field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+
+    def convert(value):
+        if field_timezone is not None and timezone.is_aware(value):
+            value = value.astimezone(field_timezone)
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    return convert
+
+
+def _unchanged(value):
+    return value
+
+
+def compile_converter(field):
+    """
+    A function turning a database value into what `field.to_representation` returns, without
+    going through the field
+    """
+    if isinstance(field, serializers.UUIDField) and field.uuid_format == "hex_verbose":
+        return str
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        if output_format is None:
+            # The field leaves datetimes to the renderer
+            return _unchanged
+        if output_format.lower() == ISO_8601:
+            return _iso_datetime(field)
+    return field.to_representation
+
+
+class ValuesProjection:
+    """
+    Serializer output for a queryset, read with `.values_list()` instead of model instances.
+
+    The serializer's fields are bound once and turned into per-column converters, so each row costs
+    a tuple and a dict rather than a model instance and a pass through every serializer field.
+    `shared` gives the representation of fields that are the same on every row (computed once).
+    Every other field must read a plain model field.
+    """
+
+    def __init__(self, serializer_class, **shared):
+        self.plan = []
+        self.sources = []
+        for name, field in serializer_class().fields.items():
+            if name in shared:
+                self.plan.append((name, None, shared[name]))
+                continue
+            if isinstance(field, serializers.SerializerMethodField) or "." in field.source:
+                raise ImproperlyConfigured("{}.{} is not a plain model field".format(serializer_class.__name__, name))
+            self.plan.append((name, len(self.sources), compile_converter(field)))
+            self.sources.append(field.source)
+
+    def rows(self, queryset):
+        plan = self.plan
+        for values in queryset.values_list(*self.sources):
+            row = {}
+            for name, position, convert_or_shared in plan:
+                if position is None:
+                    row[name] = convert_or_shared
+                else:
+                    value = values[position]
+                    row[name] = None if value is None else convert_or_shared(value)
+            yield row
+
+
+def field_trip_rows(queryset):
+    """
+    `FieldTripSerializer(queryset, many=True).data`, with the school list read once rather than per trip
+    """
+    schools = [
+        {"id": str(school["id"]), "name": school["name"]}
+        for school in FieldTripSerializer.available_schools(None)
+    ]
+    return list(ValuesProjection(FieldTripSerializer, schools=schools).rows(queryset))
@@ -0,0 +1,73 @@
+"""
+Receipt rendering, run in the receipt process pool.
+
+This module imports nothing from Django, so pool processes start without setting it up. Receipts
+are rendered from the plain `content` dict built by `backend.api.receipts.receipt_content()`; the
+receipt of a cart checkout lists its line items under `items`.
+Bump TEMPLATE_VERSION whenever the output changes, so receipts cached under the old template are
+rendered again.
+"""
+from html import escape
+from string import Template
+
+TEMPLATE_VERSION = "1"
+
+RECEIPT_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Receipt $transaction_id</title>
+<style>
+body { font-family: system-ui, sans-serif; max-width: 36rem; margin: 2rem auto; color: #222; }
+h1 { font-size: 1.5rem; }
+table { width: 100%; border-collapse: collapse; }
+th, td { text-align: left; padding: 0.4rem 0; border-bottom: 1px solid #ddd; }
+.total td { font-weight: bold; }
+.refunded { color: #a00; }
+</style>
+</head>
+<body>
+<h1>Payment receipt</h1>
+<p>Receipt for transaction <strong>$transaction_id</strong>, paid on $paid_at.</p>
+<table>
+<tr><th>Parent</th><td>$parent &lt;$email&gt;</td></tr>
+$details
+<tr class="total"><th>Amount paid</th><td>$$$amount</td></tr>
+</table>
+$refund
+</body>
+</html>
+""")
+
+DETAILS_TEMPLATE = Template("""<tr><th>Student</th><td>$student</td></tr>
+<tr><th>School</th><td>$school</td></tr>
+<tr><th>Field trip</th><td>$field_trip, $trip_date</td></tr>""")
+
+# One row per line item of a cart checkout
+ITEM_TEMPLATE = Template("<tr><th>$student</th><td>$field_trip, $trip_date ($school): $$$amount$refund</td></tr>")
+
+REFUND_TEMPLATE = Template('<p class="refunded">Refunded on $refunded_at (refund $refund_id).</p>')
+
+ITEM_REFUND_TEMPLATE = Template(' <span class="refunded">refunded on $refunded_at (refund $refund_id)</span>')
+
+
+def _escaped(content):
+    return {name: escape(str(value)) for name, value in content.items() if value is not None and name != "items"}
+
+
+def render_receipt(content):
+    """
+    The receipt for `content` as UTF-8 HTML
+    """
+    values = _escaped(content)
+    values["refund"] = REFUND_TEMPLATE.substitute(values) if content.get("refund_id") else ""
+    if "items" in content:
+        rows = []
+        for item in content["items"]:
+            item_values = _escaped(item)
+            item_values["refund"] = ITEM_REFUND_TEMPLATE.substitute(item_values) if item.get("refund_id") else ""
+            rows.append(ITEM_TEMPLATE.substitute(item_values))
+        values["details"] = "\n".join(rows)
+    else:
+        values["details"] = DETAILS_TEMPLATE.substitute(values)
+    return RECEIPT_TEMPLATE.substitute(values).encode("utf-8")
@@ -0,0 +1,218 @@
+"""
+Payment receipts, rendered off the API workers and cached by content.
+
+A receipt is rendered from `receipt_content()`, the plain values printed on it, and stored under
+the sha256 of those values and the template version:
+
+    settings.RECEIPT_DIR/<key[:2]>/<key>.html
+
+Repeat downloads are read from the file. A transaction whose receipt changes (a refund, a renamed
+school) hashes to a new key and is rendered again; the old file is simply no longer read.
+
+Rendering is CPU-bound, so it runs in a process pool of `settings.RECEIPT_WORKERS` processes
+started with `spawn`, which only import `backend.api.receipt_render`. The API worker thread waits
+for the result without holding the GIL. With `RECEIPT_WORKERS = 0` receipts render inline.
+`prerender_field_trip()` renders a whole trip's receipts in bulk once payments close.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.api.exceptions import ReceiptUnavailable
+from backend.api.models.transaction import Transaction
+from backend.api.receipt_render import TEMPLATE_VERSION, render_receipt
+
+DATE_FORMAT = "%d %B %Y"
+DATETIME_FORMAT = "%d %B %Y, %H:%M"
+
+
+@dataclass
+class PrerenderSummary:
+    rendered: int = 0
+    cached: int = 0
+
+
+def receipt_transactions(using=None):
+    """
+    Transactions with everything printed on their receipt, in one query
+    """
+    queryset = Transaction.objects.select_related("student__parent", "student__school", "activity").prefetch_related(
+        "line_items__student__parent", "line_items__student__school", "line_items__field_trip",
+    )
+    return queryset.using(using) if using else queryset
+
+
+def _formatted_datetime(value):
+    return timezone.localtime(value).strftime(DATETIME_FORMAT) if value else None
+
+
+def _registration_content(student, trip):
+    return {
+        "student": "{} {}".format(student.first_name, student.last_name),
+        "school": student.school.name,
+        "field_trip": trip.location,
+        "trip_date": timezone.localtime(trip.date).strftime(DATE_FORMAT),
+    }
+
+
+def receipt_content(transaction):
+    """
+    The values printed on a transaction's receipt, as strings; the transaction must come from
+    `receipt_transactions()`. A cart checkout's line items are listed under `items`.
+    """
+    line_items = list(transaction.line_items.all())
+    student = transaction.student or line_items[0].student
+    content = {
+        "transaction_id": transaction.id,
+        "paid_at": _formatted_datetime(transaction.date),
+        "amount": "{:.2f}".format(transaction.amount),
+        "parent": "{} {}".format(student.parent.first_name, student.parent.last_name),
+        "email": student.parent.email,
+        "refund_id": transaction.refund_id,
+        "refunded_at": _formatted_datetime(transaction.refunded_at),
+    }
+    if transaction.activity_id is not None:
+        content.update(_registration_content(student, transaction.activity))
+    else:
+        content["items"] = [
+            {
+                **_registration_content(line_item.student, line_item.field_trip),
+                "amount": "{:.2f}".format(line_item.amount),
+                "refund_id": line_item.refund_id,
+                "refunded_at": _formatted_datetime(line_item.refunded_at),
+            }
+            for line_item in line_items
+        ]
+    return content
+
+
+def receipt_key(content):
+    canonical = json.dumps([TEMPLATE_VERSION, content], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def receipt_path(key):
+    return Path(settings.RECEIPT_DIR) / key[:2] / "{}.html".format(key)
+
+
+def _store(key, body):
+    path = receipt_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=".{}.".format(path.name))
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(body)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _cached(key):
+    try:
+        return receipt_path(key).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def receipt_pool():
+    """
+    This process's receipt rendering pool, or None when `settings.RECEIPT_WORKERS` is 0
+    """
+    global _pool, _pool_pid
+    if settings.RECEIPT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        # A forked worker can't use its parent's pool
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=settings.RECEIPT_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool, cancel_futures=True):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=cancel_futures)
+
+
+def _render(contents, timeout=None):
+    pool = receipt_pool()
+    if pool is None:
+        return [render_receipt(content) for content in contents]
+    chunksize = max(1, len(contents) // (settings.RECEIPT_WORKERS * 4))
+    try:
+        return list(pool.map(render_receipt, contents, timeout=timeout, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A pool process died; the next render starts a new pool
+        _discard_pool(pool)
+        raise
+    except TimeoutError:
+        # A stuck render holds a pool process, so the next render starts a new pool. Renders already
+        # queued on this one still finish for the requests waiting on them.
+        _discard_pool(pool, cancel_futures=False)
+        raise
+
+
+def get_receipt(content, key=None):
+    """
+    The receipt for `content`, rendered and stored unless it is cached
+    """
+    key = key or receipt_key(content)
+    body = _cached(key)
+    if body is None:
+        try:
+            body, = _render([content], timeout=settings.RECEIPT_RENDER_TIMEOUT)
+        except (BrokenProcessPool, TimeoutError):
+            raise ReceiptUnavailable()
+        _store(key, body)
+    return body
+
+
+def prerender_field_trip(field_trip_id, using=None, batch_size=500, progress=None):
+    """
+    Render every receipt of a field trip that isn't cached yet; `progress(summary)` is called per batch
+    """
+    summary = PrerenderSummary()
+    queryset = (receipt_transactions(using)
+                .filter(Q(activity_id=field_trip_id) | Q(line_items__field_trip_id=field_trip_id))
+                .distinct().order_by("pk"))
+    last_pk = None
+    while True:
+        page = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:batch_size])
+        if not page:
+            return summary
+        last_pk = page[-1].pk
+
+        missing = {}
+        for transaction in page:
+            content = receipt_content(transaction)
+            key = receipt_key(content)
+            if receipt_path(key).exists():
+                summary.cached += 1
+            else:
+                missing[key] = content
+        for key, body in zip(missing, _render(list(missing.values()))):
+            _store(key, body)
+        summary.rendered += len(missing)
+        if progress is not None:
+            progress(summary)
@@ -0,0 +1,132 @@
+"""
+School and FieldTrip rows for the payment path, cached by primary key.
+
+Payments only need reference data to check that the school and field trip exist and to read the
+trip's cost, and those rows rarely change. `schools` and `field_trips` look rows up in this
+process's LRUCache first (`REFERENCE_CACHE_SIZE` rows, `REFERENCE_CACHE_TTL` seconds). When
+`REFERENCE_SHARED_CACHE` names a cache in CACHES, it is consulted next, so workers fill it for each
+other. The database is read only for the rest, in one query.
+
+Saving or deleting a school or field trip drops it from this process's cache and the shared cache
+(see backend/api/signals.py). Other processes see the change once their own copy expires, after
+`REFERENCE_CACHE_TTL` seconds at the latest. Ids that don't exist aren't cached.
+"""
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from backend.api.cache import LRUCache
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.school import School
+
+
+def _shared_cache():
+    alias = getattr(settings, "REFERENCE_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
+
+class ReferenceCache:
+    """
+    Rows of `model` by primary key: in process, then in the shared cache when configured, then from the database
+    """
+
+    def __init__(self, model, maxsize=1024, ttl=60):
+        self.model = model
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self._prefix = "reference_{}_".format(model._meta.label_lower)
+
+    def _key(self, pk):
+        try:
+            return str(self.model._meta.pk.to_python(pk))
+        except ValidationError:
+            return None
+
+    def get_many(self, pks):
+        """
+        `{pk: instance}` for the given pks that exist; each instance is a copy the caller may change
+        """
+        found, missing = {}, {}
+        for pk in pks:
+            key = self._key(pk)
+            if key is None:
+                continue
+            instance = self.local.get(key)
+            if instance is None:
+                missing[key] = pk
+            else:
+                found[pk] = instance
+
+        shared = _shared_cache()
+        if missing and shared is not None:
+            cached = shared.get_many([self._prefix + key for key in missing])
+            self.shared_hits += len(cached)
+            self.shared_misses += len(missing) - len(cached)
+            for key in list(missing):
+                instance = cached.get(self._prefix + key)
+                if instance is not None:
+                    self.local.set(key, instance)
+                    found[missing.pop(key)] = instance
+
+        if missing:
+            loaded = {}
+            for instance in self.model.objects.filter(pk__in=list(missing.values())):
+                key = str(instance.pk)
+                self.local.set(key, instance)
+                loaded[self._prefix + key] = instance
+                found[missing[key]] = instance
+            if loaded and shared is not None:
+                shared.set_many(loaded, timeout=settings.REFERENCE_SHARED_CACHE_TTL)
+
+        return {pk: copy.copy(instance) for pk, instance in found.items()}
+
+    def get(self, pk):
+        """
+        The row with primary key `pk`, or None
+        """
+        return self.get_many([pk]).get(pk)
+
+    def invalidate(self, pk):
+        key = self._key(pk)
+        if key is None:
+            return
+        self.local.delete(key)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.delete(self._prefix + key)
+
+    def clear(self):
+        """
+        Drop this process's rows and reset the counters
+        """
+        self.local.clear()
+        self.local.hits = self.local.misses = 0
+        self.shared_hits = self.shared_misses = 0
+
+    def stats(self):
+        stats = self.local.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        if _shared_cache() is not None:
+            stats["shared_hits"] = self.shared_hits
+            stats["shared_misses"] = self.shared_misses
+        return stats
+
+
+schools = ReferenceCache(
+    School, getattr(settings, "REFERENCE_CACHE_SIZE", 1024), getattr(settings, "REFERENCE_CACHE_TTL", 60),
+)
+field_trips = ReferenceCache(
+    FieldTrip, getattr(settings, "REFERENCE_CACHE_SIZE", 1024), getattr(settings, "REFERENCE_CACHE_TTL", 60),
+)
+
+
+def invalidate_reference(sender, instance, **kwargs):
+    (schools if sender is School else field_trips).invalidate(instance.pk)
+
+
+def reference_cache_stats():
+    return {"schools": schools.stats(), "field_trips": field_trips.stats()}
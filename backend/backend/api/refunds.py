@@ -0,0 +1,113 @@
+"""
+Refunding every payment for a cancelled field trip.
+
+Each refund is a gateway round trip of a second or more, so refunds run on a bounded pool of
+`settings.REFUND_WORKERS` threads that only talk to the gateway. The calling thread reads pending
+transactions in primary-key pages, keeps at most two refunds per worker in flight, and records each
+refund on its transaction as soon as the gateway returns it. The recorded `refund_id` is the
+checkpoint: a run that stops part way (a crash, a deploy, Ctrl-C) is resumed by running it again,
+which only picks up transactions without one. Failed refunds are left pending for the next run.
+
+A cart checkout paid several registrations with one transaction, so the trip's line items of it are
+refunded one by one, as partial refunds of that transaction, and checkpointed on the line item.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from backend.api.audit import audited_refund
+from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
+from backend.legacy_api import LegacyPaymentProcessor
+
+
+@dataclass
+class RefundSummary:
+    refunded: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def pending(self):
+        return len(self.failed)
+
+
+def _pending_refunds(field_trip_id, using, batch_size):
+    """
+    `(model, pk, transaction id, amount)` of every unrefunded payment for the trip: its single-registration
+    transactions, then its line items of cart checkouts, each refunded as a partial refund of its transaction
+    """
+    for queryset, fields in [
+        (Transaction.objects.using(using).filter(activity_id=field_trip_id, refund_id__isnull=True),
+         ["pk", "id", "amount"]),
+        (TransactionLineItem.objects.using(using).filter(field_trip_id=field_trip_id, refund_id__isnull=True),
+         ["pk", "transaction_id", "amount"]),
+    ]:
+        queryset = queryset.order_by("pk")
+        last_pk = None
+        while True:
+            page = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))
+                        .values_list(*fields)[:batch_size])
+            if not page:
+                break
+            for pk, transaction_id, amount in page:
+                yield queryset.model, pk, transaction_id, amount
+            last_pk = page[-1][0]
+
+
+def refund_field_trip(field_trip_id, using=DEFAULT_DB_ALIAS, workers=None, batch_size=500, progress=None):
+    """
+    Refund every unrefunded transaction for a field trip on the `using` database.
+
+    `progress(summary)` is called on the calling thread after each refund settles.
+    """
+    workers = workers or settings.REFUND_WORKERS
+    gateway = LegacyPaymentProcessor()
+    summary = RefundSummary()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refund") as executor:
+        in_flight = {}
+
+        def settle(done):
+            for future in done:
+                model, pk, label = in_flight.pop(future)
+                try:
+                    response = future.result()
+                except Exception as error:
+                    summary.failed[label] = str(error) or error.__class__.__name__
+                else:
+                    if response.success:
+                        # Checkpoint before anything else can go wrong, so a rerun doesn't refund twice
+                        model.objects.using(using).filter(pk=pk, refund_id__isnull=True).update(
+                            refund_id=response.refund_id, refunded_at=timezone.now(),
+                        )
+                        summary.refunded += 1
+                    else:
+                        summary.failed[label] = response.error_message
+                if progress:
+                    progress(summary)
+
+        try:
+            for model, pk, transaction_id, amount in _pending_refunds(field_trip_id, using, batch_size):
+                if len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    settle(done)
+                # A line item is reported as "<transaction id>/<line item id>"
+                label = transaction_id if model is Transaction else "{}/{}".format(transaction_id, pk)
+                future = executor.submit(audited_refund, gateway, transaction_id, float(amount))
+                in_flight[future] = (model, pk, label)
+        except BaseException:
+            # Stopped early (e.g. Ctrl-C): drop the refunds not yet sent, but record the ones that were
+            for future in list(in_flight):
+                if future.cancel():
+                    del in_flight[future]
+            raise
+        finally:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                settle(done)
+
+    return summary
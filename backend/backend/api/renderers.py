@@ -0,0 +1,69 @@
+import math
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Floats that Python's json and orjson write identically: both use the shortest round-tripping
+# digits, but differ once Python switches to exponents ("1e+16" vs "1e16", "1e-05" vs "0.00001")
+_MIN_PLAIN_FLOAT = 1e-4
+_MAX_PLAIN_FLOAT = 1e16
+
+
+def _orjson_compatible(data):
+    """
+    Whether orjson renders `data` exactly like JSONRenderer: only JSON-native types with string
+    keys, and floats that need no exponent
+    """
+    pending = [data]
+    # Containers repeated across rows (e.g. a shared list) are checked once
+    checked = set()
+    while pending:
+        item = pending.pop()
+        if item is None or isinstance(item, (str, int)):
+            continue
+        if isinstance(item, float):
+            if not (math.isfinite(item) and (item == 0 or _MIN_PLAIN_FLOAT <= abs(item) < _MAX_PLAIN_FLOAT)):
+                return False
+        elif isinstance(item, (list, tuple, dict)):
+            if id(item) in checked:
+                continue
+            checked.add(id(item))
+            if isinstance(item, dict):
+                if not all(isinstance(key, str) for key in item):
+                    return False
+                pending.extend(item.values())
+            else:
+                pending.extend(item)
+        else:
+            return False
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte-for-byte what JSONRenderer produces with the default UNICODE_JSON, COMPACT_JSON
+    and STRICT_JSON settings. Anything orjson would write differently (other settings, an indent,
+    non-JSON types, floats needing an exponent) is left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None
+                or not (api_settings.UNICODE_JSON and api_settings.COMPACT_JSON and api_settings.STRICT_JSON)
+                or self.get_indent(accepted_media_type, renderer_context or {})
+                or not _orjson_compatible(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, so the output is also valid JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -0,0 +1,152 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Set while a view that tolerates replication lag is handling a request
+_replica_reads = ContextVar("replica_reads", default=False)
+# Set once the current request has written, so it reads its own writes
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+# Database alias holding the school whose data the current code works on
+_current_shard = ContextVar("current_shard", default=None)
+
+# Per-school data; everything else (schools, field trips) is catalogue, written to the primary
+SHARDED_MODELS = {
+    "api.parent", "api.student", "api.fieldtripregistration", "api.transaction", "api.transactionlineitem",
+    "api.archivedfieldtripregistration", "api.archivedtransaction", "api.archivedtransactionlineitem",
+}
+
+
+@contextmanager
+def replica_reads():
+    """
+    Allow reads inside the block to go to a replica until the first write
+    """
+    reads_token = _replica_reads.set(True)
+    pinned_token = _pinned_to_primary.set(False)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(pinned_token)
+        _replica_reads.reset(reads_token)
+
+
+def primary_database():
+    return getattr(settings, "DATABASE_PRIMARY", DEFAULT_DB_ALIAS)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to `settings.DATABASE_REPLICAS` inside `replica_reads()`, everything else to
+    `settings.DATABASE_PRIMARY` ('default' unless set)
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if replicas and _replica_reads.get() and not _pinned_to_primary.get():
+            return random.choice(replicas)
+        return primary_database()
+
+    def db_for_write(self, model, **hints):
+        _pinned_to_primary.set(True)
+        return primary_database()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def shard_for_school(school_id):
+    """
+    Alias of the database holding a school's parents, students, registrations and transactions
+    """
+    return getattr(settings, "SCHOOL_SHARDS", {}).get(str(school_id), primary_database())
+
+
+def shard_aliases():
+    """
+    Every shard, the primary first; just the primary when sharding isn't configured
+    """
+    primary = primary_database()
+    return [primary] + sorted(set(getattr(settings, "SCHOOL_SHARDS", {}).values()) - {primary})
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Route sharded models to `alias` inside the block
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def fan_out(function, aliases=None, max_workers=None):
+    """
+    Call `function(alias)` for every shard in parallel, each inside `use_shard(alias)`; returns the results
+    in shard order
+    """
+    aliases = list(aliases or shard_aliases())
+    if len(aliases) == 1:
+        with use_shard(aliases[0]):
+            return [function(aliases[0])]
+
+    def call(alias):
+        try:
+            with use_shard(alias):
+                return function(alias)
+        finally:
+            # Connections belong to the worker thread, which the pool may drop
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(aliases)) as executor:
+        return list(executor.map(call, aliases))
+
+
+class SchoolShardRouter:
+    """
+    Send sharded models to the shard selected with `use_shard()`, or to the database of the instance they
+    relate to. Catalogue models, and sharded models outside a shard, fall through to the next router.
+    """
+
+    def _shard(self, model, **hints):
+        if model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        shard = _current_shard.get()
+        instance = hints.get("instance")
+        if shard is None and instance is not None and instance._state.db in shard_aliases()[1:]:
+            shard = instance._state.db
+        return shard
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, **hints)
+
+
+def mirror_to_shards(sender, instance, using, **kwargs):
+    """
+    Copy a catalogue row saved on the primary to every other shard, so joins and foreign keys there hold
+    """
+    if using != primary_database():
+        return
+    values = {field.attname: getattr(instance, field.attname)
+              for field in sender._meta.concrete_fields if not field.primary_key}
+    for alias in shard_aliases()[1:]:
+        sender._base_manager.using(alias).update_or_create(pk=instance.pk, defaults=values)
+
+
+def unmirror_from_shards(sender, instance, using, **kwargs):
+    if using != primary_database():
+        return
+    for alias in shard_aliases()[1:]:
+        sender._base_manager.using(alias).filter(pk=instance.pk).delete()
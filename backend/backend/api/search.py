@@ -0,0 +1,240 @@
+"""
+Indexed fuzzy search over students and parents.
+
+The backend is picked from the database vendor:
+
+- SQLite: an FTS5 table with the trigram tokenizer (`api_person_search`), kept up to date by the
+  Student/Parent post_save and post_delete signals. Rows are keyed by rowid (students on even
+  rowids, parents on odd ones), so every update is an indexed point write.
+- PostgreSQL: pg_trgm GIN indexes on the name and email columns, maintained by Postgres itself.
+- Anything else: case-insensitive substring scans.
+
+A query first looks for rows containing every term (prefix and substring matches). If there are
+none, it falls back to typo-tolerant matching: rows sharing a trigram with every term and at least
+half of the query's trigrams overall, ranked by how many they share.
+"""
+from django.db import connections
+from django.db.models import Q
+
+from backend.api.models.parent import Parent
+from backend.api.models.student import Student
+
+STUDENT = "student"
+PARENT = "parent"
+
+SQLITE_TABLE = "api_person_search"
+
+# Created by migration 0005_person_search_index
+SQLITE_CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(name, email, tokenize='trigram')".format(SQLITE_TABLE)
+)
+
+# Rows containing every term are equally good, so the exact search can stop at the limit
+# instead of ranking every match. `{kind_filter}` keeps one kind before the limit applies.
+SQLITE_EXACT_SEARCH = "SELECT rowid, name, email FROM {table} WHERE {table} MATCH %s{kind_filter} LIMIT %s"
+
+SQLITE_FUZZY_SEARCH = (
+    "SELECT rowid, name, email FROM {table} WHERE {table} MATCH %s{kind_filter} ORDER BY rank LIMIT %s"
+)
+
+# Share of the query's trigrams a fuzzy match must contain
+FUZZY_MIN_OVERLAP = 0.5
+
+
+def query_terms(query):
+    """
+    Lower-cased terms of at least three characters, the shortest a trigram index can match
+    """
+    return [term for term in query.lower().split() if len(term) >= 3]
+
+
+def trigrams(term):
+    return [term[index:index + 3] for index in range(len(term) - 2)]
+
+
+def trigram_overlap(query_trigrams, *texts):
+    found = {trigram for text in texts for word in text.lower().split() for trigram in trigrams(word)}
+    return len(query_trigrams & found) / len(query_trigrams)
+
+
+def _quote(text):
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def fts_exact_query(terms):
+    """
+    FTS5 query matching rows that contain every term
+    """
+    return " AND ".join(_quote(term) for term in terms)
+
+
+def fts_fuzzy_query(terms):
+    """
+    FTS5 query matching rows that share a trigram with each term, ranked by how many they share
+    """
+    return " AND ".join(
+        "({})".format(" OR ".join(_quote(trigram) for trigram in dict.fromkeys(trigrams(term))))
+        for term in terms
+    )
+
+
+def sqlite_rowid(kind, pk):
+    return pk * 2 + (1 if kind == PARENT else 0)
+
+
+def _sqlite_document(kind, instance):
+    name = "{} {}".format(instance.first_name, instance.last_name)
+    return sqlite_rowid(kind, instance.pk), name, instance.email if kind == PARENT else ""
+
+
+class SQLiteFTSSearchBackend:
+    def __init__(self, using):
+        self.connection = connections[using]
+
+    def index(self, kind, instance):
+        rowid, name, email = _sqlite_document(kind, instance)
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {} WHERE rowid = %s".format(SQLITE_TABLE), [rowid])
+            cursor.execute("INSERT INTO {}(rowid, name, email) VALUES (%s, %s, %s)".format(SQLITE_TABLE),
+                           [rowid, name, email])
+
+    def remove(self, kind, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {} WHERE rowid = %s".format(SQLITE_TABLE), [sqlite_rowid(kind, pk)])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(SQLITE_TABLE))
+            cursor.execute(
+                "INSERT INTO {}(rowid, name, email) "
+                "SELECT id * 2, first_name || ' ' || last_name, '' FROM api_student".format(SQLITE_TABLE)
+            )
+            cursor.execute(
+                "INSERT INTO {}(rowid, name, email) "
+                "SELECT id * 2 + 1, first_name || ' ' || last_name, email FROM api_parent".format(SQLITE_TABLE)
+            )
+
+    def search(self, query, kinds, limit):
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        kind_filter, kind_params = "", []
+        if len(kinds) == 1:
+            # A kind is the rowid's parity
+            kind_filter, kind_params = " AND rowid %% 2 = %s", [1 if PARENT in kinds else 0]
+        exact_search = SQLITE_EXACT_SEARCH.format(table=SQLITE_TABLE, kind_filter=kind_filter)
+        fuzzy_search = SQLITE_FUZZY_SEARCH.format(table=SQLITE_TABLE, kind_filter=kind_filter)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(exact_search, [fts_exact_query(terms)] + kind_params + [limit])
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.execute(fuzzy_search, [fts_fuzzy_query(terms)] + kind_params + [limit])
+                query_trigrams = {trigram for term in terms for trigram in trigrams(term)}
+                rows = [
+                    row for row in cursor.fetchall()
+                    if trigram_overlap(query_trigrams, row[1], row[2]) >= FUZZY_MIN_OVERLAP
+                ]
+
+        return [(PARENT if rowid % 2 else STUDENT, rowid // 2) for rowid, _, _ in rows]
+
+
+class PostgresTrigramSearchBackend:
+    def __init__(self, using):
+        self.connection = connections[using]
+
+    def index(self, kind, instance):
+        pass
+
+    def remove(self, kind, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, kinds, limit):
+        query = " ".join(query_terms(query))
+        if not query:
+            return []
+
+        selects = []
+        params = []
+        if STUDENT in kinds:
+            selects.append(
+                "SELECT 'student', id, similarity(lower(first_name || ' ' || last_name), %s) AS score "
+                "FROM api_student WHERE lower(first_name || ' ' || last_name) %% %s "
+                "OR lower(first_name || ' ' || last_name) LIKE %s"
+            )
+            params += [query, query, "%{}%".format(query)]
+        if PARENT in kinds:
+            selects.append(
+                "SELECT 'parent', id, GREATEST(similarity(lower(first_name || ' ' || last_name), %s), "
+                "similarity(lower(email), %s)) AS score "
+                "FROM api_parent WHERE lower(first_name || ' ' || last_name) %% %s OR lower(email) %% %s "
+                "OR lower(first_name || ' ' || last_name) LIKE %s OR lower(email) LIKE %s"
+            )
+            params += [query, query, query, query, "%{}%".format(query), "%{}%".format(query)]
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(" UNION ALL ".join(selects) + " ORDER BY score DESC LIMIT %s", params + [limit])
+            return [(kind, pk) for kind, pk, _ in cursor.fetchall()]
+
+
+class SubstringSearchBackend:
+    def __init__(self, using):
+        self.using = using
+
+    def index(self, kind, instance):
+        pass
+
+    def remove(self, kind, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, kinds, limit):
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        matches = []
+        for kind, model, fields in ((STUDENT, Student, ["first_name", "last_name"]),
+                                    (PARENT, Parent, ["first_name", "last_name", "email"])):
+            if kind not in kinds:
+                continue
+            queryset = model.objects.using(self.using)
+            for term in terms:
+                term_filter = Q()
+                for field in fields:
+                    term_filter |= Q(**{field + "__icontains": term})
+                queryset = queryset.filter(term_filter)
+            matches += [(kind, pk) for pk in queryset.values_list("pk", flat=True)[:limit]]
+        return matches[:limit]
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSSearchBackend,
+    "postgresql": PostgresTrigramSearchBackend,
+}
+
+
+def get_search_backend(using="default"):
+    return BACKENDS.get(connections[using].vendor, SubstringSearchBackend)(using)
+
+
+def search_people(query, kinds=(STUDENT, PARENT), limit=20, using="default"):
+    """
+    Return matching students and parents, best matches first
+    """
+    matches = get_search_backend(using).search(query, kinds, limit)
+
+    students = Student.objects.using(using).filter(
+        pk__in=[pk for kind, pk in matches if kind == STUDENT]
+    ).prefetch_related("transactions", "line_items")
+    parents = Parent.objects.using(using).filter(pk__in=[pk for kind, pk in matches if kind == PARENT])
+    found = {(STUDENT, student.pk): student for student in students}
+    found.update({(PARENT, parent.pk): parent for parent in parents})
+
+    return [(kind, found[(kind, pk)]) for kind, pk in matches if (kind, pk) in found]
@@ -1,9 +1,16 @@
 import re
 
+from django.conf import settings
 from rest_framework import serializers
 
+from backend.api.identity import student_match_key
+
 from backend.api.models.field_trip import FieldTrip
+from backend.api.models.parent import Parent
 from backend.api.models.school import School
+from backend.api.models.student import Student
+from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
 
 
 class FieldTripSerializer(serializers.ModelSerializer):
@@ -15,20 +22,127 @@ class FieldTripSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FieldTrip
+        # updated_at is for the changes feed; leaving it out keeps the list unchanged by saves that change nothing
+        exclude = ['updated_at']
+
+
+class FieldTripSummarySerializer(serializers.ModelSerializer):
+    """
+    A field trip without its schools, for payloads that list the schools once alongside the trips
+    """
+
+    class Meta:
+        model = FieldTrip
+        fields = ['id', 'location', 'cost', 'date']
+
+
+class FieldTripChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FieldTrip
+        fields = ['id', 'location', 'cost', 'date', 'updated_at']
+
+
+class SchoolChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = School
+        fields = ['id', 'name', 'updated_at']
+
+
+def paid_transaction_ids(student):
+    """
+    The id of the transaction that paid each of a student's field trips, read from the prefetched
+    `transactions` and `line_items`. Refunded payments don't count.
+    """
+    transaction_ids = {
+        transaction.activity_id: transaction.id for transaction in student.transactions.all()
+        if transaction.refund_id is None
+    }
+    for line_item in student.line_items.all():
+        if line_item.refund_id is None:
+            transaction_ids.setdefault(line_item.field_trip_id, line_item.transaction_id)
+    return transaction_ids
+
+
+class TransactionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Transaction
         fields = '__all__'
 
 
-class FieldTripPaymentSerializer(serializers.Serializer):
-    student_first_name = serializers.CharField(required=True)
-    student_last_name = serializers.CharField(required=True)
+class TransactionLineItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransactionLineItem
+        fields = ['id', 'student', 'field_trip', 'amount']
+
+
+class CheckoutTransactionSerializer(serializers.ModelSerializer):
+    line_items = TransactionLineItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = ['id', 'date', 'amount', 'line_items']
+
+
+class StudentRegistrationStatusSerializer(serializers.ModelSerializer):
+    registrations = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_registrations(student):
+        """
+        Registration and payment status per field trip, read from prefetched registrations, transactions and
+        line items
+        """
+        transaction_ids = paid_transaction_ids(student)
+        field_trip_ids = [registration.field_trip_id for registration in student.fieldtripregistration_set.all()]
+        field_trip_ids += [field_trip_id for field_trip_id in transaction_ids if field_trip_id not in field_trip_ids]
+
+        return [
+            {
+                "field_trip_id": str(field_trip_id),
+                "paid": field_trip_id in transaction_ids,
+                "transaction_id": transaction_ids.get(field_trip_id),
+            }
+            for field_trip_id in field_trip_ids
+        ]
+
+    class Meta:
+        model = Student
+        fields = ['id', 'first_name', 'last_name', 'school', 'registrations']
+
+
+class StudentSearchResultSerializer(serializers.ModelSerializer):
+    type = serializers.ReadOnlyField(default="student")
+    paid_field_trip_ids = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_paid_field_trip_ids(student):
+        return [str(field_trip_id) for field_trip_id in paid_transaction_ids(student)]
+
+    class Meta:
+        model = Student
+        fields = ['type', 'id', 'first_name', 'last_name', 'school', 'parent', 'paid_field_trip_ids']
+
+
+class ParentSearchResultSerializer(serializers.ModelSerializer):
+    type = serializers.ReadOnlyField(default="parent")
+
+    class Meta:
+        model = Parent
+        fields = ['type', 'id', 'first_name', 'last_name', 'email']
+
+
+class CardPaymentSerializer(serializers.Serializer):
+    """
+    The paying parent and card, common to single payments and cart checkouts
+    """
     parent_first_name = serializers.CharField(required=True)
     parent_last_name = serializers.CharField(required=True)
-    field_trip_id = serializers.CharField(required=True)
     card_number = serializers.CharField(required=True)
     expiry_date = serializers.CharField(required=True)
     cvv = serializers.CharField(required=True)
     email = serializers.EmailField(required=True)
-    school_id = serializers.CharField(required=True)
+    # Chosen by the client (e.g. a UUID) to follow the payment at /api/payment/<reference>/events
+    payment_reference = serializers.RegexField(r"^[A-Za-z0-9_-]{16,64}$", required=False)
 
     @staticmethod
     def validate_card_number(value):
@@ -60,3 +174,39 @@ class FieldTripPaymentSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid expiry date")
 
         return value
+
+
+class FieldTripPaymentSerializer(CardPaymentSerializer):
+    student_first_name = serializers.CharField(required=True)
+    student_last_name = serializers.CharField(required=True)
+    field_trip_id = serializers.CharField(required=True)
+    school_id = serializers.CharField(required=True)
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    student_first_name = serializers.CharField(required=True)
+    student_last_name = serializers.CharField(required=True)
+    school_id = serializers.UUIDField(required=True)
+    field_trip_id = serializers.UUIDField(required=True)
+
+
+class CheckoutSerializer(CardPaymentSerializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    @staticmethod
+    def validate_items(items):
+        """
+        At most `settings.CHECKOUT_MAX_ITEMS` items, each registration once
+        """
+        if len(items) > settings.CHECKOUT_MAX_ITEMS:
+            raise serializers.ValidationError(
+                "A checkout can pay for at most {} registrations.".format(settings.CHECKOUT_MAX_ITEMS)
+            )
+        registrations = set()
+        for item in items:
+            registration = (student_match_key(item['student_first_name'], item['student_last_name']),
+                            item['school_id'], item['field_trip_id'])
+            if registration in registrations:
+                raise serializers.ValidationError("Each student can be registered for a field trip only once.")
+            registrations.add(registration)
+        return items
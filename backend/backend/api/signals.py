@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.api.bootstrap import invalidate_bootstrap
+from backend.api.catalogue import record_tombstone
+from backend.api.directory import invalidate_school_directory
+from backend.api.models.catalogue_tombstone import CatalogueTombstone
+from backend.api.models.field_trip import FieldTrip
+from backend.api.models.parent import Parent
+from backend.api.models.school import School
+from backend.api.models.student import Student
+from backend.api.reference import invalidate_reference
+from backend.api.routers import mirror_to_shards, primary_database, unmirror_from_shards
+from backend.api.search import PARENT, STUDENT, get_search_backend
+from backend.api.snapshots import publish_catalogue_snapshot
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def school_changed(sender, **kwargs):
+    # Invalidate again on commit so a rebuild racing the open transaction isn't kept
+    invalidate_school_directory()
+    transaction.on_commit(invalidate_school_directory)
+
+
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=FieldTrip)
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=FieldTrip)
+def bootstrap_changed(sender, **kwargs):
+    invalidate_bootstrap()
+    transaction.on_commit(invalidate_bootstrap)
+
+
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=FieldTrip)
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=FieldTrip)
+def reference_changed(sender, instance, **kwargs):
+    invalidate_reference(sender, instance)
+    transaction.on_commit(lambda: invalidate_reference(sender, instance))
+
+
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=FieldTrip)
+def catalogue_saved(sender, **kwargs):
+    mirror_to_shards(sender, **kwargs)
+
+
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=FieldTrip)
+def catalogue_deleted(sender, **kwargs):
+    unmirror_from_shards(sender, **kwargs)
+
+
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=FieldTrip)
+def catalogue_tombstone(sender, instance, using, **kwargs):
+    if using == primary_database():
+        kind = CatalogueTombstone.SCHOOL if sender is School else CatalogueTombstone.FIELD_TRIP
+        record_tombstone(kind, instance.pk, using)
+
+
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=FieldTrip)
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=FieldTrip)
+def catalogue_snapshot_stale(sender, using, **kwargs):
+    # Shard copies of the catalogue don't change what is published. A failed publish is logged
+    # rather than failing the request whose change already committed.
+    if settings.CATALOGUE_SNAPSHOT_DIR and using == primary_database():
+        transaction.on_commit(publish_catalogue_snapshot, using=using, robust=True)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, using, **kwargs):
+    get_search_backend(using).index(STUDENT, instance)
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, using, **kwargs):
+    get_search_backend(using).remove(STUDENT, instance.pk)
+
+
+@receiver(post_save, sender=Parent)
+def parent_saved(sender, instance, using, **kwargs):
+    get_search_backend(using).index(PARENT, instance)
+
+
+@receiver(post_delete, sender=Parent)
+def parent_deleted(sender, instance, using, **kwargs):
+    get_search_backend(using).remove(PARENT, instance.pk)
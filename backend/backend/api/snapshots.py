@@ -0,0 +1,121 @@
+"""
+Static snapshot of the field trip catalogue, for a web server to serve in place of GET /api/fieldtrip.
+
+`publish_catalogue_snapshot()` writes the exact body FieldTripView returns without query parameters,
+plus a gzipped copy, to `settings.CATALOGUE_SNAPSHOT_DIR`:
+
+    fieldtrip.json, fieldtrip.json.gz                       the current catalogue
+    fieldtrip.<version>.json, fieldtrip.<version>.json.gz   the same, under a content-hashed name
+
+Every file is written to a temporary name and renamed into place, so readers never see a partial
+file. Field trip and school changes republish once their transaction commits, and the
+`publish_catalogue` management command republishes on demand. Like the view, the snapshot only
+lists upcoming trips, so run the command daily to drop the trips that have passed.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+from backend.api.models.field_trip import FieldTrip
+from backend.api.projections import field_trip_rows
+from backend.api.renderers import FastJSONRenderer
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SNAPSHOT_NAME = "fieldtrip"
+
+
+@dataclass(frozen=True)
+class CatalogueSnapshot:
+    version: str
+    path: Path
+    size: int
+
+
+def build_catalogue_snapshot():
+    """
+    The GET /api/fieldtrip body, rendered the same way FieldTripView renders it
+    """
+    return FastJSONRenderer().render(field_trip_rows(FieldTrip.objects.upcoming()))
+
+
+def _write_atomic(path, data):
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=".{}.".format(path.name))
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+@contextmanager
+def _publish_lock(directory):
+    """
+    Serialize publishes on this host; each reads the catalogue inside the lock, so the last to run
+    has seen every commit that triggered a publish
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(directory / ".publish.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _prune(directory, keep):
+    versions = sorted(directory.glob("{}.*.json".format(SNAPSHOT_NAME)), key=lambda path: path.stat().st_mtime)
+    for path in versions[:-keep]:
+        path.unlink(missing_ok=True)
+        Path("{}.gz".format(path)).unlink(missing_ok=True)
+
+
+def publish_catalogue_snapshot(directory=None):
+    """
+    Write the catalogue snapshot; returns None when no snapshot directory is configured
+    """
+    directory = directory or settings.CATALOGUE_SNAPSHOT_DIR
+    if not directory:
+        return None
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with _publish_lock(directory):
+        body = build_catalogue_snapshot()
+        version = hashlib.sha256(body).hexdigest()[:16]
+        # mtime=0 keeps the gzip bytes a function of the content
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+
+        versioned = directory / "{}.{}.json".format(SNAPSHOT_NAME, version)
+        if not versioned.exists():
+            _write_atomic(Path("{}.gz".format(versioned)), compressed)
+            _write_atomic(versioned, body)
+        else:
+            # Keep the current version out of pruning
+            versioned.touch()
+
+        current = directory / "{}.json".format(SNAPSHOT_NAME)
+        # Rewriting an unchanged file would change its mtime, and with it the ETag web servers derive
+        if not current.exists() or current.read_bytes() != body:
+            _write_atomic(Path("{}.gz".format(current)), compressed)
+            _write_atomic(current, body)
+
+        _prune(directory, settings.CATALOGUE_SNAPSHOT_KEEP)
+
+    return CatalogueSnapshot(version=version, path=current, size=len(body))
@@ -0,0 +1,44 @@
+"""
+Signed links to a parent's registration status.
+
+The status names the children, their schools, trips and transactions, so it is only shown to whoever can
+read the parent's mail: asking with an email sends a link to that address, and the link's token is the
+signed email key, valid for REGISTRATION_STATUS_LINK_MAX_AGE seconds.
+"""
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.mail import send_mail
+from django.urls import reverse
+
+from backend.api.identity import parent_email_key
+
+TOKEN_SALT = "backend.api.status_links"
+
+
+def status_token(email):
+    return signing.dumps(parent_email_key(email), salt=TOKEN_SALT)
+
+
+def email_key_from_token(token):
+    """
+    The email key a token was issued for, or None if it is forged or older than REGISTRATION_STATUS_LINK_MAX_AGE
+    """
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.REGISTRATION_STATUS_LINK_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def send_status_link(request, email):
+    url = "{}?{}".format(
+        request.build_absolute_uri(reverse("registrations")), urlencode({"token": status_token(email)})
+    )
+    send_mail(
+        subject="Your field trip registrations",
+        message="See the registration and payment status of your children's field trips at:\n\n{}\n\n"
+                "The link expires in {} hours.".format(url, settings.REGISTRATION_STATUS_LINK_MAX_AGE // 3600),
+        from_email=None,
+        recipient_list=[email.strip()],
+    )
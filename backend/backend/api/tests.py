@@ -1,19 +1,73 @@
+import asyncio
+import copy
+import gzip
+import hashlib
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
+from backend.api.admin import EstimatedCountPaginator
+from backend.api.archiving import archive_cutoff, archive_payments, count_archivable
+from backend.api.analytics import (
+    extract_transactions, participation_by_trip, revenue_by_school_day, transactions_table
+)
+from backend.api.audit import (
+    AuditLog, GatewayMonitor, audited_payment, audited_refund, gateway_audit_log, mask_card_number
+)
+from backend.api.bootstrap import accepted_encodings, invalidate_bootstrap
+from backend.api.columnar import read_npy
+from backend.api.directory import invalidate_school_directory
+from backend.api.events import payment_events, publish_payment_event
+from backend.api.identity import parent_email_key, parent_match_key, student_match_key
+from backend.api.locks import cache_lock
+from backend.api.models.archive import (
+    ArchivedFieldTripRegistration, ArchivedTransaction, ArchivedTransactionLineItem
+)
 from backend.api.models.school import School
 from backend.api.models.parent import Parent
 from backend.api.models.student import Student
 from backend.api.models.field_trip import FieldTrip, FieldTripRegistration
 from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
+from backend.api.profiling import ProfilingMiddleware
+from backend.api.projections import field_trip_rows
+from backend.api import receipts, reference
+from backend.api.receipt_render import render_receipt
+from backend.api.receipts import prerender_field_trip, receipt_content, receipt_key, receipt_path, receipt_transactions
+from backend.api.refunds import refund_field_trip
+from backend.api.renderers import FastJSONRenderer
+from backend.api.routers import PrimaryReplicaRouter, fan_out, replica_reads
 from backend.api.serializers import FieldTripSerializer, FieldTripPaymentSerializer
-from backend.legacy_api import LegacyPaymentProcessor, PaymentResponse
+from backend.api.snapshots import publish_catalogue_snapshot
+from backend.api.status_links import status_token
+from backend.api.views import FieldTripPaymentView
+from backend.legacy_api import LegacyPaymentProcessor, PaymentResponse, RefundResponse
 
 
 # ---------------------------------------------------------------------------
@@ -54,6 +108,24 @@ class ParentModelTests(TestCase):
         self.assertIsInstance(parent.id, int)
 
 
+    def test_match_key_ignores_case_whitespace_and_unicode_form(self):
+        parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        other = Parent.objects.create(first_name=" HOMER", last_name="simpson ", email="Homer@Example.com ")
+        self.assertEqual(parent.match_key, other.match_key)
+        self.assertEqual(
+            parent_match_key("Zoe\u0301", "Simpson", "z@example.com"),
+            parent_match_key("Zo\u00e9", "Simpson", "z@example.com"),
+        )
+        self.assertNotEqual(parent.match_key, parent_match_key("Marge", "Simpson", "homer@example.com"))
+
+    def test_save_with_update_fields_refreshes_match_key(self):
+        parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        parent.email = "chunkylover53@example.com"
+        parent.save(update_fields=["email"])
+        parent.refresh_from_db()
+        self.assertEqual(parent.match_key, parent_match_key("Homer", "Simpson", "chunkylover53@example.com"))
+
+
 class StudentModelTests(TestCase):
     def setUp(self):
         self.school = School.objects.create(name="Springfield Elementary")
@@ -100,6 +172,14 @@ class StudentModelTests(TestCase):
             self.parent.delete()
 
 
+    def test_match_key_ignores_case_and_whitespace(self):
+        student = Student.objects.create(
+            first_name="bart ", last_name="SIMPSON",
+            parent=self.parent, school=self.school,
+        )
+        self.assertEqual(student.match_key, student_match_key("Bart", "Simpson"))
+
+
 class FieldTripModelTests(TestCase):
     def test_id_is_uuid(self):
         trip = FieldTrip.objects.create(
@@ -428,6 +508,16 @@ class FieldTripViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 0)
 
+    def test_past_trips_are_hidden_unless_asked_for(self):
+        FieldTrip.objects.create(location="Old Zoo", cost=15.00, date=timezone.now() - timedelta(days=400))
+        earlier_today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        FieldTrip.objects.create(location="Early Museum", cost=15.00, date=earlier_today)
+
+        locations = {trip["location"] for trip in self.client.get("/api/fieldtrip").data}
+        self.assertEqual(locations, {"Museum", "Zoo", "Early Museum"})
+        response = self.client.get("/api/fieldtrip", {"include_past": "true"})
+        self.assertEqual(len(response.data), 4)
+
     def test_response_contains_expected_fields(self):
         response = self.client.get("/api/fieldtrip")
         trip = response.data[0]
@@ -438,10 +528,135 @@ class FieldTripViewTests(TestCase):
         self.assertIn("schools", trip)
 
 
+class FieldTripFastRenderingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        School.objects.create(name="École du Café")
+        School.objects.create(name='Line\u2028Separator "Quoted" \\ School')
+        auckland = datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=timezone.get_fixed_timezone(13 * 60))
+        for location, cost, date in [
+            ("Museum", 25.5, timezone.now()),
+            ("Zoo \U0001F992", 15.0, auckland),
+            ("Control \x01\t\n chars", 0.0, datetime(2026, 1, 1, tzinfo=timezone.utc)),
+            ("Tiny", 1e-05, timezone.now()),
+            ("Huge", 1e16, timezone.now()),
+        ]:
+            FieldTrip.objects.create(location=location, cost=cost, date=date)
+
+    def _serializer_body(self):
+        return JSONRenderer().render(FieldTripSerializer(FieldTrip.objects.all(), many=True).data)
+
+    def test_body_matches_serializer_output(self):
+        response = self.client.get("/api/fieldtrip?include_past=1", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.content, self._serializer_body())
+
+    def test_body_matches_without_orjson(self):
+        with patch("backend.api.renderers.orjson", None):
+            response = self.client.get("/api/fieldtrip?include_past=1", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.content, self._serializer_body())
+
+    def test_orjson_encodes_plain_payloads_like_json_renderer(self):
+        FieldTrip.objects.filter(location__in=["Tiny", "Huge"]).delete()
+        data = field_trip_rows(FieldTrip.objects.all())
+        with patch.object(JSONRenderer, "render", wraps=JSONRenderer().render) as fallback:
+            body = FastJSONRenderer().render(data)
+        fallback.assert_not_called()
+        self.assertEqual(body, self._serializer_body())
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DATETIME_FORMAT": None})
+    def test_unformatted_datetimes_match_serializer_output(self):
+        dates = [row["date"] for row in field_trip_rows(FieldTrip.objects.all())]
+        self.assertIsInstance(dates[0], datetime)
+        self.assertEqual(dates, [row["date"] for row in FieldTripSerializer(FieldTrip.objects.all(), many=True).data])
+
+    def test_schools_are_read_once(self):
+        with self.assertNumQueries(2):
+            self.client.get("/api/fieldtrip?include_past=1")
+
+    @override_settings(FIELD_TRIP_FAST_RENDERING=False)
+    def test_fast_rendering_can_be_turned_off(self):
+        with self.assertNumQueries(1 + FieldTrip.objects.count()):
+            response = self.client.get("/api/fieldtrip?include_past=1", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.content, self._serializer_body())
+
+
+class CatalogueSnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self._snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._snapshot_dir.cleanup)
+        self.directory = Path(self._snapshot_dir.name)
+        self.settings_override = override_settings(CATALOGUE_SNAPSHOT_DIR=self._snapshot_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.school = School.objects.create(name="Springfield Elementary")
+            self.trip = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+
+    def _published(self):
+        return (self.directory / "fieldtrip.json").read_bytes()
+
+    def test_snapshot_matches_field_trip_view(self):
+        body = self._published()
+        self.assertEqual(body, self.client.get("/api/fieldtrip", HTTP_ACCEPT="application/json").content)
+        self.assertEqual(gzip.decompress((self.directory / "fieldtrip.json.gz").read_bytes()), body)
+
+    def test_versioned_copy_is_named_by_content_hash(self):
+        snapshot = publish_catalogue_snapshot()
+        body = self._published()
+        self.assertEqual(snapshot.version, hashlib.sha256(body).hexdigest()[:16])
+        self.assertEqual((self.directory / "fieldtrip.{}.json".format(snapshot.version)).read_bytes(), body)
+        self.assertTrue((self.directory / "fieldtrip.{}.json.gz".format(snapshot.version)).exists())
+
+    def test_changes_republish_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            FieldTrip.objects.create(location="Zoo", cost=15.00, date=timezone.now())
+        self.assertNotIn("Zoo", self._published().decode())
+        for callback in callbacks:
+            callback()
+        self.assertIn("Zoo", self._published().decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.school.name = "Shelbyville Elementary"
+            self.school.save()
+            self.trip.delete()
+        self.assertEqual(self._published(), self.client.get("/api/fieldtrip", HTTP_ACCEPT="application/json").content)
+        self.assertNotIn("Museum", self._published().decode())
+
+    def test_unchanged_catalogue_keeps_the_file(self):
+        before = (self.directory / "fieldtrip.json").stat().st_mtime_ns
+        publish_catalogue_snapshot()
+        self.assertEqual((self.directory / "fieldtrip.json").stat().st_mtime_ns, before)
+
+    @override_settings(CATALOGUE_SNAPSHOT_KEEP=2)
+    def test_old_versions_are_pruned(self):
+        for cost in (1.0, 2.0, 3.0):
+            self.trip.cost = cost
+            self.trip.save()
+            publish_catalogue_snapshot()
+        self.assertEqual(len(list(self.directory.glob("fieldtrip.*.json"))), 2)
+        self.assertEqual(len(list(self.directory.glob("fieldtrip.*.json.gz"))), 2)
+
+    def test_publish_catalogue_command(self):
+        other = tempfile.TemporaryDirectory()
+        self.addCleanup(other.cleanup)
+        out = StringIO()
+        call_command("publish_catalogue", directory=other.name, stdout=out)
+        self.assertIn("Published catalogue", out.getvalue())
+        self.assertEqual((Path(other.name) / "fieldtrip.json").read_bytes(), self._published())
+
+    @override_settings(CATALOGUE_SNAPSHOT_DIR=None)
+    def test_command_requires_a_directory(self):
+        with self.assertRaises(CommandError):
+            call_command("publish_catalogue")
+
+
 @patch("backend.api.views.LegacyPaymentProcessor")
 class FieldTripPaymentViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.school = School.objects.create(name="Test School")
         self.trip = FieldTrip.objects.create(
             location="Museum", cost=25.50, date=timezone.now()
@@ -524,9 +739,66 @@ class FieldTripPaymentViewTests(TestCase):
         mock_instance.process_payment.return_value = PaymentResponse(
             success=True, transaction_id="TX-TEST-002"
         )
-        self.client.post("/api/payment", self._payment_data(), format="json")
+        response = self.client.post("/api/payment", self._payment_data(), format="json")
         self.assertEqual(Parent.objects.count(), 1)
-        self.assertEqual(Transaction.objects.count(), 2)
+        # The registration is already paid, so the second submission is not charged again
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_already_paid_returns_409_with_existing_transaction(self, mock_processor_cls):
+        mock_instance = self._mock_success(mock_processor_cls)
+        self.client.post("/api/payment", self._payment_data(), format="json")
+        response = self.client.post("/api/payment", self._payment_data(), format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["transaction"]["id"], "TX-TEST-001")
+        self.assertEqual(response.data["transaction"]["amount"], "25.50")
+        self.assertEqual(mock_instance.process_payment.call_count, 1)
+
+    def test_refunded_registration_can_be_paid_again(self, mock_processor_cls):
+        mock_instance = self._mock_success(mock_processor_cls)
+        self.client.post("/api/payment", self._payment_data(), format="json")
+        Transaction.objects.update(refund_id="RF-1", refunded_at=timezone.now())
+        mock_instance.process_payment.return_value = PaymentResponse(success=True, transaction_id="TX-TEST-002")
+        response = self.client.post("/api/payment", self._payment_data(), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Transaction.objects.filter(pk="TX-TEST-002", refund_id__isnull=True).exists())
+        self.assertEqual(mock_instance.process_payment.call_count, 2)
+
+    def test_cancelled_trip_rejects_payment(self, mock_processor_cls):
+        mock_instance = self._mock_success(mock_processor_cls)
+        self.trip.cancelled_at = timezone.now()
+        self.trip.save()
+        response = self.client.post("/api/payment", self._payment_data(), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cancelled", str(response.data))
+        mock_instance.process_payment.assert_not_called()
+
+    def test_paid_registration_for_other_trip_is_charged(self, mock_processor_cls):
+        mock_instance = self._mock_success(mock_processor_cls)
+        self.client.post("/api/payment", self._payment_data(), format="json")
+        other_trip = FieldTrip.objects.create(location="Zoo", cost=15.00, date=timezone.now())
+        mock_instance.process_payment.return_value = PaymentResponse(success=True, transaction_id="TX-TEST-002")
+        response = self.client.post("/api/payment", self._payment_data(field_trip_id=str(other_trip.id)),
+                                    format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mock_instance.process_payment.call_count, 2)
+
+    def test_failed_payment_can_be_retried(self, mock_processor_cls):
+        mock_instance = self._mock_failure(mock_processor_cls)
+        self.client.post("/api/payment", self._payment_data(), format="json")
+        mock_instance.process_payment.return_value = PaymentResponse(success=True, transaction_id="TX-TEST-001")
+        response = self.client.post("/api/payment", self._payment_data(), format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_payment_in_progress_returns_409_without_charging(self, mock_processor_cls):
+        mock_instance = self._mock_success(mock_processor_cls)
+        data = self._payment_data()
+        lock_key = FieldTripPaymentView._registration_lock_key({**data, "email": "HOMER@example.com"})
+        with cache_lock(lock_key):
+            response = self.client.post("/api/payment", data, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["detail"].code, "payment_in_progress")
+        mock_instance.process_payment.assert_not_called()
 
     def test_nonexistent_school_returns_400(self, mock_processor_cls):
         self._mock_success(mock_processor_cls)
@@ -584,6 +856,2041 @@ class FieldTripPaymentViewTests(TestCase):
         self.assertEqual(call_args["cvv"], "123")
 
 
+    def test_payment_reuses_parent_and_student_differing_in_case_and_spacing(self, mock_processor_cls):
+        self._mock_success(mock_processor_cls)
+        other_trip = FieldTrip.objects.create(location="Zoo", cost=10, date=timezone.now())
+        self.client.post("/api/payment", self._payment_data(), format="json")
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-TEST-002"
+        )
+        response = self.client.post("/api/payment", self._payment_data(
+            field_trip_id=str(other_trip.id), email="Homer@Example.com ", student_first_name="bart",
+            parent_first_name="HOMER",
+        ), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Parent.objects.count(), 1)
+        self.assertEqual(Student.objects.count(), 1)
+        self.assertEqual(FieldTripRegistration.objects.count(), 2)
+        self.assertEqual(Parent.objects.get().email, "homer@example.com")
+
+    def test_payment_trims_names_of_new_rows(self, mock_processor_cls):
+        self._mock_success(mock_processor_cls)
+        self.client.post("/api/payment", self._payment_data(student_first_name=" Lisa "), format="json")
+        self.assertEqual(Student.objects.get().first_name, "Lisa")
+
+
+@patch("backend.api.views.LegacyPaymentProcessor")
+class CheckoutViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.museum = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+        self.zoo = FieldTrip.objects.create(location="Zoo", cost=10, date=timezone.now())
+
+    def _item(self, student_first_name, field_trip, school=None):
+        return {
+            "student_first_name": student_first_name,
+            "student_last_name": "Simpson",
+            "school_id": str((school or self.school).id),
+            "field_trip_id": str(field_trip.id),
+        }
+
+    def _checkout_data(self, items=None, **overrides):
+        data = {
+            "parent_first_name": "Homer",
+            "parent_last_name": "Simpson",
+            "email": "homer@example.com",
+            "card_number": "1234567890123456",
+            "expiry_date": "12/25",
+            "cvv": "123",
+            "items": items if items is not None else [
+                self._item(name, trip) for name in ("Bart", "Lisa", "Maggie") for trip in (self.museum, self.zoo)
+            ],
+        }
+        data.update(overrides)
+        return data
+
+    def _mock_gateway(self, mock_processor_cls, response=None):
+        gateway = MagicMock()
+        gateway.process_payment.return_value = response or PaymentResponse(success=True, transaction_id="TX-CART")
+        mock_processor_cls.return_value = gateway
+        return gateway
+
+    def test_charges_the_cart_once(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        response = self.client.post("/api/checkout", self._checkout_data(), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(gateway.process_payment.call_count, 1)
+        payment_data = gateway.process_payment.call_args[0][0]
+        self.assertEqual(payment_data["amount"], 106.5)
+        self.assertEqual(payment_data["student_name"], "Bart Simpson, Lisa Simpson, Maggie Simpson")
+
+        self.assertEqual(response.data["id"], "TX-CART")
+        self.assertEqual(response.data["amount"], "106.50")
+        self.assertEqual(len(response.data["line_items"]), 6)
+        transaction = Transaction.objects.get()
+        self.assertIsNone(transaction.student)
+        self.assertEqual(transaction.amount, Decimal("106.50"))
+        self.assertEqual(sorted(transaction.line_items.values_list("amount", flat=True)),
+                         [Decimal("10")] * 3 + [Decimal("25.50")] * 3)
+
+    def test_creates_every_registration(self, mock_processor_cls):
+        self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/checkout", self._checkout_data(), format="json")
+        self.assertEqual(Parent.objects.count(), 1)
+        self.assertEqual(sorted(Student.objects.values_list("first_name", flat=True)), ["Bart", "Lisa", "Maggie"])
+        self.assertEqual(FieldTripRegistration.objects.count(), 6)
+        self.assertEqual(
+            set(TransactionLineItem.objects.values_list("student__first_name", "field_trip__location")),
+            set(FieldTripRegistration.objects.values_list("student__first_name", "field_trip__location")),
+        )
+
+    def test_reuses_existing_registrations(self, mock_processor_cls):
+        self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/payment", {
+            **self._item("Bart", self.museum), "parent_first_name": "Homer", "parent_last_name": "Simpson",
+            "email": "homer@example.com", "card_number": "1234567890123456", "expiry_date": "12/25", "cvv": "123",
+        }, format="json")
+        self._mock_gateway(mock_processor_cls, PaymentResponse(success=True, transaction_id="TX-CART-2"))
+        response = self.client.post("/api/checkout", self._checkout_data([
+            self._item("Bart", self.zoo), self._item("Lisa", self.museum),
+        ]), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Student.objects.filter(first_name="Bart").count(), 1)
+        self.assertEqual(FieldTripRegistration.objects.count(), 3)
+
+    def test_rejects_the_cart_when_an_item_is_already_paid(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/checkout", self._checkout_data([self._item("Bart", self.museum)]), format="json")
+        response = self.client.post("/api/checkout", self._checkout_data([
+            self._item("Lisa", self.museum), self._item("Bart", self.museum),
+        ]), format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["transaction_ids"], {1: "TX-CART"})
+        self.assertEqual(gateway.process_payment.call_count, 1)
+        self.assertFalse(Student.objects.filter(first_name="Lisa").exists())
+
+    def test_refunded_items_can_be_checked_out_again(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/checkout", self._checkout_data([self._item("Bart", self.museum)]), format="json")
+        TransactionLineItem.objects.update(refund_id="RF-1", refunded_at=timezone.now())
+        gateway.process_payment.return_value = PaymentResponse(success=True, transaction_id="TX-CART-2")
+        response = self.client.post("/api/checkout", self._checkout_data([self._item("Bart", self.museum)]),
+                                    format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(gateway.process_payment.call_count, 2)
+
+    def test_rejects_items_for_a_cancelled_trip(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        self.zoo.cancelled_at = timezone.now()
+        self.zoo.save()
+        response = self.client.post("/api/checkout", self._checkout_data([
+            self._item("Bart", self.museum), self._item("Bart", self.zoo),
+        ]), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["items"][1], {"field_trip_id": ["Field trip has been cancelled"]})
+        gateway.process_payment.assert_not_called()
+
+    def test_single_payment_of_a_cart_registration_is_already_paid(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/checkout", self._checkout_data([self._item("Bart", self.museum)]), format="json")
+        response = self.client.post("/api/payment", {
+            **self._item("Bart", self.museum), "parent_first_name": "Homer", "parent_last_name": "Simpson",
+            "email": "homer@example.com", "card_number": "1234567890123456", "expiry_date": "12/25", "cvv": "123",
+        }, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["transaction"]["id"], "TX-CART")
+        self.assertEqual(gateway.process_payment.call_count, 1)
+
+    def test_paid_items_are_reported_by_registration_status(self, mock_processor_cls):
+        self._mock_gateway(mock_processor_cls)
+        self.client.post("/api/checkout", self._checkout_data(), format="json")
+        response = self.client.get("/api/registrations", {"token": status_token("homer@example.com")})
+        registrations = [registration for student in response.data for registration in student["registrations"]]
+        self.assertEqual(len(registrations), 6)
+        self.assertTrue(all(registration["paid"] and registration["transaction_id"] == "TX-CART"
+                            for registration in registrations))
+
+    def test_declined_cart_keeps_registrations_unpaid(self, mock_processor_cls):
+        self._mock_gateway(mock_processor_cls, PaymentResponse(success=False, error_message="Card declined"))
+        response = self.client.post("/api/checkout", self._checkout_data(), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FieldTripRegistration.objects.count(), 6)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(TransactionLineItem.objects.exists())
+
+    def test_validates_every_item(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        missing_trip = self._item("Lisa", self.museum)
+        missing_trip["field_trip_id"] = str(uuid.uuid4())
+        response = self.client.post("/api/checkout", self._checkout_data([self._item("Bart", self.museum),
+                                                                          missing_trip]), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["items"][1]["field_trip_id"], ["Field trip does not exist"])
+        self.assertFalse(gateway.process_payment.called)
+        self.assertFalse(FieldTripRegistration.objects.exists())
+
+    def test_rejects_duplicate_and_empty_carts(self, mock_processor_cls):
+        duplicate = self._checkout_data([self._item("Bart", self.museum), self._item(" BART ", self.museum)])
+        self.assertEqual(self.client.post("/api/checkout", duplicate, format="json").status_code, 400)
+        self.assertEqual(self.client.post("/api/checkout", self._checkout_data([]), format="json").status_code, 400)
+
+    @override_settings(CHECKOUT_MAX_ITEMS=5)
+    def test_limits_the_cart_size(self, mock_processor_cls):
+        response = self.client.post("/api/checkout", self._checkout_data(), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 5", str(response.data["items"]))
+
+    def test_rejects_schools_on_different_shards(self, mock_processor_cls):
+        other_school = School.objects.create(name="Shelbyville Elementary")
+        items = [self._item("Bart", self.museum), self._item("Nelson", self.museum, school=other_school)]
+        with override_settings(SCHOOL_SHARDS={str(other_school.id): "shard_b"}):
+            response = self.client.post("/api/checkout", self._checkout_data(items), format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_cart_being_paid_elsewhere_returns_409(self, mock_processor_cls):
+        gateway = self._mock_gateway(mock_processor_cls)
+        lock_key = FieldTripPaymentView._registration_lock_key(
+            {**self._item("Lisa", self.zoo), "email": "HOMER@example.com"})
+        with cache_lock(lock_key):
+            response = self.client.post("/api/checkout", self._checkout_data(), format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(gateway.process_payment.called)
+
+
+class DedupeIdentitiesCommandTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=10, date=timezone.now())
+        self.other_trip = FieldTrip.objects.create(location="Zoo", cost=10, date=timezone.now())
+        self.parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.student = Student.objects.create(
+            first_name="Bart", last_name="Simpson", parent=self.parent, school=self.school,
+        )
+        FieldTripRegistration.objects.create(field_trip=self.trip, student=self.student)
+
+        # Written the way rows were before match keys, which is how the duplicates came about
+        self.duplicate_parent = Parent.objects.create(
+            first_name="Homer", last_name="Simpson", email="Homer@Example.com ",
+        )
+        self.duplicate_student = Student.objects.create(
+            first_name="bart", last_name="Simpson", parent=self.duplicate_parent, school=self.school,
+        )
+        FieldTripRegistration.objects.create(field_trip=self.trip, student=self.duplicate_student)
+        FieldTripRegistration.objects.create(field_trip=self.other_trip, student=self.duplicate_student)
+        Transaction.objects.create(
+            id="TX-1", date=timezone.now(), amount=10, student=self.duplicate_student, activity=self.other_trip,
+        )
+
+    def _dedupe(self, *args):
+        out = StringIO()
+        call_command("dedupe_identities", *args, stdout=out)
+        return out.getvalue()
+
+    def test_merges_parents_and_students_into_oldest_rows(self):
+        output = self._dedupe()
+        self.assertIn("Merged 1 duplicate parents and 1 duplicate students", output)
+        self.assertEqual(list(Parent.objects.values_list("pk", flat=True)), [self.parent.pk])
+        self.assertEqual(list(Student.objects.values_list("pk", flat=True)), [self.student.pk])
+
+    def test_moves_registrations_and_transactions_without_duplicating(self):
+        self._dedupe()
+        self.assertEqual(
+            sorted(FieldTripRegistration.objects.values_list("student_id", "field_trip_id")),
+            sorted([(self.student.pk, self.trip.pk), (self.student.pk, self.other_trip.pk)]),
+        )
+        self.assertEqual(Transaction.objects.get().student_id, self.student.pk)
+
+    def test_fills_missing_match_keys_first(self):
+        Parent.objects.filter(pk=self.duplicate_parent.pk).update(match_key="")
+        output = self._dedupe("--batch-size", "1")
+        self.assertIn("(1 keys filled)", output)
+        self.assertEqual(Parent.objects.count(), 1)
+
+    def test_dry_run_changes_nothing(self):
+        output = self._dedupe("--dry-run")
+        self.assertIn("Found 1 duplicate parents", output)
+        self.assertEqual(Parent.objects.count(), 2)
+        self.assertEqual(Student.objects.count(), 2)
+        self.assertEqual(FieldTripRegistration.objects.count(), 3)
+
+
+class ArchivePaymentsTests(TestCase):
+    def setUp(self):
+        school = School.objects.create(name="Springfield Elementary")
+        parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.student = Student.objects.create(first_name="Bart", last_name="Simpson", parent=parent, school=school)
+        long_ago = timezone.now() - timedelta(days=settings.PAYMENT_ARCHIVE_RETENTION_DAYS + 30)
+        self.old_trip = FieldTrip.objects.create(location="Old Zoo", cost=10, date=long_ago)
+        self.trip = FieldTrip.objects.create(location="Museum", cost=10, date=timezone.now() + timedelta(days=10))
+        for index in range(3):
+            Transaction.objects.create(
+                id="TX-OLD-{}".format(index), date=long_ago, amount=10, student=self.student, activity=self.old_trip,
+            )
+            FieldTripRegistration.objects.create(field_trip=self.old_trip, student=self.student)
+        # Paid long ago for a trip still to come: kept until the trip is old too
+        Transaction.objects.create(id="TX-EARLY", date=long_ago, amount=10, student=self.student, activity=self.trip)
+        Transaction.objects.create(id="TX-NEW", date=timezone.now(), amount=10, student=self.student,
+                                   activity=self.trip)
+        FieldTripRegistration.objects.create(field_trip=self.trip, student=self.student)
+
+    def test_moves_rows_of_old_trips_in_batches(self):
+        old_registrations = set(
+            FieldTripRegistration.objects.filter(field_trip=self.old_trip).values_list("id", flat=True)
+        )
+        batches = []
+        summary = archive_payments(
+            archive_cutoff(), using="default", batch_size=2,
+            progress=lambda summary: batches.append((summary.transactions, summary.registrations)),
+        )
+
+        self.assertEqual((summary.transactions, summary.registrations), (3, 3))
+        self.assertEqual(batches, [(2, 0), (3, 0), (3, 2), (3, 3)])
+        self.assertEqual(set(Transaction.objects.values_list("id", flat=True)), {"TX-EARLY", "TX-NEW"})
+        self.assertEqual(FieldTripRegistration.objects.get().field_trip, self.trip)
+
+        archived = ArchivedTransaction.objects.get(id="TX-OLD-0")
+        self.assertEqual((archived.amount, archived.student_id, archived.activity_id),
+                         (Decimal("10.00"), self.student.id, self.old_trip.id))
+        self.assertEqual(set(ArchivedFieldTripRegistration.objects.values_list("id", flat=True)), old_registrations)
+
+    def test_moves_carts_once_their_latest_trip_is_old(self):
+        long_ago = self.old_trip.date
+        other_old_trip = FieldTrip.objects.create(location="Old Farm", cost=10, date=long_ago)
+        old_cart = Transaction.objects.create(id="TX-CART-OLD", date=long_ago, amount=20)
+        for trip in (self.old_trip, other_old_trip):
+            TransactionLineItem.objects.create(transaction=old_cart, student=self.student, field_trip=trip, amount=10)
+        # One of its trips is still to come
+        mixed_cart = Transaction.objects.create(id="TX-CART-MIXED", date=long_ago, amount=20)
+        for trip in (self.old_trip, self.trip):
+            TransactionLineItem.objects.create(transaction=mixed_cart, student=self.student, field_trip=trip, amount=10)
+
+        self.assertEqual(count_archivable(archive_cutoff(), using="default").line_items, 2)
+        summary = archive_payments(archive_cutoff(), using="default")
+
+        self.assertEqual((summary.transactions, summary.line_items), (4, 2))
+        self.assertFalse(Transaction.objects.filter(pk="TX-CART-OLD").exists())
+        self.assertEqual(TransactionLineItem.objects.filter(transaction_id="TX-CART-MIXED").count(), 2)
+        archived = ArchivedTransaction.objects.get(pk="TX-CART-OLD")
+        self.assertEqual((archived.student_id, archived.activity_id), (None, None))
+        self.assertEqual(
+            set(ArchivedTransactionLineItem.objects.values_list("transaction_id", "field_trip_id")),
+            {("TX-CART-OLD", self.old_trip.id), ("TX-CART-OLD", other_old_trip.id)},
+        )
+
+    def test_rerun_resumes_after_a_partial_copy(self):
+        # A copy left behind by an interrupted batch doesn't stop the row from moving
+        ArchivedTransaction.objects.create(id="TX-OLD-0", date=timezone.now(), amount=10, student_id=self.student.id,
+                                           activity_id=self.old_trip.id)
+        call_command("archive_payments", stdout=StringIO())
+        self.assertFalse(Transaction.objects.filter(activity=self.old_trip).exists())
+        self.assertEqual(ArchivedTransaction.objects.count(), 3)
+
+        out = StringIO()
+        call_command("archive_payments", stdout=out)
+        self.assertIn("Archived 0 transactions, 0 cart line items and 0 registrations", out.getvalue())
+
+    def test_dry_run_only_counts(self):
+        out = StringIO()
+        call_command("archive_payments", "--dry-run", stdout=out)
+        self.assertIn("Found 3 transactions, 0 cart line items and 3 registrations", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertFalse(ArchivedTransaction.objects.exists())
+
+    def test_retention_days_option(self):
+        out = StringIO()
+        call_command("archive_payments", "--retention-days", str(settings.PAYMENT_ARCHIVE_RETENTION_DAYS + 60),
+                     stdout=out)
+        self.assertIn("Archived 0 transactions", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("archive_payments", "--retention-days", "-1", stdout=StringIO())
+
+
+class ReceiptTests(TestCase):
+    def setUp(self):
+        self._receipt_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._receipt_dir.cleanup)
+        self.settings_override = override_settings(RECEIPT_DIR=self._receipt_dir.name, RECEIPT_WORKERS=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.client = APIClient()
+        school = School.objects.create(name="Springfield <Elementary>")
+        parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=20, date=timezone.now() + timedelta(days=5))
+        for index in range(3):
+            student = Student.objects.create(
+                first_name="Student {}".format(index), last_name="Simpson", parent=parent, school=school,
+            )
+            Transaction.objects.create(
+                id="TX-{}".format(index), date=timezone.now(), amount=20, student=student, activity=self.trip,
+            )
+        self.url = "/api/receipts/TX-0"
+
+    def _content(self, transaction_id="TX-0"):
+        return receipt_content(receipt_transactions().get(pk=transaction_id))
+
+    def test_cart_receipt_lists_line_items(self):
+        cart = Transaction.objects.create(id="TX-CART", date=timezone.now(), amount=40)
+        for student in Student.objects.all()[:2]:
+            TransactionLineItem.objects.create(transaction=cart, student=student, field_trip=self.trip, amount=20)
+        TransactionLineItem.objects.filter(student__first_name="Student 1").update(
+            refund_id="RF-1", refunded_at=timezone.now())
+
+        response = self.client.get("/api/receipts/TX-CART", {"email": "homer@example.com"})
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for text in ("TX-CART", "Student 0 Simpson", "Student 1 Simpson", "$40.00", "refund RF-1"):
+            self.assertIn(text, body)
+        self.assertEqual(prerender_field_trip(self.trip.pk).cached, 1)
+
+    def test_download_renders_and_stores_the_receipt(self):
+        response = self.client.get(self.url, {"email": " Homer@Example.com"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/html; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="receipt-TX-0.html"')
+        body = response.content.decode()
+        for text in ("TX-0", "Homer Simpson", "Student 0 Simpson", "Springfield &lt;Elementary&gt;", "Museum",
+                     "$20.00"):
+            self.assertIn(text, body)
+
+        key = receipt_key(self._content())
+        self.assertEqual(response["ETag"], '"{}"'.format(key))
+        self.assertEqual(receipt_path(key).read_bytes(), response.content)
+
+    def test_repeat_downloads_are_served_from_the_cache(self):
+        with patch("backend.api.receipts.render_receipt", wraps=render_receipt) as render:
+            first = self.client.get(self.url, {"email": "homer@example.com"})
+            second = self.client.get(self.url, {"email": "homer@example.com"})
+        render.assert_called_once()
+        self.assertEqual(first.content, second.content)
+
+        response = self.client.get(self.url, {"email": "homer@example.com"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_refund_changes_the_receipt(self):
+        etag = self.client.get(self.url, {"email": "homer@example.com"})["ETag"]
+        Transaction.objects.filter(pk="TX-0").update(refund_id="RF-1", refunded_at=timezone.now())
+
+        response = self.client.get(self.url, {"email": "homer@example.com"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Refunded on", response.content.decode())
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_requires_the_parents_email(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"email": "marge@example.com"}).status_code, 404)
+        self.assertEqual(self.client.get("/api/receipts/TX-404", {"email": "homer@example.com"}).status_code, 404)
+
+    def test_render_timeout_returns_503(self):
+        with patch("backend.api.receipts._render", side_effect=TimeoutError):
+            response = self.client.get(self.url, {"email": "homer@example.com"})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(receipt_path(receipt_key(self._content())).exists())
+
+    def test_render_timeout_discards_the_pool(self):
+        pool = MagicMock()
+        pool.map.side_effect = TimeoutError
+        with override_settings(RECEIPT_WORKERS=1), patch.object(receipts, "_pool", pool):
+            with patch.object(receipts, "_pool_pid", os.getpid()):
+                response = self.client.get(self.url, {"email": "homer@example.com"})
+            self.assertIsNone(receipts._pool)
+        self.assertEqual(response.status_code, 503)
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=False)
+
+    def test_process_pool_renders_the_same_receipt(self):
+        self.addCleanup(lambda: receipts._pool and receipts._pool.shutdown())
+        with override_settings(RECEIPT_WORKERS=1):
+            summary = prerender_field_trip(self.trip.pk, batch_size=2)
+        self.assertEqual((summary.rendered, summary.cached), (3, 0))
+        content = self._content("TX-2")
+        self.assertEqual(receipt_path(receipt_key(content)).read_bytes(), render_receipt(content))
+
+    def test_prerender_receipts_command(self):
+        out = StringIO()
+        call_command("prerender_receipts", str(self.trip.pk), stdout=out)
+        self.assertIn("Rendered 3 receipts for Museum (0 already cached)", out.getvalue())
+
+        out = StringIO()
+        call_command("prerender_receipts", str(self.trip.pk), stdout=out)
+        self.assertIn("Rendered 0 receipts for Museum (3 already cached)", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("prerender_receipts", str(uuid.uuid4()), stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("prerender_receipts", "not-a-uuid", stdout=StringIO())
+
+
+class SchoolListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        invalidate_school_directory()
+        self.school = School.objects.create(name="Springfield Elementary")
+
+    def test_lists_schools(self):
+        response = self.client.get("/api/schools")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["schools"], [{"id": str(self.school.id), "name": "Springfield Elementary"}])
+        self.assertEqual(response["ETag"], '"{}"'.format(body["version"]))
+
+    def test_conditional_get_returns_304(self):
+        etag = self.client.get("/api/schools")["ETag"]
+        response = self.client.get("/api/schools", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_payload_is_served_from_cache(self):
+        self.client.get("/api/schools")
+        with self.assertNumQueries(0):
+            self.client.get("/api/schools")
+
+    def test_school_save_invalidates_payload(self):
+        etag = self.client.get("/api/schools")["ETag"]
+        School.objects.create(name="Shelbyville Elementary")
+        response = self.client.get("/api/schools", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["schools"]), 2)
+
+    def test_school_delete_invalidates_payload(self):
+        self.client.get("/api/schools")
+        self.school.delete()
+        response = self.client.get("/api/schools")
+        self.assertEqual(response.json()["schools"], [])
+
+
+class BootstrapViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        invalidate_bootstrap()
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.other_school = School.objects.create(name="Shelbyville Elementary")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=25.5, date=timezone.now())
+
+    def test_lists_schools_once_beside_the_trips(self):
+        response = self.client.get("/api/bootstrap")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        body = response.json()
+        self.assertEqual(body["schools"], [
+            {"id": str(self.other_school.id), "name": "Shelbyville Elementary"},
+            {"id": str(self.school.id), "name": "Springfield Elementary"},
+        ])
+        self.assertEqual(body["field_trips"], [{
+            "id": str(self.trip.id), "location": "Museum", "cost": 25.5,
+            "date": self.client.get("/api/fieldtrip").json()[0]["date"],
+        }])
+        self.assertEqual(body["config"], {"waiting_room": False, "payment_events": False})
+        self.assertEqual(response["ETag"], '"{}"'.format(body["version"]))
+
+    @override_settings(PAYMENT_EVENTS_STREAMING=True)
+    def test_config_tells_the_client_to_follow_payment_events(self):
+        self.assertTrue(self.client.get("/api/bootstrap").json()["config"]["payment_events"])
+
+    def test_gzip_body_when_accepted(self):
+        plain = self.client.get("/api/bootstrap")
+        response = self.client.get("/api/bootstrap", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(response["ETag"], '"{}-gzip"'.format(plain.json()["version"]))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_refused_encoding_is_not_used(self):
+        response = self.client.get("/api/bootstrap", HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings("gzip, br;q=0.5"), {"gzip", "br"})
+        self.assertEqual(accepted_encodings("br;q=0, *"), {"gzip", "*"})
+        self.assertEqual(accepted_encodings("GZIP;Q=0.0"), set())
+        self.assertEqual(accepted_encodings(None), set())
+
+    def test_caching_headers(self):
+        response = self.client.get("/api/bootstrap")
+        self.assertEqual(response["Cache-Control"], "public, max-age={}, stale-while-revalidate={}".format(
+            settings.BOOTSTRAP_MAX_AGE, settings.BOOTSTRAP_STALE_WHILE_REVALIDATE))
+
+    def test_conditional_get_returns_304(self):
+        etag = self.client.get("/api/bootstrap", HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        response = self.client.get("/api/bootstrap", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_payload_is_served_from_cache(self):
+        self.client.get("/api/bootstrap")
+        with self.assertNumQueries(0):
+            self.client.get("/api/bootstrap", HTTP_ACCEPT_ENCODING="gzip")
+
+    def test_field_trip_changes_invalidate_payload(self):
+        etag = self.client.get("/api/bootstrap")["ETag"]
+        self.trip.cost = 30
+        self.trip.save()
+        response = self.client.get("/api/bootstrap", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["field_trips"][0]["cost"], 30.0)
+
+        self.trip.delete()
+        self.assertEqual(self.client.get("/api/bootstrap").json()["field_trips"], [])
+
+    def test_school_changes_invalidate_payload(self):
+        self.client.get("/api/bootstrap")
+        self.school.delete()
+        self.assertEqual(len(self.client.get("/api/bootstrap").json()["schools"]), 1)
+
+
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for reference_cache in (reference.schools, reference.field_trips):
+            reference_cache.clear()
+            self.addCleanup(reference_cache.clear)
+        self.client = APIClient()
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+
+    def test_repeat_lookups_skip_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(reference.schools.get(str(self.school.pk)).name, "Springfield Elementary")
+        with self.assertNumQueries(0):
+            self.assertEqual(reference.schools.get(self.school.pk).name, "Springfield Elementary")
+        stats = reference.schools.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_returns_copies(self):
+        reference.field_trips.get(self.trip.pk).cost = 0
+        self.assertEqual(reference.field_trips.get(self.trip.pk).cost, 25.50)
+
+    def test_saving_or_deleting_invalidates(self):
+        reference.field_trips.get(self.trip.pk)
+        self.trip.cost = 30
+        self.trip.save()
+        self.assertEqual(reference.field_trips.get(self.trip.pk).cost, 30)
+        self.trip.delete()
+        self.assertIsNone(reference.field_trips.get(self.trip.pk))
+
+    def test_unknown_and_malformed_ids_are_missing(self):
+        self.assertEqual(reference.schools.get_many([uuid.uuid4(), "not-a-uuid", self.school.pk]),
+                         {self.school.pk: self.school})
+        self.assertEqual(reference.schools.stats()["size"], 1)
+
+    @override_settings(REFERENCE_SHARED_CACHE="default")
+    def test_shared_cache_fills_other_processes(self):
+        reference.schools.get(self.school.pk)
+        # A fresh process has an empty local cache but finds the row in the shared one
+        reference.schools.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(reference.schools.get(self.school.pk).name, "Springfield Elementary")
+        self.assertEqual(reference.schools.stats()["shared_hits"], 1)
+
+        self.school.name = "Springfield Primary"
+        self.school.save()
+        reference.schools.clear()
+        self.assertEqual(reference.schools.get(self.school.pk).name, "Springfield Primary")
+
+    @patch("backend.api.views.LegacyPaymentProcessor")
+    def test_payment_reads_no_reference_data_once_cached(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-1")
+        data = {
+            "student_first_name": "Bart", "student_last_name": "Simpson", "parent_first_name": "Homer",
+            "parent_last_name": "Simpson", "email": "homer@example.com", "card_number": "1234567890123456",
+            "expiry_date": "12/25", "cvv": "123", "school_id": str(self.school.pk), "field_trip_id": str(self.trip.pk),
+        }
+        reference.schools.get(self.school.pk)
+        reference.field_trips.get(self.trip.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/payment", data, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([query["sql"] for query in queries.captured_queries
+                          if 'FROM "api_school"' in query["sql"] or 'FROM "api_fieldtrip"' in query["sql"]])
+
+    def test_payment_with_malformed_ids_is_rejected(self):
+        data = {
+            "student_first_name": "Bart", "student_last_name": "Simpson", "parent_first_name": "Homer",
+            "parent_last_name": "Simpson", "email": "homer@example.com", "card_number": "1234567890123456",
+            "expiry_date": "12/25", "cvv": "123", "school_id": "not-a-uuid", "field_trip_id": str(self.trip.pk),
+        }
+        response = self.client.post("/api/payment", data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ["School does not exist"])
+
+    def test_readiness_reports_cache_figures(self):
+        reference.field_trips.get(self.trip.pk)
+        body = self.client.get("/api/health/ready").json()
+        self.assertEqual(body["checks"]["reference_cache"]["field_trips"]["misses"], 1)
+        self.assertEqual(body["checks"]["reference_cache"]["schools"]["size"], 0)
+
+
+class HealthCheckTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.monitor = GatewayMonitor()
+        for target in ("backend.api.audit.gateway_monitor", "backend.api.health.gateway_monitor"):
+            patcher = patch(target, self.monitor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _ready(self):
+        response = self.client.get("/api/health/ready")
+        self.assertEqual(response["Cache-Control"], "no-store")
+        return response.status_code, response.json()
+
+    def _gateway(self, success=True):
+        gateway = MagicMock()
+        gateway.process_payment.return_value = PaymentResponse(success=success, transaction_id="TX-1")
+        return gateway
+
+    def test_live(self):
+        response = self.client.get("/api/health/live")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_ready(self):
+        status, body = self._ready()
+        self.assertEqual(status, 200)
+        self.assertTrue(body["ready"])
+        self.assertTrue(body["checks"]["database"]["ok"])
+        self.assertEqual(body["checks"]["payments"],
+                         {"ok": True, "in_flight": 0, "capacity": settings.HEALTH_PAYMENT_CAPACITY})
+        self.assertEqual(body["checks"]["gateway"], {"ok": True, "calls": 0, "errors": 0, "error_rate": 0.0})
+        self.assertIn("dropped", body["checks"]["audit_log"])
+
+    @override_settings(AUDIT_LOG_DIR=None)
+    def test_ready_without_audit_log(self):
+        status, body = self._ready()
+        self.assertEqual(status, 200)
+        self.assertNotIn("audit_log", body["checks"])
+
+    @override_settings(HEALTH_PAYMENT_CAPACITY=1)
+    def test_not_ready_while_payments_fill_capacity(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def slow_payment(payment_data):
+            entered.set()
+            release.wait(5)
+            return PaymentResponse(success=True, transaction_id="TX-1")
+
+        gateway = MagicMock()
+        gateway.process_payment.side_effect = slow_payment
+        payment = threading.Thread(target=audited_payment, args=(gateway, {"amount": 10}))
+        payment.start()
+        self.addCleanup(payment.join)
+        self.addCleanup(release.set)
+        self.assertTrue(entered.wait(5))
+
+        status, body = self._ready()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["checks"]["payments"], {"ok": False, "in_flight": 1, "capacity": 1})
+
+        release.set()
+        payment.join()
+        self.assertEqual(self._ready()[0], 200)
+
+    @override_settings(HEALTH_GATEWAY_MIN_CALLS=4, HEALTH_GATEWAY_MAX_ERROR_RATE=0.5)
+    def test_not_ready_on_gateway_errors(self):
+        for _ in range(3):
+            audited_payment(self._gateway(success=False), {"amount": 10})
+        # Too few calls to judge
+        self.assertEqual(self._ready()[0], 200)
+
+        failing = MagicMock()
+        failing.process_payment.side_effect = ConnectionError("gateway down")
+        with self.assertRaises(ConnectionError):
+            audited_payment(failing, {"amount": 10})
+        status, body = self._ready()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["checks"]["gateway"], {"ok": False, "calls": 4, "errors": 4, "error_rate": 1.0})
+
+        for _ in range(4):
+            audited_payment(self._gateway(), {"amount": 10})
+        self.assertEqual(self._ready()[0], 200)
+
+    def test_old_outcomes_leave_the_window(self):
+        self.monitor.outcomes.append((time.monotonic() - 120, False))
+        self.monitor.outcomes.append((time.monotonic(), True))
+        self.assertEqual(self.monitor.recent_outcomes(60), (1, 0))
+
+    def test_not_ready_without_the_database(self):
+        with patch.object(connections[DEFAULT_DB_ALIAS], "cursor", side_effect=DatabaseError("unreachable")):
+            status, body = self._ready()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["checks"]["database"]["failed"], [DEFAULT_DB_ALIAS])
+
+    def test_drain_file_takes_the_worker_out(self):
+        with tempfile.TemporaryDirectory() as directory:
+            drain_file = os.path.join(directory, "drain")
+            with override_settings(HEALTH_DRAIN_FILE=drain_file):
+                self.assertEqual(self._ready()[0], 200)
+                Path(drain_file).touch()
+                status, body = self._ready()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["checks"]["draining"], {"ok": False})
+
+
+class SQLiteFileDatabasesMixin:
+    """
+    Register `sqlite_file_aliases` as migrated SQLite files in a temporary directory for the test class
+    """
+    sqlite_file_aliases = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls._sqlite_dir = tempfile.TemporaryDirectory()
+        for alias in cls.sqlite_file_aliases:
+            config = copy.deepcopy(connections.settings[DEFAULT_DB_ALIAS])
+            config["NAME"] = os.path.join(cls._sqlite_dir.name, "{}.sqlite3".format(alias))
+            connections.settings[alias] = config
+            call_command("migrate", database=alias, verbosity=0)
+        cls.databases = {DEFAULT_DB_ALIAS, *cls.sqlite_file_aliases}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.sqlite_file_aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls._sqlite_dir.cleanup()
+
+
+@override_settings(DATABASE_PRIMARY="primary", DATABASE_REPLICAS=["replica"])
+class PrimaryReplicaRouterTests(SQLiteFileDatabasesMixin, TransactionTestCase):
+    sqlite_file_aliases = ("primary", "replica")
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_writes_go_to_primary(self):
+        FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+        self.assertEqual(FieldTrip.objects.using("primary").count(), 1)
+        self.assertEqual(FieldTrip.objects.using("replica").count(), 0)
+
+    def test_reads_outside_replica_views_use_primary(self):
+        FieldTrip.objects.using("replica").create(location="Zoo", cost=15.00, date=timezone.now())
+        self.assertEqual(FieldTrip.objects.count(), 0)
+
+    def test_field_trip_list_reads_from_replica(self):
+        FieldTrip.objects.using("primary").create(location="Museum", cost=25.50, date=timezone.now())
+        FieldTrip.objects.using("replica").create(location="Zoo", cost=15.00, date=timezone.now())
+        response = self.client.get("/api/fieldtrip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([trip["location"] for trip in response.data], ["Zoo"])
+
+    def test_reads_after_write_are_pinned_to_primary(self):
+        router = PrimaryReplicaRouter()
+        with replica_reads():
+            self.assertEqual(router.db_for_read(FieldTrip), "replica")
+            FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+            self.assertEqual(router.db_for_read(FieldTrip), "primary")
+            self.assertEqual(FieldTrip.objects.count(), 1)
+        with replica_reads():
+            self.assertEqual(router.db_for_read(FieldTrip), "replica")
+
+    @patch("backend.api.views.LegacyPaymentProcessor")
+    def test_payment_writes_and_reads_use_primary(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-TEST-001"
+        )
+        school = School.objects.using("primary").create(name="Test School")
+        trip = FieldTrip.objects.using("primary").create(location="Museum", cost=25.50, date=timezone.now())
+        response = self.client.post("/api/payment", {
+            "student_first_name": "Bart",
+            "student_last_name": "Simpson",
+            "parent_first_name": "Homer",
+            "parent_last_name": "Simpson",
+            "field_trip_id": str(trip.id),
+            "card_number": "1234567890123456",
+            "expiry_date": "12/25",
+            "cvv": "123",
+            "email": "homer@example.com",
+            "school_id": str(school.id),
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.using("primary").count(), 1)
+        self.assertEqual(Transaction.objects.using("replica").count(), 0)
+
+
+SCHOOL_A = "aaaaaaaa-0000-0000-0000-000000000001"
+SCHOOL_B = "bbbbbbbb-0000-0000-0000-000000000002"
+
+
+@override_settings(SCHOOL_SHARDS={SCHOOL_A: "district_a", SCHOOL_B: "district_b"})
+class SchoolShardRouterTests(SQLiteFileDatabasesMixin, TransactionTestCase):
+    sqlite_file_aliases = ("district_a", "district_b")
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.school_a = School.objects.create(id=SCHOOL_A, name="Springfield Elementary")
+        self.school_b = School.objects.create(id=SCHOOL_B, name="Shelbyville Elementary")
+        self.school_default = School.objects.create(name="Capital City Elementary")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+
+    def _pay(self, school, student_first_name="Bart", email="homer@example.com"):
+        with patch("backend.api.views.LegacyPaymentProcessor") as mock_processor_cls:
+            mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+                success=True, transaction_id="TX-{}".format(uuid.uuid4().hex[:8])
+            )
+            return self.client.post("/api/payment", {
+                "student_first_name": student_first_name,
+                "student_last_name": "Simpson",
+                "parent_first_name": "Homer",
+                "parent_last_name": "Simpson",
+                "field_trip_id": str(self.trip.id),
+                "card_number": "1234567890123456",
+                "expiry_date": "12/25",
+                "cvv": "123",
+                "email": email,
+                "school_id": str(school.id),
+            }, format="json")
+
+    def test_catalogue_is_mirrored_to_every_shard(self):
+        for alias in ("district_a", "district_b"):
+            self.assertEqual(School.objects.using(alias).count(), 3)
+            self.assertEqual(FieldTrip.objects.using(alias).get().location, "Museum")
+
+        self.trip.location = "Art Gallery"
+        self.trip.save()
+        self.school_b.delete()
+        self.assertEqual(FieldTrip.objects.using("district_a").get().location, "Art Gallery")
+        self.assertFalse(School.objects.using("district_a").filter(pk=SCHOOL_B).exists())
+
+    def test_payment_writes_to_the_school_shard(self):
+        self.assertEqual(self._pay(self.school_a).status_code, 201)
+        self.assertEqual(self._pay(self.school_default, student_first_name="Lisa").status_code, 201)
+
+        self.assertEqual(Transaction.objects.using("district_a").get().student.first_name, "Bart")
+        self.assertEqual(str(Student.objects.using("district_a").get().school_id), SCHOOL_A)
+        self.assertEqual(Parent.objects.using("district_a").count(), 1)
+        self.assertEqual(Transaction.objects.using("district_b").count(), 0)
+        self.assertEqual(Transaction.objects.get().student.first_name, "Lisa")
+
+    def test_already_paid_is_detected_within_the_shard(self):
+        self._pay(self.school_b)
+        response = self._pay(self.school_b)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Transaction.objects.using("district_b").count(), 1)
+
+    def test_fan_out_runs_on_every_shard(self):
+        self._pay(self.school_a)
+        self._pay(self.school_b)
+        self._pay(self.school_b, student_first_name="Lisa")
+
+        counts = fan_out(lambda alias: (alias, Transaction.objects.count()))
+        self.assertEqual(counts, [("default", 0), ("district_a", 1), ("district_b", 2)])
+
+    def test_registration_status_spans_shards(self):
+        self._pay(self.school_a)
+        self._pay(self.school_b, student_first_name="Lisa")
+
+        response = self.client.get("/api/registrations", {"token": status_token("homer@example.com")})
+        self.assertEqual(sorted(child["first_name"] for child in response.data), ["Bart", "Lisa"])
+        self.assertTrue(all(child["registrations"][0]["paid"] for child in response.data))
+
+    def test_search_spans_shards(self):
+        self._pay(self.school_a)
+        self._pay(self.school_b, student_first_name="Lisa")
+
+        self.client.force_authenticate(get_user_model()(username="office", is_staff=True))
+        response = self.client.get("/api/search", {"q": "simpson", "type": "student"})
+        self.assertEqual(sorted(person["first_name"] for person in response.data), ["Bart", "Lisa"])
+
+
+class ApiSettingsProfileTests(SimpleTestCase):
+    def test_api_profile_serves_api_without_admin_stack(self):
+        code = textwrap.dedent("""
+            import sys
+            import django
+            from django.conf import settings
+            settings.DATABASES['default']['NAME'] = ':memory:'
+            settings.ALLOWED_HOSTS = ['testserver']
+            django.setup()
+            from django.core.management import call_command
+            from django.test import Client
+            call_command('migrate', verbosity=0)
+            response = Client().get('/api/fieldtrip')
+            assert response.status_code == 200, response.status_code
+            from django.apps import apps
+            installed = [name for name in ('django.contrib.admin', 'django.contrib.sessions',
+                                           'django.contrib.messages') if apps.is_installed(name)]
+            assert not installed, installed
+            assert 'backend.api.admin' not in sys.modules
+        """)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="backend.settings_api")
+        result = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+THROTTLE_RATES = {
+    "payment_ip": "3/min",
+    "payment_email": "2/min",
+    "payment_field_trip": "100/min",
+}
+
+
+@override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": THROTTLE_RATES})
+@patch("backend.api.views.LegacyPaymentProcessor")
+class PaymentThrottlingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.school = School.objects.create(name="Test School")
+        self.trip = FieldTrip.objects.create(
+            location="Museum", cost=25.50, date=timezone.now()
+        )
+
+    def _payment_data(self, **overrides):
+        data = {
+            "student_first_name": "Bart",
+            "student_last_name": "Simpson",
+            "parent_first_name": "Homer",
+            "parent_last_name": "Simpson",
+            "field_trip_id": str(self.trip.id),
+            "card_number": "1234567890123456",
+            "expiry_date": "12/25",
+            "cvv": "123",
+            "email": "homer@example.com",
+            "school_id": str(self.school.id),
+        }
+        data.update(overrides)
+        return data
+
+    def _post(self, **overrides):
+        return self.client.post("/api/payment", self._payment_data(**overrides), format="json")
+
+    def test_email_bucket_rejects_with_429_and_retry_after(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=False, error_message="Declined"
+        )
+        self._post()
+        self._post(email="HOMER@example.com ")
+        response = self._post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_rejected_request_does_no_db_or_gateway_work(self, mock_processor_cls):
+        for _ in range(2):
+            self._post(card_number="123")
+        with self.assertNumQueries(0):
+            response = self._post()
+        self.assertEqual(response.status_code, 429)
+        mock_processor_cls.return_value.process_payment.assert_not_called()
+
+    def test_ip_bucket_spans_emails(self, mock_processor_cls):
+        for index in range(3):
+            self.assertEqual(self._post(email="parent{}@example.com".format(index), cvv="1").status_code, 400)
+        self.assertEqual(self._post(email="other@example.com").status_code, 429)
+
+    def test_other_ips_are_not_throttled(self, mock_processor_cls):
+        for index in range(3):
+            self._post(email="parent{}@example.com".format(index), cvv="1")
+        response = self.client.post("/api/payment", self._payment_data(email="other@example.com", cvv="1"),
+                                    format="json", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 400)
+
+    def test_bucket_refills_over_time(self, mock_processor_cls):
+        with patch("backend.api.throttling.time.time", return_value=1000.0):
+            self._post(cvv="1")
+            self._post(cvv="1")
+            self.assertEqual(self._post(cvv="1").status_code, 429)
+        with patch("backend.api.throttling.time.time", return_value=1030.0):
+            self.assertEqual(self._post(cvv="1").status_code, 400)
+            self.assertEqual(self._post(cvv="1").status_code, 429)
+
+
+@override_settings(
+    WAITING_ROOM_ENABLED=True,
+    WAITING_ROOM_RATE=2,
+    REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {**THROTTLE_RATES, "waiting_room_ip": "100/min"}},
+)
+@patch("backend.api.views.LegacyPaymentProcessor")
+class WaitingRoomTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.school = School.objects.create(name="Test School")
+        self.trip = FieldTrip.objects.create(
+            location="Museum", cost=25.50, date=timezone.now()
+        )
+
+    def _take(self, now):
+        with patch("backend.api.waiting_room.time.time", return_value=now):
+            return self.client.post("/api/waiting-room").data
+
+    def _check(self, ticket, now):
+        with patch("backend.api.waiting_room.time.time", return_value=now):
+            return self.client.get("/api/waiting-room", HTTP_X_WAITING_ROOM_TICKET=ticket)
+
+    def _pay(self, now, gateway_response=None, cvv="123", **headers):
+        mock_response = gateway_response or PaymentResponse(
+            success=True, transaction_id="TX-{}".format(uuid.uuid4().hex[:8]),
+        )
+        with patch("backend.api.waiting_room.time.time", return_value=now), \
+                patch("backend.api.views.LegacyPaymentProcessor") as mock_processor_cls:
+            mock_processor_cls.return_value.process_payment.return_value = mock_response
+            return self.client.post("/api/payment", {
+                "student_first_name": "Bart",
+                "student_last_name": "Simpson",
+                "parent_first_name": "Homer",
+                "parent_last_name": "Simpson",
+                "field_trip_id": str(self.trip.id),
+                "card_number": "1234567890123456",
+                "expiry_date": "12/25",
+                "cvv": cvv,
+                "email": "homer@example.com",
+                "school_id": str(self.school.id),
+            }, format="json", **headers)
+
+    def test_payment_without_ticket_is_sent_to_the_waiting_room(self, mock_processor_cls):
+        response = self._pay(1000.0)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertIn("waiting room", response.data["detail"])
+
+    def test_first_ticket_at_an_idle_room_is_admitted_at_once(self, mock_processor_cls):
+        ticket = self._take(1000.0)
+        self.assertEqual(ticket["position"], 0)
+        self.assertTrue(ticket["admitted"])
+        self.assertEqual(self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket["ticket"]).status_code, 201)
+
+    def test_surge_is_admitted_in_order_at_the_configured_rate(self, mock_processor_cls):
+        tickets = [self._take(1000.0) for _ in range(5)]
+        self.assertEqual([ticket["position"] for ticket in tickets], [0, 1, 2, 3, 4])
+        self.assertEqual([ticket["retry_after"] for ticket in tickets], [0, 1, 1, 2, 2])
+
+        positions = [self._check(ticket["ticket"], 1001.0).data["position"] for ticket in tickets]
+        self.assertEqual(positions, [0, 0, 0, 1, 2])
+
+    def test_ticket_still_in_line_cannot_pay(self, mock_processor_cls):
+        self._take(1000.0)
+        ticket = self._take(1000.0)
+        response = self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket["ticket"])
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("number 1 in line", response.data["detail"])
+        self.assertEqual(self._pay(1000.5, HTTP_X_WAITING_ROOM_TICKET=ticket["ticket"]).status_code, 201)
+
+    def test_admitted_ticket_pays_only_once(self, mock_processor_cls):
+        ticket = self._take(1000.0)["ticket"]
+        self.assertEqual(self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket).status_code, 201)
+        response = self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("already been used", response.data["detail"])
+        # A new ticket gets through again, to find the registration already paid
+        new_ticket = self._take(1000.0)["ticket"]
+        self.assertEqual(self._pay(1001.0, HTTP_X_WAITING_ROOM_TICKET=new_ticket).status_code, 409)
+
+    @override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {
+        **THROTTLE_RATES, "payment_ip": "10/min", "payment_email": "10/min", "waiting_room_ip": "100/min",
+    }})
+    def test_rejected_or_declined_payment_keeps_the_ticket(self, mock_processor_cls):
+        ticket = self._take(1000.0)["ticket"]
+        self.assertEqual(self._pay(1000.0, cvv="1", HTTP_X_WAITING_ROOM_TICKET=ticket).status_code, 400)
+        declined = PaymentResponse(success=False, error_message="Card declined")
+        self.assertEqual(self._pay(1000.0, declined, HTTP_X_WAITING_ROOM_TICKET=ticket).status_code, 400)
+        self.assertEqual(self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket).status_code, 201)
+        self.assertEqual(self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket).status_code, 429)
+
+    def test_idle_room_does_not_bank_admissions(self, mock_processor_cls):
+        self._take(1000.0)
+        tickets = [self._take(5000.0) for _ in range(3)]
+        self.assertEqual([ticket["position"] for ticket in tickets], [0, 1, 2])
+
+    def test_forged_or_expired_tickets_are_rejected(self, mock_processor_cls):
+        ticket = self._take(1000.0)["ticket"]
+        self.assertEqual(self._check(ticket + "x", 1000.0).status_code, 400)
+        self.assertEqual(self._pay(1000.0, HTTP_X_WAITING_ROOM_TICKET=ticket + "x").status_code, 429)
+        self.assertEqual(self._check(ticket, 1000.0 + 3601).status_code, 400)
+
+    @override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {**THROTTLE_RATES, "waiting_room_ip": "2/min"}})
+    def test_taking_tickets_is_throttled_but_polling_is_not(self, mock_processor_cls):
+        ticket = self._take(1000.0)["ticket"]
+        self._take(1000.0)
+        with patch("backend.api.waiting_room.time.time", return_value=1000.0):
+            self.assertEqual(self.client.post("/api/waiting-room").status_code, 429)
+        for _ in range(5):
+            self.assertEqual(self._check(ticket, 1000.0).status_code, 200)
+
+    @override_settings(WAITING_ROOM_ENABLED=False)
+    def test_disabled_room_admits_everyone(self, mock_processor_cls):
+        self.assertEqual(self._pay(1000.0).status_code, 201)
+
+
+@override_settings(CATALOGUE_CHANGES_SETTLE=0)
+class CatalogueChangesViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=10, date=timezone.now())
+
+    def _changes(self, **params):
+        response = self.client.get("/api/catalogue/changes", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_without_since_returns_whole_catalogue(self):
+        changes = self._changes()
+        self.assertEqual([trip["id"] for trip in changes["field_trips"]], [str(self.trip.id)])
+        self.assertEqual(changes["field_trips"][0]["location"], "Museum")
+        self.assertEqual([school["name"] for school in changes["schools"]], ["Springfield Elementary"])
+        self.assertEqual(changes["deleted"], [])
+        self.assertFalse(changes["has_more"])
+
+    def test_since_cursor_returns_only_later_changes(self):
+        cursor = self._changes()["cursor"]
+        self.assertEqual(self._changes(since=cursor)["field_trips"], [])
+
+        self.trip.cost = 12
+        self.trip.save()
+        changes = self._changes(since=cursor)
+        self.assertEqual([(trip["id"], trip["cost"]) for trip in changes["field_trips"]], [(str(self.trip.id), 12.0)])
+        self.assertEqual(changes["schools"], [])
+
+    def test_deletions_are_reported(self):
+        cursor = self._changes()["cursor"]
+        trip_id = self.trip.id
+        self.trip.delete()
+        changes = self._changes(since=cursor)
+        self.assertEqual([(row["type"], row["id"]) for row in changes["deleted"]], [("fieldtrip", str(trip_id))])
+        self.assertEqual(changes["field_trips"], [])
+
+    def test_pages_through_rows_changed_at_the_same_time(self):
+        for index in range(4):
+            FieldTrip.objects.create(location="Trip {}".format(index), cost=10, date=timezone.now())
+        FieldTrip.objects.update(updated_at=self.trip.updated_at)
+        School.objects.update(updated_at=self.trip.updated_at)
+
+        seen, cursor = [], None
+        while True:
+            changes = self._changes(limit=2, **({"since": cursor} if cursor else {}))
+            seen += [row["id"] for row in changes["field_trips"] + changes["schools"]]
+            cursor = changes["cursor"]
+            if not changes["has_more"]:
+                break
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(set(seen), {str(pk) for pk in FieldTrip.objects.values_list("id", flat=True)} | {
+            str(self.school.id)})
+
+    @override_settings(CATALOGUE_CHANGES_SETTLE=60)
+    def test_recent_changes_are_held_back(self):
+        self.assertEqual(self._changes()["field_trips"], [])
+
+    def test_since_accepts_a_datetime(self):
+        FieldTrip.objects.filter(pk=self.trip.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        changes = self._changes(since=(timezone.now() - timedelta(days=1)).isoformat())
+        self.assertEqual(changes["field_trips"], [])
+        self.assertEqual(len(changes["schools"]), 1)
+
+    def test_invalid_since_returns_400(self):
+        response = self.client.get("/api/catalogue/changes", {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", response.json())
+
+    @override_settings(CATALOGUE_TOMBSTONE_RETENTION=60)
+    def test_expired_cursor_returns_410(self):
+        response = self.client.get("/api/catalogue/changes", {"since": "2020-01-01T00:00:00Z"})
+        self.assertEqual(response.status_code, 410)
+
+    def test_field_trip_list_leaves_out_updated_at(self):
+        response = self.client.get("/api/fieldtrip")
+        self.assertNotIn("updated_at", response.json()[0])
+
+
+class RegistrationStatusViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.parent = Parent.objects.create(
+            first_name="Homer", last_name="Simpson", email="homer@example.com"
+        )
+        self.bart = Student.objects.create(
+            first_name="Bart", last_name="Simpson", parent=self.parent, school=self.school,
+        )
+        self.lisa = Student.objects.create(
+            first_name="Lisa", last_name="Simpson", parent=self.parent, school=self.school,
+        )
+        self.museum = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+        self.zoo = FieldTrip.objects.create(location="Zoo", cost=15.00, date=timezone.now())
+
+    def _status(self):
+        response = self.client.get("/api/registrations", {"token": status_token("homer@example.com")})
+        self.assertEqual(response.status_code, 200)
+        return {child["first_name"]: child["registrations"] for child in response.data}
+
+    def test_reports_paid_and_unpaid_registrations(self):
+        FieldTripRegistration.objects.create(student=self.bart, field_trip=self.museum)
+        FieldTripRegistration.objects.create(student=self.bart, field_trip=self.zoo)
+        Transaction.objects.create(
+            id="TX-1", date=timezone.now(), amount=Decimal("25.50"), student=self.bart, activity=self.museum,
+        )
+        status = self._status()
+        self.assertEqual(status["Bart"], [
+            {"field_trip_id": str(self.museum.id), "paid": True, "transaction_id": "TX-1"},
+            {"field_trip_id": str(self.zoo.id), "paid": False, "transaction_id": None},
+        ])
+        self.assertEqual(status["Lisa"], [])
+
+    def test_refunded_payments_are_unpaid(self):
+        FieldTripRegistration.objects.create(student=self.bart, field_trip=self.museum)
+        Transaction.objects.create(
+            id="TX-1", date=timezone.now(), amount=Decimal("25.50"), student=self.bart, activity=self.museum,
+            refund_id="RF-1", refunded_at=timezone.now(),
+        )
+        self.assertEqual(self._status()["Bart"], [
+            {"field_trip_id": str(self.museum.id), "paid": False, "transaction_id": None},
+        ])
+
+    def test_query_count_does_not_grow_with_children(self):
+        for index in range(5):
+            student = Student.objects.create(
+                first_name="Child{}".format(index), last_name="Simpson", parent=self.parent, school=self.school,
+            )
+            FieldTripRegistration.objects.create(student=student, field_trip=self.museum)
+        with self.assertNumQueries(5):
+            self.client.get("/api/registrations", {"token": status_token("homer@example.com")})
+
+    def test_email_matches_regardless_of_case_and_spacing(self):
+        marge = Parent.objects.create(first_name="Marge", last_name="Simpson", email="Marge@Example.com")
+        Student.objects.create(first_name="Maggie", last_name="Simpson", parent=marge, school=self.school)
+        for email in ("marge@example.com", " MARGE@example.COM "):
+            response = self.client.get("/api/registrations", {"token": status_token(email)})
+            self.assertEqual([child["first_name"] for child in response.data], ["Maggie"])
+
+    def test_unknown_email_returns_empty_list(self):
+        response = self.client.get("/api/registrations", {"token": status_token("ned@example.com")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_missing_token_returns_400(self):
+        response = self.client.get("/api/registrations", {"email": "homer@example.com"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_forged_or_expired_token_returns_403(self):
+        forged = signing.dumps(parent_email_key("homer@example.com"), salt="another salt")
+        self.assertEqual(self.client.get("/api/registrations", {"token": forged}).status_code, 403)
+
+        token = status_token("homer@example.com")
+        with override_settings(REGISTRATION_STATUS_LINK_MAX_AGE=-1):
+            self.assertEqual(self.client.get("/api/registrations", {"token": token}).status_code, 403)
+
+    def test_link_is_mailed_to_known_emails_only(self):
+        FieldTripRegistration.objects.create(student=self.bart, field_trip=self.museum)
+        sent = self.client.post("/api/registrations", {"email": " Homer@Example.com"}, format="json")
+        self.assertEqual(sent.status_code, 202)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["Homer@Example.com"])
+
+        link = next(line for line in mail.outbox[0].body.splitlines() if "/api/registrations?" in line)
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([child["first_name"] for child in response.data], ["Bart", "Lisa"])
+
+        unknown = self.client.post("/api/registrations", {"email": "ned@example.com"}, format="json")
+        self.assertEqual((unknown.status_code, unknown.data), (sent.status_code, sent.data))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {
+        **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "registration_status_email": "2/hour",
+    }})
+    def test_links_to_one_email_are_throttled(self):
+        statuses = [self.client.post("/api/registrations", {"email": "homer@example.com"}, format="json").status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [202, 202, 429])
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class PersonSearchViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("office", is_staff=True))
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.homer = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.ned = Parent.objects.create(first_name="Ned", last_name="Flanders", email="ned@example.com")
+        self.bart = Student.objects.create(
+            first_name="Bart", last_name="Simpson", parent=self.homer, school=self.school,
+        )
+        self.rod = Student.objects.create(
+            first_name="Rod", last_name="Flanders", parent=self.ned, school=self.school,
+        )
+
+    def _search(self, **params):
+        response = self.client.get("/api/search", params)
+        self.assertEqual(response.status_code, 200)
+        return [(result["type"], result["id"]) for result in response.data]
+
+    def test_prefix_match(self):
+        self.assertEqual(self._search(q="bart simp"), [("student", self.bart.id)])
+
+    def test_typo_tolerant_match(self):
+        self.assertEqual(self._search(q="Bart Simpsno", type="student")[0], ("student", self.bart.id))
+
+    def test_matches_parent_email(self):
+        self.assertEqual(self._search(q="ned@example"), [("parent", self.ned.id)])
+
+    def test_type_filter(self):
+        self.assertEqual(set(self._search(q="simpson", type="parent")), {("parent", self.homer.id)})
+
+    def test_type_filter_applies_before_the_limit(self):
+        for index in range(6):
+            Student.objects.create(first_name="Kid{}".format(index), last_name="Simpson", parent=self.homer,
+                                   school=self.school)
+            Parent.objects.create(first_name="Maude{}".format(index), last_name="Flanders",
+                                  email="maude{}@example.com".format(index))
+        # Indexed after every student, so it is only reached if students don't fill the limit first
+        marge = Parent.objects.create(first_name="Marge", last_name="Simpson", email="marge@example.com")
+        self.assertEqual(set(self._search(q="simpson", type="parent", limit=2)),
+                         {("parent", self.homer.id), ("parent", marge.id)})
+
+    def test_student_results_include_paid_trips(self):
+        trip = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+        Transaction.objects.create(
+            id="TX-1", date=timezone.now(), amount=Decimal("25.50"), student=self.bart, activity=trip,
+        )
+        response = self.client.get("/api/search", {"q": "bart simpson", "type": "student"})
+        self.assertEqual(response.data[0]["paid_field_trip_ids"], [str(trip.id)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.bart.last_name = "Bouvier"
+        self.bart.save()
+        self.assertEqual(self._search(q="bart bouvier"), [("student", self.bart.id)])
+        self.assertEqual(self._search(q="bart simpson", type="student")[:1], [])
+        self.rod.delete()
+        self.assertEqual(self._search(q="rod flanders", type="student"), [])
+
+    def test_rebuild_command_indexes_bulk_created_rows(self):
+        todd = Student.objects.bulk_create([
+            Student(first_name="Todd", last_name="Flanders", parent=self.ned, school=self.school),
+        ])[0]
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self._search(q="todd"), [("student", todd.id)])
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/search", {"q": "simpson"}).status_code, 403)
+        self.client.force_authenticate(get_user_model().objects.create_user("parent"))
+        self.assertEqual(self.client.get("/api/search", {"q": "simpson"}).status_code, 403)
+
+    def test_short_query_returns_400(self):
+        response = self.client.get("/api/search", {"q": "ba"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_limit_below_one_returns_400(self):
+        for limit in ("0", "-1"):
+            response = self.client.get("/api/search", {"q": "simpson", "limit": limit})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("limit", response.data)
+
+
+@patch("backend.api.views.LegacyPaymentProcessor")
+class PaymentEventPublishingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.school = School.objects.create(name="Test School")
+        self.trip = FieldTrip.objects.create(
+            location="Museum", cost=25.50, date=timezone.now()
+        )
+        self.reference = uuid.uuid4().hex
+        self.events = []
+        payment_events().subscribe(self.reference, self.events.append)
+        self.addCleanup(payment_events().unsubscribe, self.reference, self.events.append)
+
+    def _post(self, **overrides):
+        data = {
+            "student_first_name": "Bart",
+            "student_last_name": "Simpson",
+            "parent_first_name": "Homer",
+            "parent_last_name": "Simpson",
+            "field_trip_id": str(self.trip.id),
+            "card_number": "1234567890123456",
+            "expiry_date": "12/25",
+            "cvv": "123",
+            "email": "homer@example.com",
+            "school_id": str(self.school.id),
+            "payment_reference": self.reference,
+        }
+        data.update(overrides)
+        data = {key: value for key, value in data.items() if value is not None}
+        return self.client.post("/api/payment", data, format="json")
+
+    def test_successful_payment_publishes_each_state(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-EVENTS-1"
+        )
+        self.assertEqual(self._post().status_code, 201)
+        self.assertEqual([event.state for event in self.events], ["received", "processing", "succeeded"])
+        self.assertEqual(self.events[-1].data, {"transaction_id": "TX-EVENTS-1"})
+
+    def test_declined_payment_publishes_failed_with_reason(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=False, error_message="Card declined"
+        )
+        self.assertEqual(self._post().status_code, 400)
+        self.assertEqual(self.events[-1].state, "failed")
+        self.assertEqual(self.events[-1].data, {"detail": "Card declined"})
+
+    def test_already_paid_publishes_existing_transaction(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-EVENTS-2"
+        )
+        self._post(payment_reference=uuid.uuid4().hex)
+        self.assertEqual(self._post().status_code, 409)
+        self.assertEqual([event.state for event in self.events], ["received", "succeeded"])
+        self.assertEqual(self.events[-1].data, {"transaction_id": "TX-EVENTS-2"})
+
+    def test_reference_is_optional_and_validated(self, mock_processor_cls):
+        mock_processor_cls.return_value.process_payment.return_value = PaymentResponse(
+            success=True, transaction_id="TX-EVENTS-3"
+        )
+        self.assertEqual(self._post(payment_reference="short").status_code, 400)
+        self.assertEqual(self._post(payment_reference=None).status_code, 201)
+        self.assertEqual(self.events, [])
+
+
+@override_settings(PAYMENT_EVENTS_HEARTBEAT=0.05, PAYMENT_EVENTS_STREAM_TIMEOUT=2)
+class PaymentEventsViewTests(SimpleTestCase):
+    def setUp(self):
+        self.reference = uuid.uuid4().hex
+        self.url = "/api/payment/{}/events".format(self.reference)
+
+    def _frames(self, response):
+        return b"".join(response.streaming_content).decode().split("\n\n")[:-1]
+
+    def test_retained_terminal_state_is_sent_and_stream_ends(self):
+        publish_payment_event(self.reference, "succeeded", transaction_id="TX-1")
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual(self._frames(response), [
+            "retry: 3000",
+            'data: {"reference": "%s", "state": "succeeded", "transaction_id": "TX-1"}' % self.reference,
+        ])
+
+    def test_streams_transitions_published_while_connected(self):
+        publish_payment_event(self.reference, "received")
+        publisher = threading.Timer(0.1, lambda: (
+            publish_payment_event(self.reference, "processing"),
+            publish_payment_event(self.reference, "failed", detail="Card declined"),
+        ))
+        publisher.start()
+        self.addCleanup(publisher.join)
+
+        frames = [frame for frame in self._frames(self.client.get(self.url)) if frame != ": keepalive"]
+        self.assertEqual([json.loads(frame[len("data: "):])["state"] for frame in frames[1:]],
+                         ["received", "processing", "failed"])
+
+    @override_settings(PAYMENT_EVENTS_STREAM_TIMEOUT=0.12)
+    def test_idle_stream_sends_keepalives_then_closes(self):
+        frames = self._frames(self.client.get(self.url))
+        self.assertEqual(frames[0], "retry: 3000")
+        self.assertIn(": keepalive", frames[1:])
+        self.assertEqual(payment_events()._subscribers.get(self.reference), None)
+
+    async def test_asgi_stream_waits_without_a_thread(self):
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, lambda: publish_payment_event(self.reference, "succeeded", transaction_id="TX-2"))
+
+        response = await self.async_client.get(self.url)
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith("retry: 3000\n\n"))
+        self.assertTrue(body.endswith('"state": "succeeded", "transaction_id": "TX-2"}\n\n'))
+
+
+@patch("backend.api.refunds.LegacyPaymentProcessor")
+class RefundFieldTripTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.trip = FieldTrip.objects.create(location="Museum", cost=10, date=timezone.now())
+        self.other_trip = FieldTrip.objects.create(location="Zoo", cost=10, date=timezone.now())
+        for index in range(6):
+            student = Student.objects.create(
+                first_name="Student {}".format(index), last_name="Simpson", parent=self.parent, school=self.school,
+            )
+            Transaction.objects.create(
+                id="TX-{}".format(index), date=timezone.now(), amount=10, student=student, activity=self.trip,
+            )
+        Transaction.objects.create(
+            id="TX-OTHER", date=timezone.now(), amount=10, student=student, activity=self.other_trip,
+        )
+
+    def _gateway(self, mock_processor_cls, side_effect=None):
+        gateway = MagicMock()
+        gateway.refund.side_effect = side_effect or (
+            lambda transaction_id, amount: RefundResponse(success=True, refund_id="RF-" + transaction_id)
+        )
+        mock_processor_cls.return_value = gateway
+        return gateway
+
+    def test_refunds_every_transaction_for_the_trip(self, mock_processor_cls):
+        gateway = self._gateway(mock_processor_cls)
+        summary = refund_field_trip(self.trip.pk, workers=3)
+        self.assertEqual(summary.refunded, 6)
+        self.assertEqual(summary.failed, {})
+        self.assertEqual(gateway.refund.call_count, 6)
+        gateway.refund.assert_any_call("TX-0", 10.0)
+        refunded = Transaction.objects.filter(activity=self.trip)
+        self.assertTrue(all(tx.refund_id == "RF-" + tx.id and tx.refunded_at for tx in refunded))
+        self.assertIsNone(Transaction.objects.get(pk="TX-OTHER").refund_id)
+
+    def test_refunds_cart_line_items_as_partial_refunds(self, mock_processor_cls):
+        gateway = self._gateway(mock_processor_cls)
+        cart = Transaction.objects.create(id="TX-CART", date=timezone.now(), amount=35)
+        student = Student.objects.first()
+        museum_line = TransactionLineItem.objects.create(transaction=cart, student=student, field_trip=self.trip,
+                                                         amount=10)
+        zoo_line = TransactionLineItem.objects.create(transaction=cart, student=student, field_trip=self.other_trip,
+                                                      amount=25)
+        summary = refund_field_trip(self.trip.pk, workers=2)
+        self.assertEqual(summary.refunded, 7)
+        gateway.refund.assert_any_call("TX-CART", 10.0)
+        museum_line.refresh_from_db()
+        zoo_line.refresh_from_db()
+        self.assertEqual(museum_line.refund_id, "RF-TX-CART")
+        self.assertIsNone(zoo_line.refund_id)
+        self.assertIsNone(Transaction.objects.get(pk="TX-CART").refund_id)
+        self.assertEqual(refund_field_trip(self.trip.pk).refunded, 0)
+
+    def test_calls_gateway_concurrently(self, mock_processor_cls):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def refund(transaction_id, amount):
+            # Only returns once three refunds are in progress at the same time
+            barrier.wait()
+            return RefundResponse(success=True, refund_id="RF-" + transaction_id)
+
+        self._gateway(mock_processor_cls, refund)
+        self.assertEqual(refund_field_trip(self.trip.pk, workers=3).refunded, 6)
+
+    def test_failed_refunds_are_retried_by_the_next_run(self, mock_processor_cls):
+        self._gateway(mock_processor_cls, lambda transaction_id, amount: (
+            RefundResponse(success=False, error_message="Refund rejected")
+            if transaction_id == "TX-2" else RefundResponse(success=True, refund_id="RF-" + transaction_id)
+        ))
+        summary = refund_field_trip(self.trip.pk, workers=2, batch_size=2)
+        self.assertEqual(summary.refunded, 5)
+        self.assertEqual(summary.failed, {"TX-2": "Refund rejected"})
+
+        gateway = self._gateway(mock_processor_cls)
+        self.assertEqual(refund_field_trip(self.trip.pk, workers=2).refunded, 1)
+        gateway.refund.assert_called_once_with("TX-2", 10.0)
+
+    def test_gateway_errors_are_reported_as_failures(self, mock_processor_cls):
+        self._gateway(mock_processor_cls, ConnectionError("gateway unreachable"))
+        summary = refund_field_trip(self.trip.pk, workers=2)
+        self.assertEqual(summary.refunded, 0)
+        self.assertEqual(summary.failed["TX-0"], "gateway unreachable")
+        self.assertFalse(Transaction.objects.filter(refund_id__isnull=False).exists())
+
+    def test_command_refunds_and_resumes(self, mock_processor_cls):
+        Transaction.objects.filter(pk__in=["TX-0", "TX-1"]).update(refund_id="RF-EARLIER", refunded_at=timezone.now())
+        gateway = self._gateway(mock_processor_cls)
+        out = StringIO()
+        call_command("refund_field_trip", str(self.trip.pk), "--workers", "2", stdout=out)
+        self.assertIn("Refunded 4 payments for Museum", out.getvalue())
+        self.assertEqual(gateway.refund.call_count, 4)
+        self.assertEqual(Transaction.objects.get(pk="TX-0").refund_id, "RF-EARLIER")
+        # The trip is cancelled, so it takes no new payments while or after it is refunded
+        self.trip.refresh_from_db()
+        self.assertIsNotNone(self.trip.cancelled_at)
+        self.assertFalse(FieldTrip.objects.upcoming().filter(pk=self.trip.pk).exists())
+
+    def test_command_fails_when_refunds_fail(self, mock_processor_cls):
+        self._gateway(mock_processor_cls, lambda transaction_id, amount: RefundResponse(
+            success=False, error_message="Refund rejected"))
+        with self.assertRaisesMessage(CommandError, "6 failed, run the command again"):
+            call_command("refund_field_trip", str(self.trip.pk), stdout=StringIO(), stderr=StringIO())
+
+    def test_command_rejects_unknown_trip(self, mock_processor_cls):
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("refund_field_trip", str(uuid.uuid4()))
+
+    def test_command_rejects_malformed_trip_id(self, mock_processor_cls):
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("refund_field_trip", "not-a-uuid")
+
+
+class GatewayAuditLogTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _audit_log(self, **options):
+        audit_log = AuditLog(self.directory.name, **{
+            "max_bytes": 1024 * 1024, "backups": 2, "queue_size": 100, "batch_size": 10, **options,
+        })
+        self.addCleanup(audit_log.close)
+        return audit_log
+
+    def _records(self, audit_log, suffix=""):
+        audit_log.flush()
+        with open("{}{}".format(audit_log.path, suffix)) as file:
+            return [json.loads(line) for line in file]
+
+    def test_masks_card_number(self):
+        self.assertEqual(mask_card_number("1234 5678 9012 3456"), "************3456")
+        self.assertEqual(mask_card_number(None), "")
+
+    def test_writes_ndjson_records(self):
+        audit_log = self._audit_log()
+        for index in range(25):
+            audit_log.record("payment", amount=index)
+        records = self._records(audit_log)
+        self.assertEqual([record["amount"] for record in records], list(range(25)))
+        self.assertEqual(records[0]["event"], "payment")
+        self.assertEqual(audit_log.stats(), {"queued": 0, "written": 25, "dropped": 0})
+
+    def test_rotates_by_size(self):
+        audit_log = self._audit_log(max_bytes=300, batch_size=1)
+        for index in range(20):
+            audit_log.record("payment", amount=index)
+        audit_log.flush()
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         sorted([audit_log.path.name, audit_log.path.name + ".1", audit_log.path.name + ".2"]))
+        self.assertLessEqual(audit_log.path.stat().st_size, 300)
+        self.assertEqual(self._records(audit_log)[-1]["amount"], 19)
+
+    def test_drops_and_reports_records_when_queue_is_full(self):
+        audit_log = self._audit_log(queue_size=1, batch_size=1)
+        release = threading.Event()
+        write = audit_log._write
+
+        def slow_write(records):
+            release.wait(5)
+            write(records)
+
+        with patch.object(audit_log, "_write", slow_write):
+            audit_log.record("payment", amount=1)
+            # Wait for the writer to take the first record, leaving room for one more
+            for _ in range(100):
+                if audit_log.queue.empty():
+                    break
+                time.sleep(0.01)
+            audit_log.record("payment", amount=2)
+            audit_log.record("payment", amount=3)
+            self.assertEqual(audit_log.stats()["dropped"], 1)
+            release.set()
+            audit_log.flush()
+
+        records = self._records(audit_log)
+        # The drop is reported with the next batch written
+        self.assertEqual([record["event"] for record in records], ["audit_dropped", "payment", "payment"])
+        self.assertEqual(records[0]["dropped"], 1)
+        self.assertEqual([record.get("amount") for record in records], [None, 1, 2])
+
+    def test_audited_payment_records_outcome_without_card_secrets(self):
+        with override_settings(AUDIT_LOG_DIR=self.directory.name):
+            processor = MagicMock()
+            processor.process_payment.return_value = PaymentResponse(success=True, transaction_id="TX-1")
+            response = audited_payment(processor, {
+                "card_number": "1234567890123456", "cvv": "123", "expiry_date": "12/25", "amount": 25.5,
+                "school_id": uuid.UUID(int=1), "activity_id": uuid.UUID(int=2),
+            })
+            self.assertEqual(response.transaction_id, "TX-1")
+            record, = self._records(gateway_audit_log())
+
+        self.assertEqual(record["card"], "************3456")
+        self.assertEqual((record["result"], record["transaction_id"], record["amount"]), ("success", "TX-1", 25.5))
+        self.assertEqual(record["activity_id"], str(uuid.UUID(int=2)))
+        self.assertIn("latency_ms", record)
+        self.assertNotIn("123", [record.get("cvv"), record.get("card")])
+        self.assertNotIn("12/25", json.dumps(record))
+
+    def test_audited_refund_records_gateway_errors(self):
+        with override_settings(AUDIT_LOG_DIR=self.directory.name):
+            processor = MagicMock()
+            processor.refund.side_effect = ConnectionError("gateway unreachable")
+            with self.assertRaises(ConnectionError):
+                audited_refund(processor, "TX-1", 10.0)
+            record, = self._records(gateway_audit_log())
+
+        self.assertEqual((record["event"], record["transaction_id"], record["result"]), ("refund", "TX-1", "error"))
+        self.assertIn("gateway unreachable", record["error"])
+
+    def test_test_runs_write_outside_the_project(self):
+        for name in ("AUDIT_LOG_DIR", "RECEIPT_DIR", "ANALYTICS_DIR", "PROFILING_DIR"):
+            self.assertFalse(Path(getattr(settings, name)).is_relative_to(settings.BASE_DIR), name)
+
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings = override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.directory.name, PROFILING_KEEP=3, PROFILING_SAMPLE_RATE=0,
+            PROFILING_SLOW_MS=None, PROFILING_TOKEN="s3cret", PROFILING_MODE="sampler", PROFILING_INTERVAL=0.001,
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def _request(self, seconds=0.03, **headers):
+        def slow_view(request):
+            time.sleep(seconds)
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/api/fieldtrip", headers=headers)
+        return ProfilingMiddleware(slow_view)(request)
+
+    def _profiles(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_disabled_middleware_is_not_used(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_unprofiled_request_writes_nothing(self):
+        response = self._request(seconds=0)
+        self.assertEqual(response.content, b"ok")
+        self.assertEqual(self._profiles(), [])
+
+    def test_header_with_token_writes_collapsed_stacks(self):
+        response = self._request(**{"X-Profile": "s3cret"})
+        name = response["X-Profile-Id"]
+        self.assertEqual(self._profiles(), [name])
+        self.assertRegex(name, r"-GET-api_fieldtrip-\d+ms\.collapsed$")
+
+        lines = Path(self.directory.name, name).read_text().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn("slow_view", stack.split(";")[-1])
+
+    def test_header_with_wrong_token_is_ignored(self):
+        response = self._request(**{"X-Profile": "guess"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(self._profiles(), [])
+
+    def test_cprofile_mode_writes_pstats(self):
+        response = self._request(**{"X-Profile": "s3cret", "X-Profile-Mode": "cprofile"})
+        path = os.path.join(self.directory.name, response["X-Profile-Id"])
+        self.assertTrue(path.endswith(".prof"))
+        stats = pstats.Stats(path)
+        self.assertTrue(any(function == "slow_view" for _, _, function in stats.stats))
+
+    def test_keeps_only_slow_requests(self):
+        with override_settings(PROFILING_SLOW_MS=20):
+            self._request(seconds=0)
+            self.assertEqual(self._profiles(), [])
+            self._request(seconds=0.03)
+            self.assertEqual(len(self._profiles()), 1)
+
+    def test_sample_rate(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            self._request(seconds=0)
+        self.assertEqual(len(self._profiles()), 1)
+
+    def test_ring_buffer_keeps_newest_profiles(self):
+        names = [self._request(seconds=0, **{"X-Profile": "s3cret"})["X-Profile-Id"] for _ in range(5)]
+        self.assertEqual(self._profiles(), names[-3:])
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings = override_settings(ANALYTICS_DIR=self.directory.name, ANALYTICS_SETTLE=0)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.springfield = School.objects.create(name="Springfield Elementary")
+        self.shelbyville = School.objects.create(name="Shelbyville Elementary")
+        self.museum = FieldTrip.objects.create(location="Museum", cost=10, date=timezone.now())
+        self.zoo = FieldTrip.objects.create(location="Zoo", cost=25.5, date=timezone.now())
+        parent = Parent.objects.create(first_name="Homer", last_name="Simpson", email="homer@example.com")
+        self.bart = Student.objects.create(first_name="Bart", last_name="Simpson", parent=parent,
+                                           school=self.springfield)
+        self.lisa = Student.objects.create(first_name="Lisa", last_name="Simpson", parent=parent,
+                                           school=self.springfield)
+        self.nelson = Student.objects.create(first_name="Nelson", last_name="Muntz", parent=parent,
+                                             school=self.shelbyville)
+        Student.objects.create(first_name="Maggie", last_name="Simpson", parent=parent, school=self.shelbyville)
+
+        self._pay("TX-1", self.bart, self.museum, "10.00", datetime(2026, 9, 1, 9, tzinfo=dt_timezone.utc))
+        self._pay("TX-2", self.lisa, self.museum, "10.00", datetime(2026, 9, 1, 10, tzinfo=dt_timezone.utc))
+        self._pay("TX-3", self.nelson, self.zoo, "25.50", datetime(2026, 9, 2, 9, tzinfo=dt_timezone.utc))
+
+    def _pay(self, transaction_id, student, field_trip, amount, when):
+        return Transaction.objects.create(id=transaction_id, date=when, amount=Decimal(amount), student=student,
+                                          activity=field_trip)
+
+    def test_revenue_by_school_day(self):
+        extract_transactions()
+        self.assertEqual(revenue_by_school_day(), [
+            {"date": "2026-09-01", "school_id": str(self.springfield.id), "school": "Springfield Elementary",
+             "revenue": "20.00"},
+            {"date": "2026-09-02", "school_id": str(self.shelbyville.id), "school": "Shelbyville Elementary",
+             "revenue": "25.50"},
+        ])
+        self.assertEqual([row["date"] for row in revenue_by_school_day(start=date(2026, 9, 2))], ["2026-09-02"])
+
+    def test_refunds_reduce_revenue_and_participation(self):
+        extract_transactions()
+        Transaction.objects.filter(pk="TX-2").update(
+            refund_id="RF-1", refunded_at=datetime(2026, 9, 3, 9, tzinfo=dt_timezone.utc))
+        summary = extract_transactions()
+        self.assertEqual((summary.payments, summary.refunds, summary.rows), (0, 1, 4))
+
+        self.assertEqual(revenue_by_school_day(start=date(2026, 9, 3))[0]["revenue"], "-10.00")
+        participation = {row["field_trip"]: row for row in participation_by_trip()}
+        self.assertEqual(participation["Museum"]["paying_students"], 1)
+        self.assertEqual(participation["Museum"]["students"], 4)
+        self.assertEqual(participation["Museum"]["participation"], 0.25)
+
+    def test_participation_by_trip(self):
+        extract_transactions()
+        self.assertEqual(
+            [(row["field_trip"], row["paying_students"], row["participation"]) for row in participation_by_trip()],
+            [("Museum", 2, 0.5), ("Zoo", 1, 0.25)],
+        )
+
+    def test_extracts_cart_line_items(self):
+        cart = self._pay("TX-CART", None, None, "35.50", datetime(2026, 9, 2, 10, tzinfo=dt_timezone.utc))
+        TransactionLineItem.objects.create(transaction=cart, student=self.bart, field_trip=self.zoo,
+                                           amount=Decimal("25.50"))
+        line = TransactionLineItem.objects.create(transaction=cart, student=self.lisa, field_trip=self.museum,
+                                                  amount=Decimal("10.00"))
+        self.assertEqual(extract_transactions().payments, 5)
+        self.assertEqual({(row["date"], row["school"]): row["revenue"] for row in revenue_by_school_day()}, {
+            ("2026-09-01", "Springfield Elementary"): "20.00",
+            ("2026-09-02", "Springfield Elementary"): "35.50",
+            ("2026-09-02", "Shelbyville Elementary"): "25.50",
+        })
+
+        TransactionLineItem.objects.filter(pk=line.pk).update(
+            refund_id="RF-1", refunded_at=datetime(2026, 9, 3, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(extract_transactions().refunds, 1)
+        participation = {row["field_trip"]: row["paying_students"] for row in participation_by_trip()}
+        self.assertEqual(participation, {"Museum": 2, "Zoo": 2})
+
+    def test_extracts_incrementally(self):
+        self.assertEqual(extract_transactions().payments, 3)
+        self.assertEqual(extract_transactions().payments, 0)
+        self._pay("TX-4", self.bart, self.zoo, "25.50", datetime(2026, 9, 2, 12, tzinfo=dt_timezone.utc))
+        summary = extract_transactions()
+        self.assertEqual((summary.payments, summary.rows), (1, 4))
+        self.assertEqual(len(transactions_table().manifest()["parts"]), 2)
+
+    @override_settings(ANALYTICS_BATCH_SIZE=2)
+    def test_pages_through_transactions_at_the_same_time(self):
+        Transaction.objects.update(date=datetime(2026, 9, 1, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(extract_transactions().payments, 3)
+        self.assertEqual([row["revenue"] for row in revenue_by_school_day()], ["25.50", "20.00"])
+
+    @override_settings(ANALYTICS_SETTLE=3600)
+    def test_leaves_recent_transactions_for_the_next_run(self):
+        self._pay("TX-4", self.bart, self.zoo, "25.50", timezone.now())
+        self.assertEqual(extract_transactions().payments, 3)
+
+    @override_settings(ANALYTICS_MAX_PARTS=1)
+    def test_compacts_parts(self):
+        extract_transactions()
+        self._pay("TX-4", self.bart, self.zoo, "25.50", datetime(2026, 9, 2, 12, tzinfo=dt_timezone.utc))
+        extract_transactions()
+        table = transactions_table()
+        self.assertEqual([part["rows"] for part in table.manifest()["parts"]], [4])
+        self.assertEqual(sorted(path.name for path in table.directory.glob("part-*")),
+                         [table.manifest()["parts"][0]["name"]])
+        self.assertEqual(sum(Decimal(row["revenue"]) for row in revenue_by_school_day()), Decimal("71.00"))
+
+    def test_reports_on_empty_table(self):
+        self.assertEqual(revenue_by_school_day(), [])
+        self.assertEqual(participation_by_trip(), [])
+
+    def test_columns_are_npy_files(self):
+        extract_transactions()
+        table = transactions_table()
+        path = table.directory / table.manifest()["parts"][0]["name"] / "amount_cents.npy"
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(8), b"\x93NUMPY\x01\x00")
+        self.assertEqual(list(read_npy(path)), [1000, 1000, 2550])
+
+    def test_report_command(self):
+        call_command("extract_analytics", stdout=StringIO())
+        out = StringIO()
+        call_command("analytics_report", "revenue", "--end", "2026-09-01", stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "date,school_id,school,revenue",
+            "2026-09-01,{},Springfield Elementary,20.00".format(self.springfield.id),
+        ])
+
+
+# ---------------------------------------------------------------------------
+# Admin Tests
+# ---------------------------------------------------------------------------
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        self.school = School.objects.create(name="Springfield Elementary")
+        self.parent = Parent.objects.create(
+            first_name="Homer", last_name="Simpson", email="homer@example.com"
+        )
+        self.trip = FieldTrip.objects.create(location="Museum", cost=25.50, date=timezone.now())
+
+    def _add_transactions(self, count, start=0):
+        for index in range(start, start + count):
+            student = Student.objects.create(
+                first_name="Child{}".format(index), last_name="Simpson", parent=self.parent, school=self.school,
+            )
+            Transaction.objects.create(
+                id="TX-{}".format(index), date=timezone.now(), amount=Decimal("25.50"),
+                student=student, activity=self.trip,
+            )
+
+    def _query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_render(self):
+        self._add_transactions(1)
+        FieldTripRegistration.objects.create(student=Student.objects.first(), field_trip=self.trip)
+        for model in ("school", "fieldtrip", "parent", "student", "fieldtripregistration", "transaction"):
+            response = self.client.get("/admin/api/{}/".format(model))
+            self.assertEqual(response.status_code, 200, model)
+
+    def test_transaction_changelist_query_count_does_not_grow_with_rows(self):
+        self._add_transactions(2)
+        baseline = self._query_count("/admin/api/transaction/")
+        self._add_transactions(20, start=2)
+        self.assertEqual(self._query_count("/admin/api/transaction/"), baseline)
+
+    def test_search_matches_prefix_case_insensitively_on_first_letter(self):
+        self._add_transactions(2)
+        Student.objects.filter(first_name="Child1").update(last_name="Flanders")
+        response = self.client.get("/admin/api/transaction/", {"q": "flan"})
+        self.assertEqual([tx.id for tx in response.context["cl"].result_list], ["TX-1"])
+
+    def test_search_by_transaction_id_prefix(self):
+        self._add_transactions(12)
+        response = self.client.get("/admin/api/transaction/", {"q": "TX-1"})
+        self.assertEqual({tx.id for tx in response.context["cl"].result_list}, {"TX-1", "TX-10", "TX-11"})
+
+    def test_paginator_uses_estimate_for_large_unfiltered_tables(self):
+        self._add_transactions(3)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        with patch.object(EstimatedCountPaginator, "estimate_threshold", 1):
+            self.assertEqual(EstimatedCountPaginator(Transaction.objects.order_by("-date"), 100).count, 3)
+            with self.assertNumQueries(1):
+                EstimatedCountPaginator(Transaction.objects.order_by("-date"), 100).count
+            filtered = Transaction.objects.filter(id="TX-1").order_by("-date")
+            self.assertEqual(EstimatedCountPaginator(filtered, 100).count, 1)
+
+    def test_paginator_counts_small_tables_exactly(self):
+        self._add_transactions(3)
+        self.assertEqual(EstimatedCountPaginator(Transaction.objects.order_by("-date"), 100).count, 3)
+
+
 # ---------------------------------------------------------------------------
 # LegacyPaymentProcessor Tests
 # ---------------------------------------------------------------------------
@@ -689,3 +2996,22 @@ class LegacyPaymentProcessorTests(TestCase):
              patch("backend.legacy_api.random.random", return_value=0.5):
             response = self.processor.process_payment(data)
         self.assertTrue(response.success)
+
+    @patch("backend.legacy_api.random.random", return_value=0.5)
+    @patch("backend.legacy_api.time.sleep")
+    def test_successful_refund(self, mock_sleep, mock_random):
+        response = self.processor.refund("TX-1-1000", 25.50)
+        self.assertTrue(response.success)
+        self.assertTrue(response.refund_id.startswith("RF-"))
+        mock_sleep.assert_called_once_with(1.5)
+
+    @patch("backend.legacy_api.random.random", return_value=0.05)
+    @patch("backend.legacy_api.time.sleep")
+    def test_random_refund_failure(self, mock_sleep, mock_random):
+        response = self.processor.refund("TX-1-1000", 25.50)
+        self.assertFalse(response.success)
+        self.assertIn("rejected", response.error_message)
+
+    def test_refund_rejects_invalid_arguments(self):
+        self.assertFalse(self.processor.refund("", 25.50).success)
+        self.assertFalse(self.processor.refund("TX-1-1000", 0).success)
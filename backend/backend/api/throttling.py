@@ -0,0 +1,107 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket keyed by `get_bucket_key`, using the DRF rate for `scope` ("<burst>/<period>").
+
+    A bucket holds up to <burst> tokens and refills at <burst> per <period>. Its state is a single
+    cache entry in `settings.THROTTLE_CACHE`, so each check is one read and one write, and workers
+    share buckets when that cache is shared (Redis, Memcached).
+    """
+    scope = None
+
+    def __init__(self):
+        self._wait = None
+
+    def get_bucket_key(self, request, view):
+        """
+        Return the identity to throttle on, or None to skip throttling this request
+        """
+        raise NotImplementedError(".get_bucket_key() must be overridden")
+
+    def get_rate(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        num, period = rate.split("/")
+        duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+        return int(num), int(num) / duration
+
+    def allow_request(self, request, view):
+        ident = self.get_bucket_key(request, view)
+        if ident is None:
+            return True
+
+        capacity, refill_rate = self.get_rate()
+        cache = caches[settings.THROTTLE_CACHE]
+        key = "throttle_{}_{}".format(self.scope, hashlib.sha1(ident.encode("utf-8")).hexdigest())
+        now = time.time()
+
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+        if tokens < 1:
+            self._wait = (1 - tokens) / refill_rate
+            return False
+
+        cache.set(key, (tokens - 1, now), timeout=int(capacity / refill_rate) + 1)
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+def _normalized_field(request, name):
+    value = request.data.get(name) if hasattr(request.data, "get") else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+class PaymentIPThrottle(TokenBucketThrottle):
+    scope = "payment_ip"
+
+    def get_bucket_key(self, request, view):
+        return self.get_ident(request)
+
+
+class PaymentEmailThrottle(TokenBucketThrottle):
+    scope = "payment_email"
+
+    def get_bucket_key(self, request, view):
+        return _normalized_field(request, "email")
+
+
+class PaymentFieldTripThrottle(TokenBucketThrottle):
+    scope = "payment_field_trip"
+
+    def get_bucket_key(self, request, view):
+        return _normalized_field(request, "field_trip_id")
+
+
+class WaitingRoomIPThrottle(TokenBucketThrottle):
+    scope = "waiting_room_ip"
+
+    def get_bucket_key(self, request, view):
+        # Polling is cheap; only taking tickets, which lengthens the queue, is limited
+        return self.get_ident(request) if request.method == "POST" else None
+
+
+class RegistrationStatusIPThrottle(TokenBucketThrottle):
+    scope = "registration_status_ip"
+
+    def get_bucket_key(self, request, view):
+        return self.get_ident(request)
+
+
+class RegistrationStatusEmailThrottle(TokenBucketThrottle):
+    scope = "registration_status_email"
+
+    def get_bucket_key(self, request, view):
+        # Limits the links mailed to one address; opening a link carries no email
+        return _normalized_field(request, "email")
@@ -1,7 +1,22 @@
 from django.urls import path
-from backend.api.views import FieldTripView, FieldTripPaymentView
+from backend.api.views import (
+    BootstrapView, CatalogueChangesView, CheckoutView, FieldTripView, FieldTripPaymentView, LivenessView,
+    PaymentEventsView, PersonSearchView, ReadinessView, ReceiptView, RegistrationStatusView, SchoolListView,
+    WaitingRoomView
+)
 
 urlpatterns = [
+    path(route='health/live', view=LivenessView.as_view(), name='health-live'),
+    path(route='health/ready', view=ReadinessView.as_view(), name='health-ready'),
+    path(route='bootstrap', view=BootstrapView.as_view(), name='bootstrap'),
     path(route='fieldtrip', view=FieldTripView.as_view(), name='fieldtrip'),
+    path(route='schools', view=SchoolListView.as_view(), name='schools'),
+    path(route='catalogue/changes', view=CatalogueChangesView.as_view(), name='catalogue-changes'),
+    path(route='registrations', view=RegistrationStatusView.as_view(), name='registrations'),
+    path(route='receipts/<str:transaction_id>', view=ReceiptView.as_view(), name='receipt'),
+    path(route='search', view=PersonSearchView.as_view(), name='search'),
+    path(route='waiting-room', view=WaitingRoomView.as_view(), name='waiting-room'),
     path(route='payment', view=FieldTripPaymentView.as_view(), name='payment'),
+    path(route='checkout', view=CheckoutView.as_view(), name='checkout'),
+    path(route='payment/<slug:reference>/events', view=PaymentEventsView.as_view(), name='payment-events'),
 ]
@@ -1,52 +1,454 @@
+import hashlib
+import math
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import router
+from django.db.transaction import atomic
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
 
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework import generics
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from backend.api import reference
+from backend.api.audit import audited_payment
+from backend.api.bootstrap import get_bootstrap
+from backend.api.catalogue import Cursor, InvalidCursor, catalogue_changes
+from backend.api.directory import get_school_directory
+from backend.api.events import (
+    FAILED, PROCESSING, RECEIVED, SUCCEEDED, async_event_stream, event_stream, publish_payment_event
+)
+from backend.api.exceptions import AlreadyPaid, ItemsAlreadyPaid, PaymentInProgress
+from backend.api.health import readiness
+from backend.api.identity import normalize_identity, parent_email_key, parent_match_key, student_match_key
+from backend.api.locks import cache_lock
+from backend.api.receipts import get_receipt, receipt_content, receipt_key, receipt_transactions
+from backend.api.projections import field_trip_rows
+from backend.api.renderers import FastJSONRenderer
+from backend.api.routers import fan_out, replica_reads, shard_aliases, shard_for_school, use_shard
+from backend.api.search import PARENT, STUDENT, search_people
+from backend.api.status_links import email_key_from_token, send_status_link
+from backend.api.throttling import (
+    PaymentEmailThrottle, PaymentFieldTripThrottle, PaymentIPThrottle, RegistrationStatusEmailThrottle,
+    RegistrationStatusIPThrottle, WaitingRoomIPThrottle
+)
+from backend.api.waiting_room import (
+    TICKET_HEADER, WaitingRoomPermission, spending_ticket, take_ticket, ticket_from_token
+)
 
 from backend.api.models.field_trip import FieldTrip, FieldTripRegistration
-from backend.api.models.school import School
-from backend.api.serializers import FieldTripSerializer, FieldTripPaymentSerializer
+from backend.api.serializers import (
+    CheckoutSerializer, CheckoutTransactionSerializer, FieldTripChangeSerializer, FieldTripSerializer,
+    FieldTripPaymentSerializer, ParentSearchResultSerializer, SchoolChangeSerializer,
+    StudentRegistrationStatusSerializer, StudentSearchResultSerializer, TransactionSerializer
+)
 from backend.api.models.student import Student
 from backend.api.models.parent import Parent
 from backend.api.models.transaction import Transaction
+from backend.api.models.transaction_line_item import TransactionLineItem
 from backend.legacy_api import LegacyPaymentProcessor
 
 
+def _find_or_create_parent(validated_data):
+    # Match on normalized keys, so differences in case, spacing or Unicode form reuse the same rows.
+    # The oldest row wins if duplicates predate the keys (dedupe_identities merges them).
+    parent_key = parent_match_key(
+        validated_data['parent_first_name'],
+        validated_data['parent_last_name'],
+        validated_data['email'],
+    )
+    parent = Parent.objects.filter(match_key=parent_key).order_by('pk').first()
+    if parent is None:
+        parent = Parent.objects.create(
+            first_name=validated_data['parent_first_name'].strip(),
+            last_name=validated_data['parent_last_name'].strip(),
+            email=validated_data['email'].strip(),
+        )
+    return parent
+
+
+def _find_or_create_student(parent, school, first_name, last_name):
+    student_key = student_match_key(first_name, last_name)
+    student = Student.objects.filter(parent=parent, school=school, match_key=student_key).order_by('pk').first()
+    if student is None:
+        student = Student.objects.create(
+            first_name=first_name.strip(),
+            last_name=last_name.strip(),
+            parent=parent,
+            school=school,
+        )
+    return student
+
+
+def _registration_lock_key(email, student_first_name, student_last_name, school_id, field_trip_id):
+    registration = "|".join([
+        normalize_identity(email),
+        student_match_key(student_first_name, student_last_name),
+        str(school_id).lower(),
+        str(field_trip_id).lower(),
+    ])
+    return "payment_" + hashlib.sha1(registration.encode("utf-8")).hexdigest()
+
+
 # Create your views here.
 
-class FieldTripView(generics.ListAPIView):
+class ReplicaReadMixin:
+    """
+    Let the view read from a replica; reads after a write in the same request use the primary
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class FieldTripView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    Upcoming field trips; `?include_past=1` lists past trips too.
+
+    With `settings.FIELD_TRIP_FAST_RENDERING`, the list is projected with `.values_list()` and encoded
+    with orjson; the response body is the same as through FieldTripSerializer and JSONRenderer
+    """
     queryset = FieldTrip.objects.all()
     serializer_class = FieldTripSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.query_params.get("include_past", "").lower() in ("1", "true", "yes"):
+            return queryset
+        return queryset.upcoming()
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not settings.FIELD_TRIP_FAST_RENDERING:
+            return renderers
+        return [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FIELD_TRIP_FAST_RENDERING or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return Response(field_trip_rows(self.filter_queryset(self.get_queryset())))
+
+
+class SchoolListView(APIView):
+    """
+    Serve the precomputed school directory, answering conditional GETs with 304
+    """
+
+    def get(self, request, *args, **kwargs):
+        directory = get_school_directory()
+
+        response = get_conditional_response(request, etag=directory.etag)
+        if response is None:
+            response = HttpResponse(directory.body, content_type="application/json")
+
+        response["ETag"] = directory.etag
+        response["Cache-Control"] = "public, no-cache"
+        return response
+
+
+class BootstrapView(APIView):
+    """
+    Serve the precomputed bootstrap body, compressed in the best encoding the client accepts.
+
+    Browsers reuse it for `BOOTSTRAP_MAX_AGE` seconds, then for up to `BOOTSTRAP_STALE_WHILE_REVALIDATE`
+    more while they revalidate it in the background, which a matching ETag answers with a 304.
+    """
+
+    def get(self, request, *args, **kwargs):
+        bootstrap = get_bootstrap()
+        encoding, body = bootstrap.negotiate(request.headers.get("Accept-Encoding"))
+        etag = bootstrap.etag(encoding)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type="application/json")
+            if encoding:
+                response["Content-Encoding"] = encoding
+
+        response["ETag"] = etag
+        patch_vary_headers(response, ["Accept-Encoding"])
+        response["Cache-Control"] = "public, max-age={}, stale-while-revalidate={}".format(
+            settings.BOOTSTRAP_MAX_AGE, settings.BOOTSTRAP_STALE_WHILE_REVALIDATE,
+        )
+        return response
+
+
+class CatalogueChangesView(APIView):
+    """
+    Schools and field trips changed or deleted since the `since` cursor, oldest first, `limit` at a time.
+
+    Pass the returned `cursor` as `since` to get the next page, and later the next changes. Reads stay
+    on the primary: a lagging replica could show a change after the cursor has moved past it.
+    """
+    default_limit = 500
+    max_limit = 5000
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get("since")
+        try:
+            since = Cursor.parse(since) if since else None
+        except InvalidCursor as error:
+            raise ValidationError({"since": [str(error)]})
+
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({"limit": ["Must be a number."]})
+        if limit < 1:
+            raise ValidationError({"limit": ["Must be at least 1."]})
+
+        changes = catalogue_changes(since, limit)
+        return Response({
+            "field_trips": FieldTripChangeSerializer(changes.field_trips, many=True).data,
+            "schools": SchoolChangeSerializer(changes.schools, many=True).data,
+            "deleted": [
+                {"type": tombstone.kind, "id": str(tombstone.object_id), "deleted_at": tombstone.deleted_at}
+                for tombstone in changes.deleted
+            ],
+            "cursor": str(changes.cursor),
+            "has_more": changes.has_more,
+        })
+
+
+class RegistrationStatusView(generics.ListAPIView):
+    """
+    Registration and payment status of every child of the parents with an email, across all trips.
+
+    POST with the email mails a signed link to it; GET with the link's `token` returns the status. The response
+    to POST is the same whether or not the email is known, so neither reveals who has registered.
+
+    Reads stay on the primary so a payment made moments ago is reported as paid.
+    """
+    serializer_class = StudentRegistrationStatusSerializer
+    throttle_classes = [RegistrationStatusIPThrottle, RegistrationStatusEmailThrottle]
+
+    def get_queryset(self):
+        # Matched like the payment path matches parents, so case and spacing in the email don't matter
+        return Parent.objects.filter(email_key=self.email_key).prefetch_related(
+            "children__fieldtripregistration_set",
+            "children__transactions",
+            "children__line_items",
+        )
+
+    def list(self, request, *args, **kwargs):
+        token = request.query_params.get("token")
+        if not token:
+            raise ValidationError({"token": ["This query parameter is required."]})
+        self.email_key = email_key_from_token(token)
+        if self.email_key is None:
+            raise PermissionDenied("This link is invalid or has expired.")
+
+        # A parent has a row in the shard of each of their children's schools
+        parents = [parent for shard_parents in fan_out(lambda alias: list(self.get_queryset()))
+                   for parent in shard_parents]
+        children = [child for parent in parents for child in parent.children.all()]
+        serializer = self.get_serializer(children, many=True)
+        return Response(serializer.data)
+
+    def post(self, request, *args, **kwargs):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            raise ValidationError({"email": ["This field is required."]})
+
+        email_key = parent_email_key(email)
+        if any(fan_out(lambda alias: Parent.objects.filter(email_key=email_key).exists())):
+            send_status_link(request, email)
+        return Response(
+            {"detail": "If this email has registrations, a link to their status has been sent to it."}, status=202
+        )
+
+
+class ReceiptView(APIView):
+    """
+    Download the receipt of a transaction, given the paying parent's email.
+
+    Receipts are rendered once in the receipt process pool and then served from the cache; the ETag is the
+    receipt's content key, so a receipt that changed (say, by a refund) is downloaded again.
+    """
+
+    def get(self, request, transaction_id, *args, **kwargs):
+        email = request.query_params.get("email")
+        if not email:
+            raise ValidationError({"email": ["This query parameter is required."]})
+
+        # The transaction is on its school's shard, which the id doesn't tell
+        found = [transaction
+                 for shard_transactions in fan_out(lambda alias: list(
+                     receipt_transactions(alias).filter(pk=transaction_id)))
+                 for transaction in shard_transactions]
+        # An email that doesn't match gets the same answer as a missing transaction
+        content = receipt_content(found[0]) if found else None
+        if content is None or normalize_identity(content["email"]) != normalize_identity(email):
+            raise NotFound()
+
+        key = receipt_key(content)
+        etag = '"{}"'.format(key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(get_receipt(content, key), content_type="text/html; charset=utf-8")
+            response["Content-Disposition"] = 'attachment; filename="receipt-{}.html"'.format(transaction_id)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class PersonSearchView(ReplicaReadMixin, APIView):
+    """
+    Prefix, substring and typo-tolerant search over students and parents, best matches first.
+
+    For school office staff: results include parents' emails and what each student has paid for.
+    """
+    permission_classes = [IsAdminUser]
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "")
+        if len(query.strip()) < 3:
+            raise ValidationError({"q": ["Enter at least 3 characters."]})
+
+        kind = request.query_params.get("type")
+        if kind not in (None, STUDENT, PARENT):
+            raise ValidationError({"type": ["Must be 'student' or 'parent'."]})
+
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), self.max_limit)
+        except ValueError:
+            raise ValidationError({"limit": ["Must be a number."]})
+        if limit < 1:
+            raise ValidationError({"limit": ["Must be at least 1."]})
+
+        kinds = (kind,) if kind else (STUDENT, PARENT)
+        if len(shard_aliases()) > 1:
+            results = [
+                result
+                for shard_results in fan_out(lambda alias: search_people(query, kinds=kinds, limit=limit, using=alias))
+                for result in shard_results
+            ][:limit]
+        else:
+            results = search_people(query, kinds=kinds, limit=limit, using=router.db_for_read(Student))
+        return Response([
+            StudentSearchResultSerializer(person).data if person_kind == STUDENT
+            else ParentSearchResultSerializer(person).data
+            for person_kind, person in results
+        ])
+
+
+class WaitingRoomView(APIView):
+    """
+    POST takes a waiting room ticket; GET with the ticket in `X-Waiting-Room-Ticket` reports its place in line.
+
+    Both are answered from the cache, without authentication or database access.
+    """
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = [WaitingRoomIPThrottle]
+
+    @staticmethod
+    def _ticket_response(token, ticket, status=200):
+        return Response({
+            "ticket": token,
+            "position": max(ticket.position, 0),
+            "admitted": ticket.admitted,
+            "retry_after": math.ceil(ticket.wait),
+        }, status=status)
+
+    def post(self, request, *args, **kwargs):
+        ticket = take_ticket()
+        return self._ticket_response(ticket.token, ticket, status=201)
+
+    def get(self, request, *args, **kwargs):
+        token = request.headers.get(TICKET_HEADER)
+        ticket = ticket_from_token(token) if token else None
+        if ticket is None:
+            raise ValidationError({TICKET_HEADER: ["Missing, invalid or expired ticket."]})
+        return self._ticket_response(token, ticket)
+
 
 class FieldTripPaymentView(generics.CreateAPIView):
     queryset = FieldTrip.objects.all()
     serializer_class = FieldTripPaymentSerializer
+    # Admission is checked before the throttles, so clients still in line don't spend their tokens
+    permission_classes = [WaitingRoomPermission]
+    throttle_classes = [PaymentIPThrottle, PaymentEmailThrottle, PaymentFieldTripThrottle]
+
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except AlreadyPaid as exc:
+            return Response(
+                {"detail": exc.detail, "transaction": TransactionSerializer(exc.transaction).data},
+                status=exc.status_code,
+            )
 
     def perform_create(self, serializer):
-        schools = School.objects.filter(pk=serializer.validated_data['school_id'])
-        field_trips = FieldTrip.objects.filter(pk=serializer.validated_data['field_trip_id'])
+        reference = serializer.validated_data.get('payment_reference')
+        publish_payment_event(reference, RECEIVED)
+        try:
+            self._check_and_pay(serializer)
+        except PaymentInProgress:
+            # The submission holding the lock reports the outcome
+            raise
+        except AlreadyPaid as exc:
+            publish_payment_event(reference, SUCCEEDED, transaction_id=exc.transaction.id)
+            raise
+        except Exception as exc:
+            publish_payment_event(reference, FAILED, detail=self._failure_message(exc))
+            raise
+
+    @staticmethod
+    def _failure_message(exc):
+        detail = exc.detail if isinstance(exc, APIException) else None
+        if isinstance(detail, list) and detail:
+            detail = detail[0]
+        return str(detail) if isinstance(detail, str) else "Payment processing failed."
 
-        if not schools.exists():
+    def _check_and_pay(self, serializer):
+        # Reference data comes from the in-process cache, so a payment spends no queries on it
+        school = reference.schools.get(serializer.validated_data['school_id'])
+        field_trip = reference.field_trips.get(serializer.validated_data['field_trip_id'])
+
+        if school is None:
             raise ValidationError("School does not exist")
 
-        if not field_trips.exists():
+        if field_trip is None:
             raise ValidationError("Field trip does not exist")
 
-        school: School = schools.first()
-        field_trip: FieldTrip = field_trips.first()
+        if field_trip.cancelled_at is not None:
+            raise ValidationError("Field trip has been cancelled")
+
+        # The school's shard is chosen before anything is written. Parallel submissions for the same
+        # registration are serialized, so only one reaches the gateway.
+        with use_shard(shard_for_school(school.id)), \
+                cache_lock(self._registration_lock_key(serializer.validated_data)) as acquired:
+            if not acquired:
+                raise PaymentInProgress()
+            self._register_and_pay(serializer, school, field_trip,
+                                   getattr(self.request, "waiting_room_ticket", None))
 
-        parent, _ = Parent.objects.get_or_create(
-            first_name=serializer.validated_data['parent_first_name'],
-            last_name=serializer.validated_data['parent_last_name'],
-            email=serializer.validated_data['email'],
+    @staticmethod
+    def _registration_lock_key(validated_data):
+        return _registration_lock_key(
+            validated_data['email'], validated_data['student_first_name'], validated_data['student_last_name'],
+            validated_data['school_id'], validated_data['field_trip_id'],
         )
 
-        student, _ = Student.objects.get_or_create(
-            first_name=serializer.validated_data['student_first_name'],
-            last_name=serializer.validated_data['student_last_name'],
-            parent=parent,
-            school=school
+    @staticmethod
+    def _register_and_pay(serializer, school, field_trip, ticket=None):
+        parent = _find_or_create_parent(serializer.validated_data)
+        student = _find_or_create_student(
+            parent, school, serializer.validated_data['student_first_name'],
+            serializer.validated_data['student_last_name'],
         )
 
         activity_registration, _ = FieldTripRegistration.objects.get_or_create(
@@ -54,6 +456,18 @@ class FieldTripPaymentView(generics.CreateAPIView):
             field_trip=field_trip,
         )
 
+        # A refunded payment leaves the registration unpaid
+        paid_transaction = Transaction.objects.filter(
+            student=student, activity=field_trip, refund_id__isnull=True,
+        ).first()
+        if paid_transaction is None:
+            line_item = (TransactionLineItem.objects
+                         .filter(student=student, field_trip=field_trip, refund_id__isnull=True)
+                         .select_related("transaction").first())
+            paid_transaction = line_item.transaction if line_item is not None else None
+        if paid_transaction is not None:
+            raise AlreadyPaid(paid_transaction)
+
         payment_data = {
             "student_name": student.__str__(),
             "parent_name": parent.__str__(),
@@ -65,11 +479,14 @@ class FieldTripPaymentView(generics.CreateAPIView):
             "activity_id": field_trip.id,
         }
 
-        legacy_payment_processor = LegacyPaymentProcessor()
-        response = legacy_payment_processor.process_payment(payment_data)
+        reference = serializer.validated_data.get('payment_reference')
+        publish_payment_event(reference, PROCESSING)
 
-        if not response.success:
-            raise ValidationError(response.error_message)
+        # The waiting room ticket is only spent on a charge that goes through
+        with spending_ticket(ticket):
+            response = audited_payment(LegacyPaymentProcessor(), payment_data)
+            if not response.success:
+                raise ValidationError(response.error_message)
 
         transaction = Transaction()
         transaction.id = response.transaction_id
@@ -78,3 +495,196 @@ class FieldTripPaymentView(generics.CreateAPIView):
         transaction.amount = payment_data['amount']
         transaction.date = timezone.localtime(timezone.now())
         transaction.save()
+
+        publish_payment_event(reference, SUCCEEDED, transaction_id=transaction.id)
+
+
+class CheckoutView(generics.CreateAPIView):
+    """
+    Pay for several registrations (children x field trips) with a single gateway charge.
+
+    Every item is validated first; the registrations are then written in one bulk insert, the summed
+    cost is charged in one gateway call and the transaction is linked to each registration through
+    its line items. A cart of N registrations costs one gateway round trip instead of N.
+    """
+    serializer_class = CheckoutSerializer
+    permission_classes = [WaitingRoomPermission]
+    throttle_classes = [PaymentIPThrottle, PaymentEmailThrottle]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        reference = serializer.validated_data.get('payment_reference')
+        publish_payment_event(reference, RECEIVED)
+        try:
+            transaction = self._check_and_pay(serializer.validated_data,
+                                              getattr(request, "waiting_room_ticket", None))
+        except PaymentInProgress:
+            # The submission holding the locks reports the outcome
+            raise
+        except ItemsAlreadyPaid as exc:
+            publish_payment_event(reference, FAILED, detail=str(exc.detail))
+            return Response(
+                {"detail": exc.detail, "transaction_ids": exc.transaction_ids},
+                status=exc.status_code,
+            )
+        except Exception as exc:
+            publish_payment_event(reference, FAILED, detail=FieldTripPaymentView._failure_message(exc))
+            raise
+        return Response(CheckoutTransactionSerializer(transaction).data, status=201)
+
+    @staticmethod
+    def _check_and_pay(validated_data, ticket=None):
+        items = validated_data['items']
+        schools = reference.schools.get_many({item['school_id'] for item in items})
+        field_trips = reference.field_trips.get_many({item['field_trip_id'] for item in items})
+
+        errors = [{} for _ in items]
+        for index, item in enumerate(items):
+            if item['school_id'] not in schools:
+                errors[index]['school_id'] = ["School does not exist"]
+            if item['field_trip_id'] not in field_trips:
+                errors[index]['field_trip_id'] = ["Field trip does not exist"]
+            elif field_trips[item['field_trip_id']].cancelled_at is not None:
+                errors[index]['field_trip_id'] = ["Field trip has been cancelled"]
+        if any(errors):
+            raise ValidationError({"items": errors})
+
+        # One transaction lives on one shard, with the students it paid for
+        shards = {shard_for_school(school_id) for school_id in schools}
+        if len(shards) > 1:
+            raise ValidationError({"items": ["These schools can't be paid for together; check out each school "
+                                             "separately."]})
+
+        lock_keys = sorted({
+            _registration_lock_key(validated_data['email'], item['student_first_name'], item['student_last_name'],
+                                   item['school_id'], item['field_trip_id'])
+            for item in items
+        })
+        # Locks are taken in key order, so overlapping carts can't each hold part of the other's
+        with use_shard(shards.pop()), ExitStack() as locks:
+            for lock_key in lock_keys:
+                if not locks.enter_context(cache_lock(lock_key)):
+                    raise PaymentInProgress()
+            return CheckoutView._register_and_pay(validated_data, schools, field_trips, ticket)
+
+    @staticmethod
+    def _register_and_pay(validated_data, schools, field_trips, ticket=None):
+        using = router.db_for_write(FieldTripRegistration)
+        with atomic(using=using):
+            parent = _find_or_create_parent(validated_data)
+            students = {}
+            lines = []
+            for item in validated_data['items']:
+                school = schools[item['school_id']]
+                student_key = (student_match_key(item['student_first_name'], item['student_last_name']), school.pk)
+                if student_key not in students:
+                    students[student_key] = _find_or_create_student(
+                        parent, school, item['student_first_name'], item['student_last_name'],
+                    )
+                lines.append((students[student_key], field_trips[item['field_trip_id']]))
+
+            student_ids = {student.pk for student in students.values()}
+            field_trip_ids = {field_trip.pk for _, field_trip in lines}
+            paid = dict(
+                ((student_id, field_trip_id), transaction_id) for student_id, field_trip_id, transaction_id in
+                Transaction.objects.filter(student__in=student_ids, activity__in=field_trip_ids, refund_id__isnull=True)
+                .values_list("student_id", "activity_id", "id")
+            )
+            for student_id, field_trip_id, transaction_id in (
+                    TransactionLineItem.objects.filter(student__in=student_ids, field_trip__in=field_trip_ids,
+                                                       refund_id__isnull=True)
+                    .values_list("student_id", "field_trip_id", "transaction_id")):
+                paid.setdefault((student_id, field_trip_id), transaction_id)
+            paid_items = {index: paid[student.pk, field_trip.pk] for index, (student, field_trip) in enumerate(lines)
+                          if (student.pk, field_trip.pk) in paid}
+            if paid_items:
+                raise ItemsAlreadyPaid(paid_items)
+
+            registered = set(
+                FieldTripRegistration.objects.filter(student__in=student_ids, field_trip__in=field_trip_ids)
+                .values_list("student_id", "field_trip_id")
+            )
+            FieldTripRegistration.objects.bulk_create([
+                FieldTripRegistration(student=student, field_trip=field_trip) for student, field_trip in lines
+                if (student.pk, field_trip.pk) not in registered
+            ])
+
+        amounts = [Decimal(str(field_trip.cost)) for _, field_trip in lines]
+        payment_data = {
+            "student_name": ", ".join(dict.fromkeys(str(student) for student, _ in lines)),
+            "parent_name": str(parent),
+            "amount": float(sum(amounts)),
+            "card_number": validated_data['card_number'],
+            "expiry_date": validated_data['expiry_date'],
+            "cvv": validated_data['cvv'],
+            "school_id": ",".join(dict.fromkeys(str(student.school_id) for student, _ in lines)),
+            "activity_id": ",".join(dict.fromkeys(str(field_trip.pk) for _, field_trip in lines)),
+        }
+
+        reference = validated_data.get('payment_reference')
+        publish_payment_event(reference, PROCESSING)
+
+        # Outside the database transaction, so the gateway round trip holds no locks on the registrations
+        with spending_ticket(ticket):
+            response = audited_payment(LegacyPaymentProcessor(), payment_data)
+            if not response.success:
+                raise ValidationError(response.error_message)
+
+        with atomic(using=using):
+            transaction = Transaction.objects.create(
+                id=response.transaction_id,
+                amount=sum(amounts),
+                date=timezone.localtime(timezone.now()),
+            )
+            TransactionLineItem.objects.bulk_create([
+                TransactionLineItem(transaction=transaction, student=student, field_trip=field_trip, amount=amount)
+                for (student, field_trip), amount in zip(lines, amounts)
+            ])
+
+        publish_payment_event(reference, SUCCEEDED, transaction_id=transaction.id)
+        return transaction
+
+
+class PaymentEventsView(View):
+    """
+    Server-Sent Events stream of a payment's state transitions, ending at `succeeded` or `failed`.
+
+    Under ASGI a waiting client holds an idle connection rather than a worker thread.
+    """
+
+    def get(self, request, reference, *args, **kwargs):
+        if isinstance(request, ASGIRequest):
+            stream = async_event_stream(reference)
+        else:
+            stream = event_stream(reference)
+
+        response = StreamingHttpResponse(stream, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class LivenessView(View):
+    """
+    Answers while the process can serve requests; checks nothing else, so a busy worker isn't restarted
+    """
+
+    def get(self, request, *args, **kwargs):
+        response = JsonResponse({"status": "ok"})
+        response["Cache-Control"] = "no-store"
+        return response
+
+
+class ReadinessView(View):
+    """
+    200 while this worker should get traffic, 503 when saturated, cut off from the database, seeing
+    gateway errors or draining; the body has the figures behind each check (see backend/api/health.py)
+    """
+
+    def get(self, request, *args, **kwargs):
+        ready, checks = readiness()
+        response = JsonResponse({"ready": ready, "checks": checks}, status=200 if ready else 503)
+        response["Cache-Control"] = "no-store"
+        return response
@@ -0,0 +1,156 @@
+"""
+Virtual waiting room in front of POST /api/payment.
+
+Clients take a numbered ticket from `POST /api/waiting-room` and poll `GET /api/waiting-room` with
+it until they are admitted; the payment view only accepts admitted tickets. Tickets are admitted
+in order at `settings.WAITING_ROOM_RATE` per second, so however large the surge, payments reach the
+gateway and database at that rate.
+
+The room is two entries in `settings.WAITING_ROOM_CACHE`:
+
+- the last ticket number handed out, advanced with the cache's atomic `incr`
+- the admission origin: ticket `n` is admitted at `origin + n / rate`. Nothing advances the queue
+  on a timer; a ticket's position is computed from the clock when it is checked. When a ticket
+  arrives at an idle room the origin is moved forward so that ticket is admitted at once, without
+  letting an idle room bank admissions for the next surge.
+
+Tickets are signed, so they cannot be forged or renumbered. An admitted ticket pays once: it is
+marked used in the cache when its payment goes to the gateway, and later requests carrying it are
+turned away, so a ticket can't be replayed or shared to get past the admission rate. A request
+rejected before the charge (invalid form, throttled, already paid) or a declined charge leaves the
+ticket usable, so the parent retries without queueing again.
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from rest_framework.permissions import BasePermission
+
+from backend.api.exceptions import NotYetAdmitted, TicketAlreadyUsed, WaitingRoomRequired
+
+TAIL_KEY = "waiting_room_tail"
+ORIGIN_KEY = "waiting_room_origin"
+USED_KEY = "waiting_room_used_{}"
+
+TOKEN_SALT = "backend.api.waiting_room"
+
+TICKET_HEADER = "X-Waiting-Room-Ticket"
+
+
+@dataclass(frozen=True)
+class Ticket:
+    number: int
+    position: int
+
+    @property
+    def admitted(self):
+        return self.position <= 0
+
+    @property
+    def wait(self):
+        """
+        Estimated seconds until admission
+        """
+        return max(self.position, 0) / settings.WAITING_ROOM_RATE
+
+    @property
+    def token(self):
+        return signing.dumps(self.number, salt=TOKEN_SALT)
+
+
+def _cache():
+    return caches[settings.WAITING_ROOM_CACHE]
+
+
+def take_ticket():
+    cache = _cache()
+    cache.add(TAIL_KEY, 0, timeout=None)
+    number = cache.incr(TAIL_KEY)
+
+    # The latest origin that still admits this ticket now; if the stored origin is earlier, the
+    # room had gone idle and would otherwise admit a backlog of slots nobody used
+    latest_origin = time.time() - number / settings.WAITING_ROOM_RATE
+    if cache.get(ORIGIN_KEY, latest_origin - 1) < latest_origin:
+        cache.set(ORIGIN_KEY, latest_origin, timeout=None)
+    return check_ticket(number)
+
+
+def check_ticket(number):
+    origin = _cache().get(ORIGIN_KEY)
+    if origin is None:
+        return Ticket(number=number, position=0)
+    # The epsilon keeps float rounding from holding back a ticket admitted exactly now
+    head = int((time.time() - origin) * settings.WAITING_ROOM_RATE + 1e-9)
+    return Ticket(number=number, position=number - head)
+
+
+def ticket_from_token(token):
+    """
+    The ticket a token was issued for, or None if it is forged or older than WAITING_ROOM_TOKEN_MAX_AGE
+    """
+    try:
+        number = signing.loads(token, salt=TOKEN_SALT, max_age=settings.WAITING_ROOM_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return check_ticket(number)
+
+
+def ticket_used(ticket):
+    return _cache().get(USED_KEY.format(ticket.number), False)
+
+
+def use_ticket(ticket):
+    """
+    Mark an admitted ticket used; False if it already was. `cache.add` is atomic, so of concurrent
+    requests with the same ticket only one gets through.
+    """
+    # A token is rejected once older than WAITING_ROOM_TOKEN_MAX_AGE, so the mark needn't outlive it
+    return _cache().add(USED_KEY.format(ticket.number), True, timeout=settings.WAITING_ROOM_TOKEN_MAX_AGE)
+
+
+def release_ticket(ticket):
+    _cache().delete(USED_KEY.format(ticket.number))
+
+
+@contextmanager
+def spending_ticket(ticket):
+    """
+    Use up `ticket` for the gateway charge made in the block; it is given back if the block raises
+    (a declined or failed charge). No-op for None, when the room is off.
+    """
+    if ticket is None:
+        yield
+        return
+    if not use_ticket(ticket):
+        raise TicketAlreadyUsed()
+    try:
+        yield
+    except BaseException:
+        release_ticket(ticket)
+        raise
+
+
+class WaitingRoomPermission(BasePermission):
+    """
+    Only let requests carrying an admitted, unused waiting room ticket (`X-Waiting-Room-Ticket`) through
+    while `settings.WAITING_ROOM_ENABLED` is on. The ticket is kept on `request.waiting_room_ticket` for
+    the view to spend with `spending_ticket()` once it charges.
+    """
+
+    def has_permission(self, request, view):
+        if not settings.WAITING_ROOM_ENABLED:
+            return True
+
+        token = request.headers.get(TICKET_HEADER)
+        ticket = ticket_from_token(token) if token else None
+        if ticket is None:
+            raise WaitingRoomRequired()
+        if not ticket.admitted:
+            raise NotYetAdmitted(ticket)
+        if ticket_used(ticket):
+            raise TicketAlreadyUsed()
+        request.waiting_room_ticket = ticket
+        return True
@@ -14,6 +14,13 @@ class PaymentResponse:
     error_message: Optional[str] = None
 
 
+@dataclass
+class RefundResponse:
+    success: bool
+    refund_id: Optional[str] = None
+    error_message: Optional[str] = None
+
+
 class LegacyPaymentProcessor:
     """
     Legacy payment processor that accepts payments and provides responses.
@@ -93,6 +100,41 @@ class LegacyPaymentProcessor:
             transaction_id=transaction_id
         )
 
+    def refund(self, transaction_id, amount):
+        """
+        Refund a processed payment:
+        - transaction_id: str (as returned by process_payment)
+        - amount: float (must not exceed the payment)
+        """
+
+        if not isinstance(transaction_id, str) or not transaction_id:
+            return RefundResponse(
+                success=False,
+                error_message="Missing transaction id."
+            )
+
+        if not isinstance(amount, (int, float)) or amount <= 0:
+            return RefundResponse(
+                success=False,
+                error_message="Refund amount must be a positive number."
+            )
+
+        # Simulate processing time
+        time.sleep(1.5)
+
+        # Simulate occasional refund failures
+        if random.random() < 0.1:  # 10% chance of failure
+            return RefundResponse(
+                success=False,
+                error_message="Refund rejected by processor. Please try again."
+            )
+
+        refund_id = f"RF-{int(time.time())}-{random.randint(1000, 9999)}"
+        return RefundResponse(
+            success=True,
+            refund_id=refund_id
+        )
+
     def _validate_expiry_format(self, expiry):
         """Validate the expiry date is in MM/YY format."""
 
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +47,13 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:5173',
 ]
 
+CORS_ALLOW_HEADERS = [
+    *default_headers,
+    'x-waiting-room-ticket',
+]
+
 MIDDLEWARE = [
+    'backend.api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +84,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Points the directories below (AUDIT_LOG_DIR, RECEIPT_DIR, ...) at a temporary directory during tests
+TEST_RUNNER = 'backend.test_runner.TemporaryDirectoriesTestRunner'
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -85,6 +97,34 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_NAMES=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+# Catalogue and reporting views read from them; writes and read-after-write stay on 'default'
+
+for index, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_NAMES', '').split(','))):
+    DATABASES['replica{}'.format(index + 1)] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# School shards, e.g. DATABASE_SHARD_NAMES=district_a=/srv/district_a.sqlite3,district_b=/srv/district_b.sqlite3
+# SCHOOL_SHARDS maps a school id to the shard holding its parents, students, registrations and
+# transactions; unmapped schools stay on 'default'. Schools and field trips are written to 'default'
+# and mirrored to every shard. Run `migrate --database <alias>` for each shard.
+
+for shard in filter(None, os.environ.get('DATABASE_SHARD_NAMES', '').split(',')):
+    alias, name = shard.split('=', 1)
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+
+SCHOOL_SHARDS = {}
+
+DATABASE_ROUTERS = ['backend.api.routers.SchoolShardRouter', 'backend.api.routers.PrimaryReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -123,3 +163,222 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Point 'default' at Redis or Memcached to share throttle buckets and payment locks between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+THROTTLE_CACHE = 'default'
+
+LOCK_CACHE = 'default'
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # Token buckets on POST /api/payment: "<burst>/<period>", refilled at that rate
+    'DEFAULT_THROTTLE_RATES': {
+        'payment_ip': '20/min',
+        'payment_email': '5/min',
+        'payment_field_trip': '300/min',
+        'waiting_room_ip': '10/min',
+        'registration_status_ip': '20/min',
+        'registration_status_email': '3/hour',
+    },
+}
+
+# School directory (GET /api/schools)
+# Seconds the in-process payload is kept before it is rebuilt from the database
+
+SCHOOL_DIRECTORY_TTL = 300
+
+# Bootstrap (GET /api/bootstrap)
+# Seconds the rendered and compressed body is kept in process; catalogue changes rebuild it sooner
+
+BOOTSTRAP_TTL = 300
+
+# Seconds browsers reuse the response, and then keep serving it while they revalidate in the background
+BOOTSTRAP_MAX_AGE = 60
+
+BOOTSTRAP_STALE_WHILE_REVALIDATE = 86400
+
+# Reference data cache (School and FieldTrip rows on the payment path, see backend/api/reference.py)
+# Rows kept in process per model, and seconds they are kept; other processes see a change within the TTL
+
+REFERENCE_CACHE_SIZE = 1024
+
+REFERENCE_CACHE_TTL = 60
+
+# Alias in CACHES shared by every worker (e.g. Redis), read before the database; None to use only the
+# in-process cache
+
+REFERENCE_SHARED_CACHE = os.environ.get('REFERENCE_SHARED_CACHE') or None
+
+REFERENCE_SHARED_CACHE_TTL = 300
+
+# Cart checkout (POST /api/checkout)
+# Registrations one checkout can pay for, with a single gateway charge
+
+CHECKOUT_MAX_ITEMS = 20
+
+# Payment events (GET /api/payment/<reference>/events)
+# LocalPaymentEvents only reaches streams served by the same process; with several workers use
+# 'backend.api.events.RedisPaymentEvents' and point PAYMENT_EVENTS_REDIS_URL at a shared Redis
+
+PAYMENT_EVENTS_BACKEND = 'backend.api.events.LocalPaymentEvents'
+
+PAYMENT_EVENTS_REDIS_URL = os.environ.get('PAYMENT_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+
+# Seconds the last state of a payment is kept for clients that connect late
+PAYMENT_EVENTS_TTL = 600
+
+# Payments whose last state is kept in process
+PAYMENT_EVENTS_RETAINED = 10000
+
+# Seconds between keepalive comments, and before an open stream is closed (EventSource reconnects)
+PAYMENT_EVENTS_HEARTBEAT = 15
+
+PAYMENT_EVENTS_STREAM_TIMEOUT = 120
+
+# Whether the SPA follows payments over the event stream. Under WSGI each open stream holds a worker
+# thread, so only turn this on when the stream is served from ASGI (`backend.asgi`); otherwise the
+# client waits for the payment's POST response alone
+PAYMENT_EVENTS_STREAMING = os.environ.get('PAYMENT_EVENTS_STREAMING') == '1'
+
+# Field trip list (GET /api/fieldtrip)
+# Project rows with .values_list() and encode with orjson (when installed) instead of going through
+# FieldTripSerializer and the stdlib JSON encoder; the response body is identical either way
+
+FIELD_TRIP_FAST_RENDERING = True
+
+# Catalogue snapshot
+# Directory the GET /api/fieldtrip body is published to as static files (see the README for the
+# nginx configuration); None turns publishing off
+
+CATALOGUE_SNAPSHOT_DIR = os.environ.get('CATALOGUE_SNAPSHOT_DIR') or None
+
+# Content-hashed versions kept for clients still fetching an older one
+CATALOGUE_SNAPSHOT_KEEP = 5
+
+# Catalogue changes feed (GET /api/catalogue/changes)
+# Seconds a change is held back before the feed reports it, longer than any catalogue write transaction
+
+CATALOGUE_CHANGES_SETTLE = 5
+
+# Seconds deletions are remembered; clients whose cursor is older have to sync from the start
+CATALOGUE_TOMBSTONE_RETENTION = 30 * 24 * 60 * 60
+
+# Waiting room (POST /api/waiting-room)
+# When enabled, POST /api/payment needs an admitted ticket; tickets are admitted in order at
+# WAITING_ROOM_RATE per second, which bounds the load on the gateway and database during surges
+
+WAITING_ROOM_ENABLED = os.environ.get('WAITING_ROOM_ENABLED') == '1'
+
+WAITING_ROOM_RATE = 5
+
+WAITING_ROOM_CACHE = 'default'
+
+# Seconds a ticket stays valid, covering the wait in line and the payment itself
+WAITING_ROOM_TOKEN_MAX_AGE = 3600
+
+# Registration status (POST /api/registrations mails a link, GET /api/registrations?token= opens it)
+# Seconds a status link stays valid
+REGISTRATION_STATUS_LINK_MAX_AGE = 86400
+
+# Refunds (python manage.py refund_field_trip <id>)
+# Gateway calls in flight at once; each takes a second or more, so this sets how long a trip takes to refund
+REFUND_WORKERS = 16
+
+# Receipts (GET /api/receipts/<transaction id>, python manage.py prerender_receipts <field trip id>)
+# Rendered receipts, stored under a hash of their content
+
+RECEIPT_DIR = os.environ.get('RECEIPT_DIR') or str(BASE_DIR / 'receipts')
+
+# Processes rendering receipts, off the API worker; 0 renders in the worker itself
+RECEIPT_WORKERS = int(os.environ.get('RECEIPT_WORKERS', 2))
+
+# Seconds a download waits for its receipt to render before answering 503
+RECEIPT_RENDER_TIMEOUT = 10
+
+# Payment archive (python manage.py archive_payments)
+# Transactions and registrations of trips older than this move to the archive tables
+
+PAYMENT_ARCHIVE_RETENTION_DAYS = 730
+
+# Rows moved per database transaction
+PAYMENT_ARCHIVE_BATCH_SIZE = 1000
+
+# Gateway audit log
+# Every gateway call is recorded to <AUDIT_LOG_DIR>/gateway-<pid>.ndjson by a background thread;
+# None turns auditing off. Test runs write to a temporary directory (backend/test_runner.py)
+
+AUDIT_LOG_DIR = os.environ.get('AUDIT_LOG_DIR') or str(BASE_DIR / 'logs')
+
+AUDIT_LOG_MAX_BYTES = 50 * 1024 * 1024
+
+AUDIT_LOG_BACKUPS = 10
+
+# Records waiting for the writer; further records are dropped (and counted) rather than block a payment
+AUDIT_LOG_QUEUE_SIZE = 10000
+
+AUDIT_LOG_BATCH_SIZE = 500
+
+# Analytics (python manage.py extract_analytics, analytics_report)
+# Columnar copies of the transactions for reports, kept off the transactional database
+
+ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR') or str(BASE_DIR / 'analytics')
+
+# Seconds of the most recent transactions left for the next extraction, longer than a payment transaction
+ANALYTICS_SETTLE = 60
+
+ANALYTICS_BATCH_SIZE = 10000
+
+# Parts (one per extraction with new rows) before they are compacted into one
+ANALYTICS_MAX_PARTS = 32
+
+# Health checks (GET /api/health/live, GET /api/health/ready)
+# Readiness fails once this many gateway payment calls are in flight in the worker; set it to the
+# worker's threads, less a few for the other endpoints
+
+HEALTH_PAYMENT_CAPACITY = int(os.environ.get('HEALTH_PAYMENT_CAPACITY', 16))
+
+# Readiness fails when more than this share of the gateway calls in the last HEALTH_GATEWAY_WINDOW
+# seconds failed, once there were at least HEALTH_GATEWAY_MIN_CALLS of them
+HEALTH_GATEWAY_MAX_ERROR_RATE = 0.5
+
+HEALTH_GATEWAY_WINDOW = 60
+
+HEALTH_GATEWAY_MIN_CALLS = 20
+
+# Readiness fails while this file exists, to drain the worker before a deploy; None turns it off
+HEALTH_DRAIN_FILE = os.environ.get('HEALTH_DRAIN_FILE') or None
+
+# Request profiling (see backend/api/profiling.py)
+# Off unless PROFILING_ENABLED=1, in which case ProfilingMiddleware profiles a PROFILING_SAMPLE_RATE
+# fraction of requests, requests slower than PROFILING_SLOW_MS, and requests sending
+# `X-Profile: <PROFILING_TOKEN>`; the newest PROFILING_KEEP profiles are kept in PROFILING_DIR
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+
+PROFILING_DIR = os.environ.get('PROFILING_DIR') or str(BASE_DIR / 'profiles')
+
+PROFILING_KEEP = 200
+
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+
+# None turns slow request capture off; otherwise every request is sampled to catch the slow ones
+PROFILING_SLOW_MS = int(os.environ['PROFILING_SLOW_MS']) if os.environ.get('PROFILING_SLOW_MS') else None
+
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+
+# 'sampler' (collapsed stacks for flame graphs) or 'cprofile' (pstats files, much slower requests)
+PROFILING_MODE = 'sampler'
+
+# Seconds between stack samples
+PROFILING_INTERVAL = 0.005
@@ -0,0 +1,39 @@
+"""
+API-only settings for backend project workers.
+
+Serves the `/api/` endpoints without the admin, sessions, messages, templates and
+static files stack, so autoscaled workers start faster and use less memory. Run
+migrations and the admin with `backend.settings`; point API workers at this module:
+
+    DJANGO_SETTINGS_MODULE=backend.settings_api gunicorn backend.wsgi
+"""
+
+from backend.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'corsheaders',
+    'backend.api'
+]
+
+MIDDLEWARE = [
+    'backend.api.profiling.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'corsheaders.middleware.CorsMiddleware'
+]
+
+ROOT_URLCONF = 'backend.urls_api'
+
+TEMPLATES = []
+
+# The API is anonymous and JSON-only, so DRF must not reach for django.contrib.auth
+# or the browsable API templates
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'UNAUTHENTICATED_USER': None,
+}
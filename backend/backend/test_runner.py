@@ -0,0 +1,34 @@
+"""
+Test runner for backend project.
+
+The directories the app writes to default to folders under BASE_DIR, so that production writes
+somewhere without extra configuration. A test run points them at one temporary directory instead,
+removed when the run ends; tests that need a directory of their own still override the setting.
+
+    TEST_RUNNER = 'backend.test_runner.TemporaryDirectoriesTestRunner'
+"""
+import tempfile
+from pathlib import Path
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from backend.api.audit import close_gateway_audit_log
+
+WRITABLE_DIRECTORIES = ['AUDIT_LOG_DIR', 'RECEIPT_DIR', 'ANALYTICS_DIR', 'PROFILING_DIR']
+
+
+class TemporaryDirectoriesTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._directory = tempfile.TemporaryDirectory(prefix='backend-tests-')
+        self._directories = override_settings(**{
+            name: str(Path(self._directory.name) / name.lower()) for name in WRITABLE_DIRECTORIES
+        })
+        self._directories.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        close_gateway_audit_log()
+        self._directories.disable()
+        self._directory.cleanup()
+        super().teardown_test_environment(**kwargs)
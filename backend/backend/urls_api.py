@@ -0,0 +1,8 @@
+"""
+URL configuration for API-only workers (see backend.settings_api).
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('backend.api.urls')),
+]
@@ -0,0 +1,80 @@
+"""
+Analytics report benchmark over a synthetic columnar transactions table.
+
+Writes `--rows` random payments (and `--refund-rate` refunds) straight to a temporary analytics
+table, then times each report. No database is involved, as in production.
+
+Run from the backend folder:
+
+    python -m benchmarks.analytics [--rows 2000000] [--schools 200] [--trips 500]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import django
+import numpy
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from backend.api.analytics import participation_by_trip, revenue_by_school_day, transactions_table  # noqa: E402
+
+
+def populate(directory, rows, schools, trips, refund_rate):
+    random.seed(7)
+    table = transactions_table(directory)
+    students_per_school = 500
+    payments = {
+        "day": [20300 + random.randrange(365) for _ in range(rows)],
+        "school": [random.randrange(schools) for _ in range(rows)],
+        "field_trip": [random.randrange(trips) for _ in range(rows)],
+        "amount_cents": [random.randrange(500, 8000) for _ in range(rows)],
+    }
+    payments["student"] = [school * students_per_school + random.randrange(students_per_school)
+                           for school in payments["school"]]
+    payments["sign"] = [1] * rows
+    refunds = [index for index in range(rows) if random.random() < refund_rate]
+    columns = {column: values + [values[index] for index in refunds] for column, values in payments.items()}
+    columns["amount_cents"][rows:] = [-payments["amount_cents"][index] for index in refunds]
+    columns["sign"][rows:] = [-1] * len(refunds)
+
+    manifest = table.manifest()
+    manifest.update({
+        "schools": [["school-{}".format(index), "School {}".format(index)] for index in range(schools)],
+        "field_trips": [["trip-{}".format(index), "Trip {}".format(index)] for index in range(trips)],
+        "students": {str(index): students_per_school for index in range(schools)},
+    })
+    table.write_part(manifest, columns)
+    table.write_manifest(manifest)
+    return len(columns["day"])
+
+
+def timed(function, directory):
+    started = time.perf_counter()
+    rows = function(directory)
+    return (time.perf_counter() - started) * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--schools", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=500)
+    parser.add_argument("--refund-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        total = populate(directory, args.rows, args.schools, args.trips, args.refund_rate)
+        print("{:,} rows, {} schools, {} trips, NumPy {}".format(total, args.schools, args.trips, numpy.__version__))
+        print("{:<28} {:>10} {:>10}".format("report", "rows", "ms"))
+        for name, report in [("revenue per school per day", revenue_by_school_day),
+                             ("participation per trip", participation_by_trip)]:
+            elapsed_ms, rows = timed(report, directory)
+            print("{:<28} {:>10,} {:>10.0f}".format(name, rows, elapsed_ms))
+
+
+if __name__ == "__main__":
+    main()
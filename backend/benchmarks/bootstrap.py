@@ -0,0 +1,89 @@
+"""
+First paint benchmark: GET /api/fieldtrip vs GET /api/bootstrap.
+
+Fills a temporary SQLite database with `--trips` field trips and `--schools` schools, then measures
+what the SPA downloads before its first render: the size of each response body, the server time
+to answer it, and an estimate of the time until the data is in the browser on a slow mobile
+connection (one round trip plus the body at `--downlink-kbps`; defaults close to "Slow 3G").
+
+Run from the backend folder:
+
+    python -m benchmarks.bootstrap [--trips 200] [--schools 50] [--downlink-kbps 400] [--rtt-ms 400]
+"""
+import argparse
+import gzip
+import os
+import statistics
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from backend.api.bootstrap import brotli, invalidate_bootstrap  # noqa: E402
+from benchmarks.fieldtrip import populate  # noqa: E402
+
+
+def timed_get(client, path, repeat, **headers):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, **headers)
+        timings.append(time.perf_counter() - started)
+    assert response.status_code == 200, response.status_code
+    return statistics.median(timings) * 1000, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trips", type=int, default=200)
+    parser.add_argument("--schools", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--downlink-kbps", type=float, default=400)
+    parser.add_argument("--rtt-ms", type=float, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connections.settings["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+        connections["default"].close()
+        call_command("migrate", verbosity=0)
+        populate(args.trips, args.schools)
+        invalidate_bootstrap()
+        client = Client(HTTP_HOST="localhost")
+
+        started = time.perf_counter()
+        client.get("/api/bootstrap")
+        build_ms = (time.perf_counter() - started) * 1000
+
+        fieldtrip_ms, fieldtrip = timed_get(client, "/api/fieldtrip", args.repeat)
+        variants = [
+            ("GET /api/fieldtrip", fieldtrip_ms, len(fieldtrip.content)),
+            # What a proxy compressing on the fly would send; Django itself sends the plain body
+            ("GET /api/fieldtrip, gzipped by a proxy", fieldtrip_ms, len(gzip.compress(fieldtrip.content))),
+        ]
+        for name, accept_encoding in [("", "identity"), ("gzip", "gzip"), ("br", "br, gzip")]:
+            if name == "br" and brotli is None:
+                continue
+            elapsed_ms, response = timed_get(client, "/api/bootstrap", args.repeat,
+                                             HTTP_ACCEPT_ENCODING=accept_encoding)
+            assert response.get("Content-Encoding", "") == name
+            variants.append(("GET /api/bootstrap" + (", " + name if name else ""), elapsed_ms, len(response.content)))
+
+        print("{:,} trips, {} schools, brotli {}; {:g} kbps down, {:g} ms round trip".format(
+            args.trips, args.schools, "installed" if brotli else "not installed", args.downlink_kbps, args.rtt_ms))
+        print("bootstrap body built and compressed in {:.1f} ms, then served from memory".format(build_ms))
+        print("{:<40} {:>12} {:>11} {:>16}".format("request", "body (bytes)", "server (ms)", "first data (ms)"))
+        for name, elapsed_ms, size in variants:
+            first_data_ms = elapsed_ms + args.rtt_ms + size * 8 / args.downlink_kbps
+            print("{:<40} {:>12,} {:>11.1f} {:>16,.0f}".format(name, size, elapsed_ms, first_data_ms))
+        print("repeat visits within BOOTSTRAP_MAX_AGE use the browser's copy; after it a 304 costs one round trip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Cart checkout benchmark: one POST /api/payment per registration vs one POST /api/checkout.
+
+A parent registers `--children` children for `--trips` field trips. The gateway is replaced by a stub
+that answers after `--gateway-ms` (the legacy processor sleeps 1.5 s and declines 10% of payments at
+random), so the run measures what the API adds around gateway round trips. Reports the gateway calls,
+the end-to-end time and the transactions written for each way of paying.
+
+Run from the backend folder:
+
+    python -m benchmarks.checkout [--children 3] [--trips 2] [--gateway-ms 1500]
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from backend.api.models.field_trip import FieldTrip  # noqa: E402
+from backend.api.models.school import School  # noqa: E402
+from backend.api.models.transaction import Transaction  # noqa: E402
+from backend.legacy_api import PaymentResponse  # noqa: E402
+
+PARENT = {
+    "parent_first_name": "Marge",
+    "parent_last_name": "Simpson",
+    "card_number": "1234567890123456",
+    "expiry_date": "12/30",
+    "cvv": "123",
+}
+
+
+class StubGateway:
+    calls = 0
+    latency = 1.5
+    _ids = itertools.count(1)
+
+    def process_payment(self, payment_data):
+        StubGateway.calls += 1
+        time.sleep(self.latency)
+        return PaymentResponse(success=True, transaction_id="TX-BENCH-{}".format(next(self._ids)))
+
+
+def pay_one_by_one(client, items, email):
+    for item in items:
+        # The email bucket allows 5 payments a minute, so a larger family would be throttled here
+        cache.clear()
+        response = client.post("/api/payment", {**PARENT, **item, "email": email}, content_type="application/json")
+        assert response.status_code == 201, response.content
+
+
+def pay_with_checkout(client, items, email):
+    response = client.post("/api/checkout", {**PARENT, "email": email, "items": items},
+                           content_type="application/json")
+    assert response.status_code == 201, response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--children", type=int, default=3)
+    parser.add_argument("--trips", type=int, default=2)
+    parser.add_argument("--gateway-ms", type=float, default=1500)
+    args = parser.parse_args()
+    StubGateway.latency = args.gateway_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory, patch("backend.api.views.LegacyPaymentProcessor", StubGateway):
+        connections.settings["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+        connections["default"].close()
+        call_command("migrate", verbosity=0)
+        school = School.objects.create(name="Springfield Elementary")
+        trips = [FieldTrip.objects.create(location="Trip {}".format(index), cost=20,
+                                          date=timezone.now() + timedelta(days=30)) for index in range(args.trips)]
+        items = [
+            {"student_first_name": "Child {}".format(child), "student_last_name": "Simpson",
+             "school_id": str(school.id), "field_trip_id": str(trip.id)}
+            for child in range(args.children) for trip in trips
+        ]
+        client = Client(HTTP_HOST="localhost")
+
+        print("{} children x {} trips = {} registrations; gateway answers in {:g} ms".format(
+            args.children, args.trips, len(items), args.gateway_ms))
+        print("{:<32} {:>13} {:>12} {:>13}".format("payment", "gateway calls", "total (ms)", "transactions"))
+        for index, (name, pay) in enumerate([
+            ("POST /api/payment per item", pay_one_by_one),
+            ("POST /api/checkout", pay_with_checkout),
+        ]):
+            cache.clear()
+            StubGateway.calls = 0
+            transactions = Transaction.objects.count()
+            started = time.perf_counter()
+            # A different parent each time, so neither run finds the other's registrations paid
+            pay(client, items, "parent{}@example.com".format(index))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print("{:<32} {:>13} {:>12,.0f} {:>13}".format(
+                name, StubGateway.calls, elapsed_ms, Transaction.objects.count() - transactions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Field trip list benchmark: FieldTripSerializer + JSONRenderer vs the values_list projection + orjson.
+
+Fills a temporary SQLite database with `--trips` field trips and `--schools` schools, then times
+building the GET /api/fieldtrip body each way and checks the bodies are identical.
+
+Run from the backend folder:
+
+    python -m benchmarks.fieldtrip [--trips 10000] [--schools 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from backend.api.models.field_trip import FieldTrip  # noqa: E402
+from backend.api.models.school import School  # noqa: E402
+from backend.api.projections import field_trip_rows  # noqa: E402
+from backend.api.renderers import FastJSONRenderer, orjson  # noqa: E402
+from backend.api.serializers import FieldTripSerializer  # noqa: E402
+
+LOCATIONS = ["Museum", "Zoo", "Botanic Gardens", "Planetarium", "Aquarium", "Sky Tower", "Te Papa", "Farm"]
+
+
+def populate(trips, schools):
+    random.seed(7)
+    School.objects.bulk_create(School(name="School {}".format(index)) for index in range(schools))
+    start = timezone.now()
+    FieldTrip.objects.bulk_create(
+        FieldTrip(
+            location="{} {}".format(random.choice(LOCATIONS), index),
+            cost=round(random.uniform(5, 80), 2),
+            date=start + timedelta(days=random.randint(0, 365), seconds=random.randint(0, 86400)),
+        )
+        for index in range(trips)
+    )
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trips", type=int, default=10000)
+    parser.add_argument("--schools", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connections.settings["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+        connections["default"].close()
+        call_command("migrate", verbosity=0)
+        populate(args.trips, args.schools)
+
+        queryset = FieldTrip.objects.all()
+        variants = [
+            ("FieldTripSerializer + JSONRenderer",
+             lambda: JSONRenderer().render(FieldTripSerializer(queryset, many=True).data)),
+            ("values_list projection + JSONRenderer",
+             lambda: JSONRenderer().render(field_trip_rows(queryset))),
+            ("values_list projection + orjson",
+             lambda: FastJSONRenderer().render(field_trip_rows(queryset))),
+        ]
+
+        print("{:,} trips, {} schools, orjson {}".format(
+            args.trips, args.schools, "installed" if orjson else "not installed"))
+        print("{:<40} {:>12} {:>10}".format("path", "median (ms)", "speedup"))
+        baseline_ms, baseline_body = None, None
+        for name, build in variants:
+            elapsed_ms, body = timed(build, args.repeat)
+            if baseline_body is None:
+                baseline_ms, baseline_body = elapsed_ms, body
+            assert body == baseline_body, "{} differs from FieldTripSerializer".format(name)
+            print("{:<40} {:>12.1f} {:>9.1f}x".format(name, elapsed_ms, baseline_ms / elapsed_ms))
+        print("body: {:,} bytes, identical across paths".format(len(baseline_body)))
+
+
+if __name__ == "__main__":
+    main()
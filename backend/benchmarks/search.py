@@ -0,0 +1,99 @@
+"""
+Student/parent search benchmark over a synthetic roster.
+
+Builds a roster of `--rows` people in a temporary SQLite file, indexes it the way
+backend.api.search does (FTS5 trigram table keyed by rowid) and compares query latency
+against the `icontains` scans the ORM would otherwise run.
+
+Run from the backend folder:
+
+    python -m benchmarks.search [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from backend.api.search import (  # noqa: E402
+    FUZZY_MIN_OVERLAP, SQLITE_CREATE_TABLE, SQLITE_EXACT_SEARCH, SQLITE_FUZZY_SEARCH, SQLITE_TABLE, fts_exact_query,
+    fts_fuzzy_query, query_terms, trigram_overlap, trigrams,
+)
+
+FIRST_NAMES = ["Bart", "Lisa", "Maggie", "Homer", "Marge", "Ned", "Rod", "Todd", "Milhouse", "Nelson", "Ralph",
+               "Martin", "Sherri", "Terri", "Jimbo", "Kearney", "Dolph", "Wendell", "Lewis", "Janey", "Allison"]
+LAST_NAMES = ["Simpson", "Flanders", "Van Houten", "Muntz", "Wiggum", "Prince", "Jones", "Powell", "Taylor",
+              "Zzyzwicz", "Kwan", "Szyslak", "Gumble", "Hibbert", "Lovejoy", "Krabappel", "Skinner", "Frink"]
+
+QUERIES = ["bart simpson", "wiggum", "todd krabappel417", "nelson frink9", "bart simpsno", "todd krabapel417"]
+
+
+def build(path, rows):
+    random.seed(7)
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE person (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT)")
+    connection.executemany("INSERT INTO person VALUES (?, ?, ?)", (
+        (index, random.choice(FIRST_NAMES), "{}{}".format(random.choice(LAST_NAMES), random.randint(0, 999)))
+        for index in range(1, rows + 1)
+    ))
+    started = time.perf_counter()
+    connection.execute(SQLITE_CREATE_TABLE)
+    connection.execute("INSERT INTO api_person_search(rowid, name, email) "
+                       "SELECT id * 2, first_name || ' ' || last_name, '' FROM person")
+    connection.commit()
+    return connection, time.perf_counter() - started
+
+
+def timed(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def like_scan(connection, query):
+    terms = query_terms(query)
+    where = " AND ".join("(first_name || ' ' || last_name) LIKE ?" for _ in terms)
+    return connection.execute("SELECT id FROM person WHERE {} LIMIT 20".format(where),
+                              ["%{}%".format(term) for term in terms]).fetchall()
+
+
+def fts(connection, query):
+    terms = query_terms(query)
+    exact_sql = SQLITE_EXACT_SEARCH.format(table=SQLITE_TABLE, kind_filter="").replace("%s", "?")
+    rows = connection.execute(exact_sql, [fts_exact_query(terms), 20]).fetchall()
+    if not rows:
+        query_trigrams = {trigram for term in terms for trigram in trigrams(term)}
+        fuzzy_sql = SQLITE_FUZZY_SEARCH.format(table=SQLITE_TABLE, kind_filter="").replace("%s", "?")
+        rows = [row for row in connection.execute(fuzzy_sql, [fts_fuzzy_query(terms), 20]).fetchall()
+                if trigram_overlap(query_trigrams, row[1], row[2]) >= FUZZY_MIN_OVERLAP]
+    return rows[:20]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection, build_time = build(os.path.join(directory, "roster.sqlite3"), args.rows)
+        print("{:,} rows, FTS5 trigram index built in {:.1f}s".format(args.rows, build_time))
+        print("{:<20} {:>16} {:>8} {:>16} {:>8}".format("query", "icontains (ms)", "hits", "index (ms)", "hits"))
+        for query in QUERIES:
+            like_ms, like_rows = timed(lambda: like_scan(connection, query))
+            fts_ms, fts_rows = timed(lambda: fts(connection, query))
+            print("{:<20} {:>16.2f} {:>8} {:>16.2f} {:>8}".format(
+                query, like_ms, len(like_rows), fts_ms, len(fts_rows)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cold-start benchmark for API workers: full settings vs the API-only profile.
+
+For each settings module it starts fresh interpreters and reports
+  - import time: total of `python -X importtime` for loading the WSGI app and URLconf
+  - first response: importing the WSGI app through the first `GET /api/fieldtrip` response
+  - RSS: peak resident set size of the worker after that response
+
+It then breaks down what importing `backend.api.views` costs once Django is set up: the modules
+views.py is the first to import, split into project modules (the gateway client, receipts, events,
+...) and the rest (mostly DRF). This is why views.py imports them eagerly: deferring the project
+modules would save a few milliseconds per worker, once.
+
+Run from the backend folder:
+
+    python -m benchmarks.startup [--runs 5]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = ["backend.settings", "backend.settings_api"]
+
+WORKER = textwrap.dedent("""
+    import time
+    started = time.perf_counter()
+    import io, resource, sys
+    from backend.wsgi import application
+    statuses = []
+    body = application({
+        "REQUEST_METHOD": "GET", "PATH_INFO": "/api/fieldtrip", "QUERY_STRING": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "8000", "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": "localhost", "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+        "wsgi.url_scheme": "http", "wsgi.multithread": False, "wsgi.multiprocess": True,
+        "wsgi.run_once": False, "wsgi.version": (1, 0),
+    }, lambda status, headers: statuses.append(status))
+    b"".join(body)
+    assert statuses[0].startswith("200"), statuses
+    elapsed = time.perf_counter() - started
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+""")
+
+IMPORTS = "import backend.wsgi, django.urls; django.urls.get_resolver().url_patterns"
+
+VIEWS_MARKER = "-- views --"
+
+VIEWS_IMPORT = (
+    "import sys, django; django.setup(); sys.stderr.write({!r} + '\\n'); import backend.api.views".format(VIEWS_MARKER)
+)
+
+
+def write_settings(directory, profile, database):
+    name = "bench_" + profile.replace(".", "_")
+    Path(directory, name + ".py").write_text(
+        "from {} import *\n"
+        "DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {!r}}}}}\n"
+        "DATABASE_REPLICAS = []\n"
+        "ALLOWED_HOSTS = ['localhost']\n".format(profile, database)
+    )
+    return name
+
+
+def run(code, settings_module, directory, *flags):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module,
+               PYTHONPATH=os.pathsep.join([directory, str(BACKEND_DIR)]))
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_time_us(settings_module, directory):
+    stderr = run(IMPORTS, settings_module, directory, "-X", "importtime").stderr
+    return sum(int(match) for match in re.findall(r"^import time:\s+(\d+) \|", stderr, re.MULTILINE))
+
+
+def views_import_us(settings_module, directory):
+    """
+    `(total, project modules, gateway client)` microseconds of importing views.py after django.setup()
+    """
+    stderr = run(VIEWS_IMPORT, settings_module, directory, "-X", "importtime").stderr
+    lines = re.findall(r"^import time:\s+(\d+) \|\s+\d+ \| (\s*)(\S+)$", stderr.split(VIEWS_MARKER, 1)[1],
+                       re.MULTILINE)
+    total = sum(int(self_us) for self_us, _, _ in lines)
+    project = sum(int(self_us) for self_us, _, name in lines
+                  if name.startswith("backend.") and name != "backend.api.views")
+    gateway = sum(int(self_us) for self_us, _, name in lines if name == "backend.legacy_api")
+    return total, project, gateway
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "bench.sqlite3")
+        modules = {profile: write_settings(directory, profile, database) for profile in PROFILES}
+        run("import django; django.setup(); from django.core.management import call_command; "
+            "call_command('migrate', verbosity=0)", modules["backend.settings"], directory)
+
+        print("{:<24} {:>14} {:>18} {:>12}".format("settings", "import (ms)", "first resp. (ms)", "RSS (MiB)"))
+        for profile, module in modules.items():
+            imports, responses, rss = [], [], []
+            for _ in range(args.runs):
+                imports.append(import_time_us(module, directory) / 1000)
+                elapsed, max_rss = run(WORKER, module, directory).stdout.split()
+                responses.append(float(elapsed) * 1000)
+                rss.append(int(max_rss) / 1024)
+            print("{:<24} {:>14.1f} {:>18.1f} {:>12.1f}".format(
+                profile, statistics.median(imports), statistics.median(responses), statistics.median(rss)))
+
+        print()
+        print("{:<24} {:>14} {:>18} {:>12}".format("views.py after setup", "total (ms)", "project mods (ms)",
+                                                   "gateway (ms)"))
+        for profile, module in modules.items():
+            runs = [views_import_us(module, directory) for _ in range(args.runs)]
+            print("{:<24} {:>14.1f} {:>18.1f} {:>12.1f}".format(
+                profile, *(statistics.median(run[index] for run in runs) / 1000 for index in range(3))))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ import userEvent from "@testing-library/user-event";
 import App from "./App";
 
 vi.mock("@/services/api", () => ({
-  fetchFieldTrips: vi.fn(),
+  fetchCatalogue: vi.fn(),
 }));
 
 // Mock child components to isolate App logic
@@ -22,7 +22,7 @@ vi.mock("@/components/RegistrationModal", () => ({
     open ? <div data-testid="registration-modal">Modal Open</div> : null,
 }));
 
-import { fetchFieldTrips } from "@/services/api";
+import { fetchCatalogue } from "@/services/api";
 
 const mockTrip = {
   id: "trip-1",
@@ -32,19 +32,21 @@ const mockTrip = {
   schools: [{ id: "s1", name: "Auckland School" }],
 };
 
+const config = { waiting_room: false, payment_events: false };
+
 beforeEach(() => {
   vi.clearAllMocks();
 });
 
 describe("App", () => {
   it("shows loading state initially", () => {
-    vi.mocked(fetchFieldTrips).mockReturnValue(new Promise(() => {}));
+    vi.mocked(fetchCatalogue).mockReturnValue(new Promise(() => {}));
     render(<App />);
     expect(screen.getByText("Loading field trip details...")).toBeInTheDocument();
   });
 
   it("shows field trip card on successful fetch", async () => {
-    vi.mocked(fetchFieldTrips).mockResolvedValue([mockTrip]);
+    vi.mocked(fetchCatalogue).mockResolvedValue({ fieldTrips: [mockTrip], config });
     render(<App />);
 
     await waitFor(() => {
@@ -54,7 +56,7 @@ describe("App", () => {
   });
 
   it("shows the School Trip heading on success", async () => {
-    vi.mocked(fetchFieldTrips).mockResolvedValue([mockTrip]);
+    vi.mocked(fetchCatalogue).mockResolvedValue({ fieldTrips: [mockTrip], config });
     render(<App />);
 
     await waitFor(() => {
@@ -63,7 +65,7 @@ describe("App", () => {
   });
 
   it("shows empty state when no trips returned", async () => {
-    vi.mocked(fetchFieldTrips).mockResolvedValue([]);
+    vi.mocked(fetchCatalogue).mockResolvedValue({ fieldTrips: [], config });
     render(<App />);
 
     await waitFor(() => {
@@ -74,7 +76,7 @@ describe("App", () => {
   });
 
   it("shows error message on fetch failure", async () => {
-    vi.mocked(fetchFieldTrips).mockRejectedValue(new Error("Network error"));
+    vi.mocked(fetchCatalogue).mockRejectedValue(new Error("Network error"));
     render(<App />);
 
     await waitFor(() => {
@@ -83,9 +85,9 @@ describe("App", () => {
   });
 
   it("shows Try Again button on error and retries on click", async () => {
-    vi.mocked(fetchFieldTrips)
+    vi.mocked(fetchCatalogue)
       .mockRejectedValueOnce(new Error("Failed"))
-      .mockResolvedValueOnce([mockTrip]);
+      .mockResolvedValueOnce({ fieldTrips: [mockTrip], config });
 
     render(<App />);
 
@@ -98,11 +100,11 @@ describe("App", () => {
     await waitFor(() => {
       expect(screen.getByTestId("field-trip-card")).toBeInTheDocument();
     });
-    expect(fetchFieldTrips).toHaveBeenCalledTimes(2);
+    expect(fetchCatalogue).toHaveBeenCalledTimes(2);
   });
 
   it("opens registration modal when Register is clicked", async () => {
-    vi.mocked(fetchFieldTrips).mockResolvedValue([mockTrip]);
+    vi.mocked(fetchCatalogue).mockResolvedValue({ fieldTrips: [mockTrip], config });
     render(<App />);
 
     await waitFor(() => {
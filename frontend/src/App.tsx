@@ -3,13 +3,13 @@ import { Loader2 } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { FieldTripCard } from "@/components/FieldTripCard";
 import { RegistrationModal } from "@/components/RegistrationModal";
-import { fetchFieldTrips } from "@/services/api";
-import type { FieldTrip } from "@/types";
+import { fetchCatalogue } from "@/services/api";
+import type { ClientConfig, FieldTrip } from "@/types";
 
 type PageState =
   | { status: "loading" }
   | { status: "error"; message: string }
-  | { status: "success"; fieldTrip: FieldTrip | null };
+  | { status: "success"; fieldTrip: FieldTrip | null; config: ClientConfig };
 
 function App() {
   const [pageState, setPageState] = useState<PageState>({ status: "loading" });
@@ -19,10 +19,14 @@ function App() {
   useEffect(() => {
     let cancelled = false;
 
-    fetchFieldTrips()
-      .then((trips) => {
+    fetchCatalogue()
+      .then(({ fieldTrips, config }) => {
         if (!cancelled) {
-          setPageState({ status: "success", fieldTrip: trips[0] ?? null });
+          setPageState({
+            status: "success",
+            fieldTrip: fieldTrips[0] ?? null,
+            config,
+          });
         }
       })
       .catch((err: Error) => {
@@ -72,6 +76,7 @@ function App() {
             open={modalOpen}
             onOpenChange={setModalOpen}
             fieldTrip={pageState.fieldTrip}
+            paymentEvents={pageState.config.payment_events}
           />
         </>
       )}
@@ -23,6 +23,21 @@ describe("PaymentResult", () => {
       expect(screen.getByText(/\$20\.00/)).toBeInTheDocument();
     });
 
+    it("links to the receipt when there is one", () => {
+      const receiptUrl = "/api/receipts/TX-1?email=a%40b.c";
+      const { rerender } = render(
+        <PaymentResult {...baseProps} success={true} receiptUrl={receiptUrl} />,
+      );
+      expect(
+        screen.getByRole("link", { name: /download receipt/i }),
+      ).toHaveAttribute("href", receiptUrl);
+
+      rerender(<PaymentResult {...baseProps} success={true} />);
+      expect(
+        screen.queryByRole("link", { name: /download receipt/i }),
+      ).not.toBeInTheDocument();
+    });
+
     it("shows Done button that calls onClose", async () => {
       const onClose = vi.fn();
       render(<PaymentResult {...baseProps} success={true} onClose={onClose} />);
@@ -6,6 +6,7 @@ interface PaymentResultProps {
   tripLocation: string;
   amount: number;
   errorMessage?: string;
+  receiptUrl?: string;
   onClose: () => void;
   onRetry: () => void;
 }
@@ -15,6 +16,7 @@ export function PaymentResult({
   tripLocation,
   amount,
   errorMessage,
+  receiptUrl,
   onClose,
   onRetry,
 }: PaymentResultProps) {
@@ -32,6 +34,11 @@ export function PaymentResult({
           Your registration for <strong>{tripLocation}</strong> has been
           confirmed. Amount paid: <strong>{formattedAmount}</strong>.
         </p>
+        {receiptUrl && (
+          <a className="text-sm underline" href={receiptUrl} download>
+            Download receipt
+          </a>
+        )}
         <Button className="w-full sm:w-auto" onClick={onClose}>
           Done
         </Button>
@@ -18,21 +18,39 @@ import {
   SelectTrigger,
   SelectValue,
 } from "@/components/ui/select";
-import { submitPayment } from "@/services/api";
+import { API_ENDPOINTS } from "@/config";
+import {
+  createPaymentReference,
+  enterWaitingRoom,
+  submitPayment,
+  watchPaymentStatus,
+} from "@/services/api";
 import {
   validateField,
   validatePaymentForm,
   hasErrors,
 } from "@/lib/validation";
-import type { FieldTrip, PaymentRequest, FormErrors } from "@/types";
+import type {
+  FieldTrip,
+  PaymentRequest,
+  PaymentState,
+  FormErrors,
+} from "@/types";
 import { PaymentResult } from "@/components/PaymentResult";
 
 interface RegistrationModalProps {
   open: boolean;
   onOpenChange: (open: boolean) => void;
   fieldTrip: FieldTrip;
+  // Whether the server streams payment states; without it the POST response is all we wait for
+  paymentEvents: boolean;
 }
 
+const PAYMENT_STATE_LABELS: Partial<Record<PaymentState, string>> = {
+  received: "Payment received...",
+  processing: "Contacting your bank...",
+};
+
 function createEmptyForm(fieldTrip: FieldTrip): PaymentRequest {
   return {
     parent_first_name: "",
@@ -52,15 +70,23 @@ export function RegistrationModal({
   open,
   onOpenChange,
   fieldTrip,
+  paymentEvents,
 }: RegistrationModalProps) {
   const [form, setForm] = useState<PaymentRequest>(() =>
     createEmptyForm(fieldTrip),
   );
   const [errors, setErrors] = useState<FormErrors>({});
   const [submitting, setSubmitting] = useState(false);
+  const [paymentState, setPaymentState] = useState<PaymentState | null>(null);
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
+  // An admitted ticket is only used up by a payment that goes through, so retries keep it
+  const [waitingRoomTicket, setWaitingRoomTicket] = useState<string | null>(
+    null,
+  );
   const [paymentResult, setPaymentResult] = useState<{
     success: boolean;
     errorMessage?: string;
+    receiptUrl?: string;
   } | null>(null);
 
   function handleChange(field: keyof PaymentRequest, value: string) {
@@ -85,11 +111,29 @@ export function RegistrationModal({
     if (hasErrors(formErrors)) return;
 
     setSubmitting(true);
-    const result = await submitPayment(form);
+    const ticket =
+      waitingRoomTicket ?? (await enterWaitingRoom(setQueuePosition));
+    setQueuePosition(null);
+    let payment: PaymentRequest = form;
+    let stopWatching = () => {};
+    if (paymentEvents) {
+      const reference = createPaymentReference();
+      payment = { ...form, payment_reference: reference };
+      stopWatching = watchPaymentStatus(reference, (event) =>
+        setPaymentState(event.state),
+      );
+    }
+    const result = await submitPayment(payment, ticket);
+    stopWatching();
+    setWaitingRoomTicket(result.success || result.status === 429 ? null : ticket);
     setSubmitting(false);
+    setPaymentState(null);
 
     if (result.success) {
-      setPaymentResult({ success: true });
+      setPaymentResult({
+        success: true,
+        receiptUrl: API_ENDPOINTS.receipt(result.data.id, form.email),
+      });
     } else {
       setPaymentResult({ success: false, errorMessage: result.message });
     }
@@ -104,6 +148,8 @@ export function RegistrationModal({
     setErrors({});
     setPaymentResult(null);
     setSubmitting(false);
+    setPaymentState(null);
+    setQueuePosition(null);
     onOpenChange(false);
   }
 
@@ -121,6 +167,7 @@ export function RegistrationModal({
             tripLocation={fieldTrip.location}
             amount={fieldTrip.cost}
             errorMessage={paymentResult.errorMessage}
+            receiptUrl={paymentResult.receiptUrl}
             onClose={handleClose}
             onRetry={handleRetry}
           />
@@ -289,7 +336,12 @@ export function RegistrationModal({
             </Button>
             <Button type="submit" disabled={submitting} aria-busy={submitting}>
               {submitting && <Loader2 className="mr-2 h-4 w-4 animate-spin" />}
-              {submitting ? "Processing..." : `Pay ${formattedCost}`}
+              {!submitting
+                ? `Pay ${formattedCost}`
+                : queuePosition !== null
+                  ? `Number ${queuePosition} in line...`
+                  : ((paymentState && PAYMENT_STATE_LABELS[paymentState]) ??
+                    "Processing...")}
             </Button>
           </DialogFooter>
         </form>
@@ -10,8 +10,16 @@ describe("API_ENDPOINTS", () => {
 
     const { API_ENDPOINTS } = await import("./config");
 
+    expect(API_ENDPOINTS.bootstrap).toBe("http://localhost:3000/api/bootstrap");
     expect(API_ENDPOINTS.fieldTrips).toBe("http://localhost:3000/api/fieldtrip");
     expect(API_ENDPOINTS.payment).toBe("http://localhost:3000/api/payment");
+    expect(API_ENDPOINTS.checkout).toBe("http://localhost:3000/api/checkout");
+    expect(API_ENDPOINTS.paymentEvents("abc")).toBe(
+      "http://localhost:3000/api/payment/abc/events",
+    );
+    expect(API_ENDPOINTS.receipt("TX-1", "jane+kids@example.com")).toBe(
+      "http://localhost:3000/api/receipts/TX-1?email=jane%2Bkids%40example.com",
+    );
 
     vi.unstubAllEnvs();
   });
@@ -21,6 +29,7 @@ describe("API_ENDPOINTS", () => {
 
     const { API_ENDPOINTS } = await import("./config");
 
+    expect(API_ENDPOINTS.bootstrap).toBe("/api/bootstrap");
     expect(API_ENDPOINTS.fieldTrips).toBe("/api/fieldtrip");
     expect(API_ENDPOINTS.payment).toBe("/api/payment");
 
@@ -1,6 +1,13 @@
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL ?? "";
 
 export const API_ENDPOINTS = {
+  bootstrap: `${API_BASE_URL}/api/bootstrap`,
   fieldTrips: `${API_BASE_URL}/api/fieldtrip`,
+  waitingRoom: `${API_BASE_URL}/api/waiting-room`,
   payment: `${API_BASE_URL}/api/payment`,
+  checkout: `${API_BASE_URL}/api/checkout`,
+  paymentEvents: (reference: string) =>
+    `${API_BASE_URL}/api/payment/${reference}/events`,
+  receipt: (transactionId: string, email: string) =>
+    `${API_BASE_URL}/api/receipts/${encodeURIComponent(transactionId)}?email=${encodeURIComponent(email)}`,
 } as const;
@@ -1,6 +1,12 @@
 import { describe, it, expect, vi, beforeEach, afterEach } from "vitest";
-import { fetchFieldTrips, submitPayment } from "./api";
-import type { PaymentRequest } from "@/types";
+import {
+  enterWaitingRoom,
+  fetchCatalogue,
+  submitCheckout,
+  submitPayment,
+  watchPaymentStatus,
+} from "./api";
+import type { CheckoutRequest, PaymentRequest } from "@/types";
 
 const mockPaymentRequest: PaymentRequest = {
   parent_first_name: "Jane",
@@ -23,16 +29,28 @@ afterEach(() => {
   vi.restoreAllMocks();
 });
 
-describe("fetchFieldTrips", () => {
-  it("returns field trips on success", async () => {
-    const trips = [{ id: "1", location: "Zoo", cost: 20, date: "2026-10-10T00:00:00Z", schools: [] }];
+describe("fetchCatalogue", () => {
+  it("attaches the shared school list to every trip", async () => {
+    const schools = [{ id: "s1", name: "Auckland School" }];
+    const bootstrap = {
+      version: "abc",
+      schools,
+      field_trips: [{ id: "1", location: "Zoo", cost: 20, date: "2026-10-10T00:00:00Z" }],
+      config: { waiting_room: false, payment_events: true },
+    };
     vi.mocked(fetch).mockResolvedValue({
       ok: true,
-      json: () => Promise.resolve(trips),
+      json: () => Promise.resolve(bootstrap),
     } as Response);
 
-    const result = await fetchFieldTrips();
-    expect(result).toEqual(trips);
+    const result = await fetchCatalogue();
+    expect(fetch).toHaveBeenCalledWith(expect.stringMatching(/\/api\/bootstrap$/));
+    expect(result).toEqual({
+      fieldTrips: [
+        { id: "1", location: "Zoo", cost: 20, date: "2026-10-10T00:00:00Z", schools },
+      ],
+      config: { waiting_room: false, payment_events: true },
+    });
   });
 
   it("throws on non-ok response", async () => {
@@ -41,7 +59,7 @@ describe("fetchFieldTrips", () => {
       status: 500,
     } as Response);
 
-    await expect(fetchFieldTrips()).rejects.toThrow(
+    await expect(fetchCatalogue()).rejects.toThrow(
       "Failed to load field trip information. Please try again.",
     );
   });
@@ -105,6 +123,30 @@ describe("submitPayment", () => {
     }
   });
 
+  it("returns the existing transaction when already paid", async () => {
+    const transaction = { id: "TX-1", date: "2026-01-01", amount: "20.00", student: 1, activity: "trip-1" };
+    vi.mocked(fetch).mockResolvedValue({
+      status: 409,
+      json: () => Promise.resolve({ detail: "Already paid.", transaction }),
+    } as unknown as Response);
+
+    const result = await submitPayment(mockPaymentRequest);
+    expect(result).toEqual({ success: true, data: transaction });
+  });
+
+  it("returns the conflict message when a payment is in progress", async () => {
+    vi.mocked(fetch).mockResolvedValue({
+      status: 409,
+      json: () => Promise.resolve({ detail: "A payment for this registration is already in progress." }),
+    } as unknown as Response);
+
+    const result = await submitPayment(mockPaymentRequest);
+    expect(result).toEqual({
+      success: false,
+      message: "A payment for this registration is already in progress.",
+    });
+  });
+
   it("returns generic error on other status codes", async () => {
     vi.mocked(fetch).mockResolvedValue({
       status: 500,
@@ -127,3 +169,167 @@ describe("submitPayment", () => {
     });
   });
 });
+
+describe("submitCheckout", () => {
+  const checkout: CheckoutRequest = {
+    parent_first_name: "Jane",
+    parent_last_name: "Doe",
+    email: "jane@example.com",
+    card_number: "1234567890123456",
+    expiry_date: "12/25",
+    cvv: "123",
+    items: [
+      { student_first_name: "Alice", student_last_name: "Doe", school_id: "school-1", field_trip_id: "trip-1" },
+      { student_first_name: "Bob", student_last_name: "Doe", school_id: "school-1", field_trip_id: "trip-1" },
+    ],
+  };
+
+  it("posts the cart and returns the transaction with its line items", async () => {
+    const transaction = {
+      id: "TX-1",
+      date: "2026-01-01",
+      amount: "40.00",
+      line_items: [
+        { id: 1, student: 1, field_trip: "trip-1", amount: "20.00" },
+        { id: 2, student: 2, field_trip: "trip-1", amount: "20.00" },
+      ],
+    };
+    vi.mocked(fetch).mockResolvedValue({
+      status: 201,
+      json: () => Promise.resolve(transaction),
+    } as unknown as Response);
+
+    const result = await submitCheckout(checkout);
+    expect(fetch).toHaveBeenCalledWith(
+      expect.stringMatching(/\/api\/checkout$/),
+      expect.objectContaining({ method: "POST", body: JSON.stringify(checkout) }),
+    );
+    expect(result).toEqual({ success: true, data: transaction });
+  });
+
+  it("returns the first error of an invalid item", async () => {
+    const errors = { items: [{}, { field_trip_id: ["Field trip does not exist"] }] };
+    vi.mocked(fetch).mockResolvedValue({
+      status: 400,
+      json: () => Promise.resolve(errors),
+    } as unknown as Response);
+
+    const result = await submitCheckout(checkout);
+    expect(result).toEqual({ success: false, errors, message: "Field trip does not exist" });
+  });
+
+  it("returns the conflict message when items are already paid", async () => {
+    vi.mocked(fetch).mockResolvedValue({
+      status: 409,
+      json: () =>
+        Promise.resolve({
+          detail: "Some of these registrations have already been paid for.",
+          transaction_ids: { 1: "TX-1" },
+        }),
+    } as unknown as Response);
+
+    const result = await submitCheckout(checkout);
+    expect(result).toEqual({
+      success: false,
+      message: "Some of these registrations have already been paid for.",
+    });
+  });
+});
+
+describe("watchPaymentStatus", () => {
+  class MockEventSource {
+    static instances: MockEventSource[] = [];
+    onmessage: ((message: MessageEvent<string>) => void) | null = null;
+    close = vi.fn();
+
+    constructor(public url: string) {
+      MockEventSource.instances.push(this);
+    }
+
+    emit(data: object) {
+      this.onmessage?.({ data: JSON.stringify(data) } as MessageEvent<string>);
+    }
+  }
+
+  beforeEach(() => {
+    MockEventSource.instances = [];
+    vi.stubGlobal("EventSource", MockEventSource);
+  });
+
+  it("reports each state and closes once the payment succeeds", () => {
+    const onEvent = vi.fn();
+    watchPaymentStatus("ref-1", onEvent);
+    const source = MockEventSource.instances[0];
+
+    expect(source.url).toBe("/api/payment/ref-1/events");
+    source.emit({ reference: "ref-1", state: "processing" });
+    expect(source.close).not.toHaveBeenCalled();
+    source.emit({ reference: "ref-1", state: "succeeded", transaction_id: "TX-1" });
+
+    expect(onEvent).toHaveBeenLastCalledWith({
+      reference: "ref-1",
+      state: "succeeded",
+      transaction_id: "TX-1",
+    });
+    expect(source.close).toHaveBeenCalled();
+  });
+
+  it("closes the stream when the caller stops watching", () => {
+    const stop = watchPaymentStatus("ref-2", vi.fn());
+    stop();
+    expect(MockEventSource.instances[0].close).toHaveBeenCalled();
+  });
+});
+
+describe("enterWaitingRoom", () => {
+  function ticketResponse(position: number, admitted: boolean) {
+    return {
+      ok: true,
+      json: () =>
+        Promise.resolve({ ticket: "t-1", position, admitted, retry_after: position }),
+    } as Response;
+  }
+
+  it("returns the ticket at once when admitted", async () => {
+    vi.mocked(fetch).mockResolvedValue(ticketResponse(0, true));
+    await expect(enterWaitingRoom()).resolves.toBe("t-1");
+    expect(fetch).toHaveBeenCalledTimes(1);
+  });
+
+  it("polls with the ticket until admitted, reporting the position", async () => {
+    vi.useFakeTimers();
+    vi.mocked(fetch)
+      .mockResolvedValueOnce(ticketResponse(2, false))
+      .mockResolvedValueOnce(ticketResponse(0, true));
+    const onPosition = vi.fn();
+
+    const entered = enterWaitingRoom(onPosition);
+    await vi.runAllTimersAsync();
+
+    await expect(entered).resolves.toBe("t-1");
+    expect(onPosition).toHaveBeenCalledWith(2);
+    expect(fetch).toHaveBeenLastCalledWith("/api/waiting-room", {
+      headers: { "X-Waiting-Room-Ticket": "t-1" },
+    });
+    vi.useRealTimers();
+  });
+
+  it("returns null when the room cannot be reached", async () => {
+    vi.mocked(fetch).mockRejectedValue(new Error("offline"));
+    await expect(enterWaitingRoom()).resolves.toBeNull();
+  });
+
+  it("sends the ticket with the payment", async () => {
+    vi.mocked(fetch).mockResolvedValue({
+      status: 201,
+      json: () => Promise.resolve({}),
+    } as unknown as Response);
+    await submitPayment(mockPaymentRequest, "t-1");
+    expect(fetch).toHaveBeenCalledWith(
+      "/api/payment",
+      expect.objectContaining({
+        headers: { "Content-Type": "application/json", "X-Waiting-Room-Ticket": "t-1" },
+      }),
+    );
+  });
+});
@@ -1,29 +1,108 @@
 import { API_ENDPOINTS } from "@/config";
-import type { FieldTrip, PaymentRequest, PaymentResponse, ApiError } from "@/types";
+import type {
+  Bootstrap,
+  Catalogue,
+  CheckoutRequest,
+  CheckoutResponse,
+  PaymentRequest,
+  PaymentResponse,
+  PaymentEvent,
+  WaitingRoomTicket,
+  ApiError,
+} from "@/types";
 
-export async function fetchFieldTrips(): Promise<FieldTrip[]> {
-  const response = await fetch(API_ENDPOINTS.fieldTrips);
+const WAITING_ROOM_HEADER = "X-Waiting-Room-Ticket";
+
+export async function fetchBootstrap(): Promise<Bootstrap> {
+  const response = await fetch(API_ENDPOINTS.bootstrap);
 
   if (!response.ok) {
     throw new Error("Failed to load field trip information. Please try again.");
   }
 
-  return response.json() as Promise<FieldTrip[]>;
+  return response.json() as Promise<Bootstrap>;
+}
+
+// Every school can join every trip, so each trip shares the one school list from the bootstrap
+export async function fetchCatalogue(): Promise<Catalogue> {
+  const { field_trips, schools, config } = await fetchBootstrap();
+  return {
+    fieldTrips: field_trips.map((trip) => ({ ...trip, schools })),
+    config,
+  };
 }
 
+// `status` is set when the server turned the request away (429), which includes rejecting its
+// waiting room ticket; any other failure leaves an admitted ticket usable for the retry
 export type PaymentResult =
   | { success: true; data: PaymentResponse }
-  | { success: false; errors?: ApiError; message: string };
+  | { success: false; errors?: ApiError; message: string; status?: number };
 
-export async function submitPayment(
-  data: PaymentRequest,
-): Promise<PaymentResult> {
+export type CheckoutResult =
+  | { success: true; data: CheckoutResponse }
+  | { success: false; errors?: ApiError; message: string; status?: number };
+
+// Takes a waiting room ticket and waits until it is admitted, which is immediate unless the
+// server is holding back a surge. Resolves to null if the room can't be reached, in which case
+// the payment is attempted without a ticket.
+export async function enterWaitingRoom(
+  onPosition?: (position: number) => void,
+): Promise<string | null> {
+  try {
+    let response = await fetch(API_ENDPOINTS.waitingRoom, { method: "POST" });
+    if (!response.ok) return null;
+    let ticket = (await response.json()) as WaitingRoomTicket;
+
+    while (!ticket.admitted) {
+      onPosition?.(ticket.position);
+      await new Promise((resolve) =>
+        setTimeout(resolve, Math.max(ticket.retry_after, 1) * 1000),
+      );
+      response = await fetch(API_ENDPOINTS.waitingRoom, {
+        headers: { [WAITING_ROOM_HEADER]: ticket.ticket },
+      });
+      if (!response.ok) return null;
+      ticket = (await response.json()) as WaitingRoomTicket;
+    }
+    return ticket.ticket;
+  } catch {
+    return null;
+  }
+}
+
+// The first message in a DRF error body, which nests per-item errors for checkouts
+function firstErrorMessage(errors: unknown): string | undefined {
+  if (typeof errors === "string") return errors;
+  const values = Array.isArray(errors)
+    ? errors
+    : errors && typeof errors === "object"
+      ? Object.values(errors)
+      : [];
+  for (const value of values) {
+    const message = firstErrorMessage(value);
+    if (message) return message;
+  }
+  return undefined;
+}
+
+async function postPayment<T>(
+  url: string,
+  data: object,
+  waitingRoomTicket?: string | null,
+): Promise<
+  | { success: true; data: T }
+  | { success: false; errors?: ApiError; message: string; status?: number }
+> {
   let response: Response;
+  const headers: Record<string, string> = { "Content-Type": "application/json" };
+  if (waitingRoomTicket) {
+    headers[WAITING_ROOM_HEADER] = waitingRoomTicket;
+  }
 
   try {
-    response = await fetch(API_ENDPOINTS.payment, {
+    response = await fetch(url, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers,
       body: JSON.stringify(data),
     });
   } catch {
@@ -34,17 +113,33 @@ export async function submitPayment(
   }
 
   if (response.status === 201) {
-    const responseData = (await response.json()) as PaymentResponse;
+    const responseData = (await response.json()) as T;
     return { success: true, data: responseData };
   }
 
+  if (response.status === 409) {
+    // Already paid (the existing transaction is returned) or another payment is in progress
+    const conflict = (await response.json()) as {
+      detail: string;
+      transaction?: T;
+    };
+    if (conflict.transaction) {
+      return { success: true, data: conflict.transaction };
+    }
+    return { success: false, message: conflict.detail };
+  }
+
+  if (response.status === 429) {
+    const throttled = (await response.json()) as { detail: string };
+    return { success: false, message: throttled.detail, status: 429 };
+  }
+
   if (response.status === 400) {
     const errors = (await response.json()) as ApiError;
-    const firstError = Object.values(errors).flat()[0];
     return {
       success: false,
       errors,
-      message: firstError ?? "Please check your information and try again.",
+      message: firstErrorMessage(errors) ?? "Please check your information and try again.",
     };
   }
 
@@ -53,3 +148,43 @@ export async function submitPayment(
     message: "Payment processing failed. Please try again.",
   };
 }
+
+export function submitPayment(
+  data: PaymentRequest,
+  waitingRoomTicket?: string | null,
+): Promise<PaymentResult> {
+  return postPayment<PaymentResponse>(API_ENDPOINTS.payment, data, waitingRoomTicket);
+}
+
+// Pays for every child and trip in the cart with one charge
+export function submitCheckout(
+  data: CheckoutRequest,
+  waitingRoomTicket?: string | null,
+): Promise<CheckoutResult> {
+  return postPayment<CheckoutResponse>(API_ENDPOINTS.checkout, data, waitingRoomTicket);
+}
+
+export function createPaymentReference(): string {
+  return crypto.randomUUID().replaceAll("-", "");
+}
+
+// Follows a payment's state over Server-Sent Events until it succeeds or fails.
+// Returns a function that stops listening.
+export function watchPaymentStatus(
+  reference: string,
+  onEvent: (event: PaymentEvent) => void,
+): () => void {
+  if (typeof EventSource === "undefined") {
+    return () => {};
+  }
+
+  const source = new EventSource(API_ENDPOINTS.paymentEvents(reference));
+  source.onmessage = (message: MessageEvent<string>) => {
+    const event = JSON.parse(message.data) as PaymentEvent;
+    onEvent(event);
+    if (event.state === "succeeded" || event.state === "failed") {
+      source.close();
+    }
+  };
+  return () => source.close();
+}
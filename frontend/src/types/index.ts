@@ -11,6 +11,25 @@ export interface FieldTrip {
   date: string;
 }
 
+export interface ClientConfig {
+  waiting_room: boolean;
+  // Follow payments over Server-Sent Events; off when the server can't hold streams open cheaply
+  payment_events: boolean;
+}
+
+// GET /api/bootstrap: the school list is sent once rather than inside every trip
+export interface Bootstrap {
+  version: string;
+  schools: School[];
+  field_trips: Omit<FieldTrip, "schools">[];
+  config: ClientConfig;
+}
+
+export interface Catalogue {
+  fieldTrips: FieldTrip[];
+  config: ClientConfig;
+}
+
 export interface PaymentRequest {
   student_first_name: string;
   student_last_name: string;
@@ -22,6 +41,7 @@ export interface PaymentRequest {
   card_number: string;
   expiry_date: string;
   cvv: string;
+  payment_reference?: string;
 }
 
 export interface PaymentResponse {
@@ -32,8 +52,52 @@ export interface PaymentResponse {
   activity: string;
 }
 
+// One child on one trip in a cart checkout
+export interface CheckoutItem {
+  student_first_name: string;
+  student_last_name: string;
+  school_id: string;
+  field_trip_id: string;
+}
+
+export type CheckoutRequest = Omit<
+  PaymentRequest,
+  "student_first_name" | "student_last_name" | "field_trip_id" | "school_id"
+> & { items: CheckoutItem[] };
+
+export interface CheckoutLineItem {
+  id: number;
+  student: number;
+  field_trip: string;
+  amount: string;
+}
+
+// POST /api/checkout: one transaction for the whole cart
+export interface CheckoutResponse {
+  id: string;
+  date: string;
+  amount: string;
+  line_items: CheckoutLineItem[];
+}
+
+export interface WaitingRoomTicket {
+  ticket: string;
+  position: number;
+  admitted: boolean;
+  retry_after: number;
+}
+
+export type PaymentState = "received" | "processing" | "succeeded" | "failed";
+
+export interface PaymentEvent {
+  reference: string;
+  state: PaymentState;
+  transaction_id?: string;
+  detail?: string;
+}
+
 export type ApiError = Record<string, string[]>;
 
 export type FormErrors = Partial<
-  Record<keyof Omit<PaymentRequest, "field_trip_id">, string>
+  Record<keyof Omit<PaymentRequest, "field_trip_id" | "payment_reference">, string>
 >;